@@ -1,25 +1,53 @@
 #
 # This contains the game currently known as "Exploratron". 
 #
+# Run it with --headless for a dedicated server: no window, no local player, and
+# pygame is not used at all (so it need not even be installed).
+#
+
+import sys
+HEADLESS = __name__ == '__main__' and "--headless" in sys.argv[1:]
 
-from pygame import init as pygame_init
-pygame_init() # Need to run this before some of the code that runs during imports
+if HEADLESS:
+    import images
+    images.disableMediaDecoding() # Need to do this before the imports below create any libraries
+else:
+    from pygame import init as pygame_init
+    pygame_init() # Need to run this before some of the code that runs during imports
 
 
 import objects
 from players import thePlayerCatalog, PlayerCatalogEntry
 from images import Region
-from display import PygameDisplay
+if not HEADLESS:
+    from display import PygameDisplay
 from events import EventList, KeyPressedEvent, KeyCode, QuitGameEvent, NewPlayerAddedEvent, ItemDroppedEvent, EquipItemEvent
 from exploranetworking import *
 from screenchanges import ScreenChanges, SetOfEverything
 from players import Player
-from clientdata import CellData, InventoryData
+from clientdata import InventoryData
 from mobile import EquipmentTypeCode
+from scheduler import TickScheduler
+from actionqueue import ActionQueue
 import rooms
 import time
 import random
-import itertools
+import asyncio
+
+
+# How many times per second the world can be updated (it is only updated when something
+# is due to happen).
+TICKS_PER_SECOND = 50
+# How many times per second the local display can be redrawn (it is only redrawn when
+# something may have changed, or at least once every MAX_TIME_BETWEEN_FRAMES seconds).
+FRAMES_PER_SECOND = 30
+MAX_TIME_BETWEEN_FRAMES = 1.0
+# How long (in milliseconds) the mobiles in a room keep acting after the last player has
+# left it. After that the room goes dormant: its mobiles are frozen (they don't move or
+# regen) until a player enters again.
+DEFAULT_ROOM_WARM_TIME = 30000
+# How often (in milliseconds) to look for rooms that should go dormant.
+DORMANCY_CHECK_INTERVAL = 1000
 
 
 # ========= Start of Classes for Game =========
@@ -29,19 +57,30 @@ import itertools
 
 class World:
     """Represents the entire world."""
-    def __init__(self):
+    def __init__(self, headless=False, roomWarmTime=DEFAULT_ROOM_WARM_TIME):
+        """If headless is True, this is a dedicated server with no local display; it
+        keeps running even when nobody is playing. roomWarmTime is how many milliseconds
+        a room stays active after the last player leaves it."""
+        self.headless = headless
+        self.roomWarmTime = roomWarmTime
         self.gameOver = False
         self.rooms = rooms.rooms
-        self.mobiles = [] # contains all active mobiles EXCEPT those of type Player
+        self.mobiles = [] # contains all active mobiles EXCEPT those of type Player (dormant ones are in room.dormantMobiles)
+        self.mobileActionQueue = ActionQueue() # all of self.mobiles, by when they can next act
+        self.playerActionQueue = ActionQueue() # the players that have an event queued, by when they can act
         self.players = []
         self.playerByPlayerId = {} # FIXME: Don't need map AND ALSO the list
         self.displayedPlayer = None
         self.playerCatalog = thePlayerCatalog
         self.timeOfNextRegen = 0
+        self.timeOfNextDormancyCheck = 0
+        self.timeRoomLastOccupied = {} # map of room -> the last time a player was seen in it
     def addMobiles(self, newMobiles):
         """Call this to add some new mobiles to the list of active
         mobiles."""
         self.mobiles.extend(newMobiles)
+        for mobile in newMobiles:
+            self.mobileActionQueue.add(mobile)
     def addPlayer(self, region, playerCatalogEntry):
         """Call this to add a new Player to the game at the specified location. The
         playerId of this new player must be unique. It returns the newly created Player."""
@@ -53,12 +92,23 @@ class World:
         self.playerByPlayerId[newPlayer.playerId] = newPlayer
         location = playerCatalogEntry.getLocation()
         startingRoom = self.rooms[location.roomNumber]
-        newPlayer.setLocation(startingRoom, location.coordinates)
-        startingRoom.cellAt(*location.coordinates).addThing(newPlayer)
+        startingRoom.placeMobile(newPlayer, location.coordinates)
+        self.playerEnteredRoom(startingRoom)
+        self.addMobiles(startingRoom.wakeDormantMobiles())
         return newPlayer
+    def playerEnteredRoom(self, room):
+        """Call this when a player enters room. It forgets when the room was last
+        occupied, so the next dormancy check counts it as occupied just then (even if
+        the player has left again by that time)."""
+        self.timeRoomLastOccupied.pop(room, None)
+    def removeMobile(self, mobile):
+        """Passed a mobile (not a player), removes it."""
+        self.mobiles.remove(mobile)
+        self.mobileActionQueue.remove(mobile)
     def removePlayer(self, player):
         """Passed a player, removes it."""
         self.players.remove(player)
+        self.playerActionQueue.remove(player)
         del self.playerByPlayerId[player.playerId]
     def getPlayer(self, playerId):
         """Passed a playerId, this returns the given player, or raises an exception if it isn't
@@ -80,6 +130,21 @@ class World:
 # ========= Start of Functions for Game =========
 
 
+def timeOfNextAction(world, eventList):
+    """Returns the time (in seconds, on the time.perf_counter() clock) when the next
+    thing is due to happen in the world: a mobile can act, a player with an action
+    waiting can act, or it is time to regen. If there are events waiting to be handled
+    that is right now."""
+    if not eventList.isEmpty():
+        return 0
+    nextTime = world.timeOfNextRegen
+    for actionQueue in [world.mobileActionQueue, world.playerActionQueue]:
+        queueTime = actionQueue.nextActionTime()
+        if queueTime is not None:
+            nextTime = min(nextTime, queueTime)
+    return nextTime / 1000
+
+
 def regenMobiles(world, currentTime):
     """Calls doRegen() on each mobile (so it can do things like
     healing) but only call if it has been 10 seconds since the last
@@ -90,13 +155,54 @@ def regenMobiles(world, currentTime):
             mobile.doRegen()
 
 
-def moveMobiles(world, currentTime, screenChanges):
-    """This function will cause all of the mobiles to move one step,
-    updating the world accordingly."""
+def putIdleRoomsToSleep(world, currentTime):
+    """Checks (but not more than once every DORMANCY_CHECK_INTERVAL) for active mobiles
+    in rooms that no player has been in for world.roomWarmTime, and makes them dormant:
+    they are taken out of world.mobiles and put in their room's dormantMobiles, where
+    they stay frozen until a player enters the room again."""
+    if currentTime < world.timeOfNextDormancyCheck:
+        return
+    world.timeOfNextDormancyCheck = currentTime + DORMANCY_CHECK_INTERVAL
+    for player in world.players:
+        world.timeRoomLastOccupied[player.room] = currentTime
+    stillActive = []
     for mobile in world.mobiles:
-        if currentTime >= mobile.whenItCanAct:
+        # a room with no time recorded has been entered since the last check
+        lastOccupied = world.timeRoomLastOccupied.setdefault(mobile.room, currentTime)
+        if currentTime - lastOccupied > world.roomWarmTime:
+            mobile.room.dormantMobiles.append(mobile)
+            world.mobileActionQueue.remove(mobile)
+        else:
+            stillActive.append(mobile)
+    if len(stillActive) < len(world.mobiles):
+        world.mobiles = stillActive
+
+
+def moveMobiles(world, currentTime, screenChanges):
+    """This function will cause all of the mobiles that are able to act now
+    to move one step, updating the world accordingly."""
+    for mobile in world.mobileActionQueue.popDue(currentTime):
+        if not mobile.isDead:
             mobile.takeOneAction(currentTime, world, screenChanges)
-    
+            world.mobileActionQueue.add(mobile)
+
+
+def playerTakesAction(player, event, currentTime, world, screenChanges):
+    """Carries out an action event for a player who is able to act."""
+    if isinstance(event, KeyPressedEvent):
+        if event.keyCode == KeyCode.GO_DOWN:
+            player.moveSouth(currentTime, world, screenChanges)
+        elif event.keyCode == KeyCode.GO_UP:
+            player.moveNorth(currentTime, world, screenChanges)
+        elif event.keyCode == KeyCode.GO_RIGHT:
+            player.moveEast(currentTime, world, screenChanges)
+        elif event.keyCode == KeyCode.GO_LEFT:
+            player.moveWest(currentTime, world, screenChanges)
+        elif event.keyCode == KeyCode.CAST:
+            player.cast(currentTime, world, screenChanges)
+        elif event.keyCode == KeyCode.PICK_UP:
+            player.pickUpItem(currentTime, world, screenChanges)
+
 
 
 
@@ -116,7 +222,9 @@ def updateWorld(world, region, eventList, screenChanges, uiState):
             event.clientConnection.send(message)
             # FIXME: Should probably update screenChanges
         elif isinstance(event, KeyPressedEvent):
-            if event.keyCode == KeyCode.MOVE_UI_UP:
+            if uiState is None:
+                pass # headless, so there is no local UI for these keys to act on
+            elif event.keyCode == KeyCode.MOVE_UI_UP:
                 uiState.moveUINorth()
             elif event.keyCode == KeyCode.MOVE_UI_DOWN:
                 uiState.moveUISouth()
@@ -147,37 +255,24 @@ def updateWorld(world, region, eventList, screenChanges, uiState):
         else:
             raise Exception(f'Unexpected event: {event}')
     # Action Events
-    for player in world.players:
-        if not player.isDead:
+    for playerId, event in eventList.getActionEvents():
+        player = world.playerByPlayerId.get(playerId)
+        if player is not None and not player.isDead and player.queuedEvent is None:
             if currentTime < player.whenItCanAct:
-                # Player cannot act yet
-                if player.queuedEvent is None:
-                    # Player does not have an event queued
-                    player.queuedEvent = eventList.getFirstActionEvent(player.playerId)
+                # Player cannot act yet, so queue it up until they can
+                player.queuedEvent = event
+                world.playerActionQueue.add(player)
             else:
-                # Player can act now
-                eventToActOn = player.queuedEvent
-                # We used the value, so clear it
-                player.queuedEvent = None
-                if eventToActOn is None:
-                    # Set eventToActOn to the FIRST action event
-                    eventToActOn = eventList.getFirstActionEvent(player.playerId)
-                # Now we have set eventToActOn
-                if eventToActOn is not None:
-                    if isinstance(eventToActOn, KeyPressedEvent):
-                        if eventToActOn.keyCode == KeyCode.GO_DOWN:
-                            player.moveSouth(currentTime, world, screenChanges)
-                        elif eventToActOn.keyCode == KeyCode.GO_UP:
-                            player.moveNorth(currentTime, world, screenChanges)
-                        elif eventToActOn.keyCode == KeyCode.GO_RIGHT:
-                            player.moveEast(currentTime, world, screenChanges)
-                        elif eventToActOn.keyCode == KeyCode.GO_LEFT:
-                            player.moveWest(currentTime, world, screenChanges)
-                        elif eventToActOn.keyCode == KeyCode.CAST:
-                            player.cast(currentTime, world, screenChanges)
-                        elif eventToActOn.keyCode == KeyCode.PICK_UP:
-                            player.pickUpItem(currentTime, world, screenChanges)
+                playerTakesAction(player, event, currentTime, world, screenChanges)
+    for player in world.playerActionQueue.popDue(currentTime):
+        # Player can act now, and has an event queued
+        eventToActOn = player.queuedEvent
+        # We used the value, so clear it
+        player.queuedEvent = None
+        if not player.isDead:
+            playerTakesAction(player, eventToActOn, currentTime, world, screenChanges)
     # Move Mobiles
+    putIdleRoomsToSleep(world, currentTime)
     regenMobiles(world, currentTime)
     moveMobiles(world, currentTime, screenChanges)
     # Check for Death
@@ -187,21 +282,23 @@ def updateWorld(world, region, eventList, screenChanges, uiState):
             
 
 def handleDeath(world, screenChanges):
-    for mobile in itertools.chain(world.mobiles, world.players):
-        if mobile.isDead:
-            x, y = mobile.position
-            cell = mobile.room.cellAt(x, y)
-            for item in mobile.inventory:
-                mobile.dropItem(item, screenChanges)
-            cell.removeThing(mobile)
-            if mobile.isPlayer():
-                world.removePlayer(mobile)
-            else:
-                world.mobiles.remove(mobile)
-            screenChanges.changeCell(mobile.room, x, y)
+    for mobile in screenChanges.getDeadMobiles():
+        x, y = mobile.position
+        cell = mobile.room.cellAt(x, y)
+        for item in mobile.inventory:
+            mobile.dropItem(item, screenChanges)
+        cell.removeThing(mobile)
+        mobile.room.removeResident(mobile)
+        if mobile.isPlayer():
+            world.removePlayer(mobile)
+        else:
+            world.removeMobile(mobile)
+        screenChanges.changeCell(mobile.room, x, y)
 
 
 def handleGameOver(world):
+    if world.headless:
+        return # a dedicated server keeps running until it is stopped
     reasonToKeepPlaying = False
     for player in world.players:
         if len(player.clientConnections) > 0 or player.displayed:
@@ -245,25 +342,31 @@ def processClientMessages(world, clients, eventList):
         elif isinstance(message, EquipMessage):
             eventList.addEvent(EquipItemEvent(clientConnection.playerId, message.equipmentTypeCode, message.itemUniqueId))
         elif isinstance(message, ClientDisconnectingMessage):
-            player = world.getPlayer(clientConnection.playerId)
-            player.removeClient(clientConnection)
+            # (This is also how a client that stopped responding is reported, and it may
+            # never have been welcomed, or its player may have died.)
+            player = world.playerByPlayerId.get(clientConnection.playerId)
+            if player is not None and clientConnection in player.clientConnections:
+                player.removeClient(clientConnection)
         else:
             raise Exception(f"Message type not supported for message {message}.")
 
 
 def renderWorld(world, display, region, screenChanges, clients):
-    renderWorldLocal(world, display, region, screenChanges)
+    """Passes on the screenChanges from a tick. The local display isn't drawn here
+    (see drawWorldLocal()), since that happens at its own rate."""
+    if display is not None:
+        renderWorldLocal(world, display, region, screenChanges)
     renderWorldRemote(world, screenChanges, clients)
 
 
 def renderWorldLocal(world, display, region, screenChanges):
-    # --- draw the tiles ---
+    # --- switch rooms ---
     localRoomSwitches = screenChanges.getRoomSwitches(world.displayedPlayer)
     if localRoomSwitches is not None:
         oldRoom, newRoom = localRoomSwitches
-        display.uiState.newRoom(newRoom.gridData())
+        display.newRoom(newRoom.gridData())
+        display.prefetchImagesFor(newRoom.gridData(), region.imageLibrary)
     displayedRoom = world.displayedPlayer.room
-    display.show(displayedRoom.gridData(), region.imageLibrary)
     # --- start any sounds ---
     display.playSounds(screenChanges.getRoomSounds(displayedRoom), region.soundLibrary)
     # --- possibly a message ---
@@ -276,36 +379,56 @@ def renderWorldLocal(world, display, region, screenChanges):
     display.setVisibleData(VisibleData.fromEnvironment(world.displayedPlayer))
 
 
+def drawWorldLocal(world, display, region):
+    """Draws the local display."""
+    display.show(world.displayedPlayer.room.gridData(), region.imageLibrary)
+
+
+def roomUpdateMessage(room, screenChanges):
+    """Returns the message that tells clients already in the room what changed in it
+    this tick, or None if nothing did."""
+    roomChangeSet = screenChanges.getRoomChangeSet(room)
+    if isinstance(roomChangeSet, SetOfEverything):
+        return RefreshRoomMessage(room.gridData())
+    elif len(roomChangeSet) > 0:
+        gridData = room.gridData()
+        updates = [(x, y, gridData.cellAt(x, y)) for (x, y) in roomChangeSet]
+        return UpdateRoomMessage(GridDataChange(updates))
+    else:
+        return None
+
+
 def renderWorldRemote(world, screenChanges, clients):
+    # Everyone in a room gets the same messages about it, so each is built (and encoded) just
+    # once per tick. These are maps of room -> EncodedMessage (or None).
+    newRoomMessages = {}
+    roomUpdateMessages = {}
+    roomSoundMessages = {}
     for player in world.players:
         if len(player.clientConnections) > 0:
             # --- Send at most one message about drawing the tiles ---
             roomSwitch = screenChanges.getRoomSwitches(player)
             if roomSwitch is not None:
                 oldRoom, newRoom = roomSwitch
-                message = NewRoomMessage(newRoom.gridData())
+                if newRoom not in newRoomMessages:
+                    newRoomMessages[newRoom] = EncodedMessage(NewRoomMessage(newRoom.gridData()))
+                message = newRoomMessages[newRoom]
                 room = newRoom
             else:
                 room = player.room
-                roomChangeSet = screenChanges.getRoomChangeSet(room)
-                if isinstance(roomChangeSet, SetOfEverything):
-                    message = RefreshRoomMessage(room.gridData())
-                elif len(roomChangeSet) > 0:
-                    def cellDataFromCell(cell):
-                        """Given a cell, returns a CellData for it."""
-                        return CellData(tuple(thing.tileId for thing in cell.things))
-
-                    updates = [(x, y, cellDataFromCell(room.cellAt(x, y))) for (x, y) in roomChangeSet]
-                    message = UpdateRoomMessage(GridDataChange(updates))
-                else:
-                    message = None
+                if room not in roomUpdateMessages:
+                    message = roomUpdateMessage(room, screenChanges)
+                    roomUpdateMessages[room] = None if message is None else EncodedMessage(message)
+                message = roomUpdateMessages[room]
             if message is not None:
                 clients.sendMessageToPlayer(player.playerId, message)
 
             # --- Possibly a message about sounds ---
-            soundIds = screenChanges.getRoomSounds(room)
-            if soundIds:
-                soundMessage = PlaySoundsMessage(soundIds)
+            if room not in roomSoundMessages:
+                soundIds = screenChanges.getRoomSounds(room)
+                roomSoundMessages[room] = EncodedMessage(PlaySoundsMessage(soundIds)) if soundIds else None
+            soundMessage = roomSoundMessages[room]
+            if soundMessage is not None:
                 clients.sendMessageToPlayer(player.playerId, soundMessage)
 
             # --- Possibly some user messages ---
@@ -330,35 +453,76 @@ def renderWorldRemote(world, screenChanges, clients):
                     serversideClientConnection.visibleData = visibleData
 
 
-def mainLoop(world):
+async def mainLoop(world):
+    """Runs the game until it is over. The world is updated on a fixed schedule of
+    TICKS_PER_SECOND, but only when something is due to happen, and the local display
+    (if any) is drawn at up to FRAMES_PER_SECOND. In between, the loop sleeps until a
+    packet arrives (which is handled right away), something in the world can act, or a
+    frame is due."""
     screenChanges = ScreenChanges()
     eventList = EventList()
-    display = PygameDisplay()
+    display = None if world.headless else PygameDisplay()
+    uiState = None if display is None else display.uiState
     region = objects.defaultRegion
-    clients = ServersideClientConnections()
-    world.setDisplayedPlayer(world.players[0].playerId)
-    display.setDisplayedPlayerId(world.players[0])
-
-    while not world.gameOver:
-        eventList.clear()
-        screenChanges.clear()
-        eventList.addPygameEvents(display.getEvents(), world.displayedPlayer.playerId)
-        processClientMessages(world, clients, eventList)
-        updateWorld(world, region, eventList, screenChanges, display.uiState)        
-        renderWorld(world, display, region, screenChanges, clients)
-    display.quit()
-    clients.sendMessageToAll(ClientShouldExitMessage())
-    
+    clients = AsyncServersideClientConnections()
+    await clients.start()
+    if display is not None:
+        region.imageLibrary.convertForDisplay()
+        world.setDisplayedPlayer(world.players[0].playerId)
+        display.prefetchImagesFor(world.displayedPlayer.room.gridData(), region.imageLibrary)
+        display.setDisplayedPlayerId(world.players[0])
+
+    scheduler = TickScheduler(TICKS_PER_SECOND, None if display is None else FRAMES_PER_SECOND)
+    needsRedraw = True
+    timeOfLastFrame = 0
+    try:
+        while not world.gameOver:
+            processClientMessages(world, clients, eventList)
+            clients.flush()
+            currentTime = time.perf_counter()
+            if scheduler.isFrameDue(currentTime):
+                eventList.addPygameEvents(display.getEvents(), world.displayedPlayer.playerId)
+            nextActionTime = timeOfNextAction(world, eventList)
+            if scheduler.isTickDue(currentTime, nextActionTime):
+                screenChanges.clear()
+                updateWorld(world, region, eventList, screenChanges, uiState)
+                renderWorld(world, display, region, screenChanges, clients)
+                clients.flush()
+                eventList.clear()
+                scheduler.tickDone(currentTime, time.perf_counter())
+                needsRedraw = True
+                nextActionTime = timeOfNextAction(world, eventList)
+            if scheduler.isFrameDue(currentTime):
+                if needsRedraw or currentTime - timeOfLastFrame >= MAX_TIME_BETWEEN_FRAMES:
+                    drawWorldLocal(world, display, region)
+                    needsRedraw = False
+                    timeOfLastFrame = currentTime
+                scheduler.frameDone(time.perf_counter())
+            await clients.waitForPackets(scheduler.timeToWake(nextActionTime) - time.perf_counter())
+    finally:
+        if display is not None:
+            display.quit()
+        clients.sendMessageToAll(ClientShouldExitMessage())
+        clients.flush()
+        clients.close()
+        print(f"Encoded {clients.numEncodes} messages for clients, reusing an encoding {clients.numEncodesSaved} times.")
+        print(f"Scheduler: {scheduler.summary()}")
+
 
 
 # ========= End of Functions for Game =========
 
 # ========= Start of Run It All ==========
 
-world = World()
-playerCatalogEntry = random.choice(world.playerCatalog.entries)
-world.addPlayer(objects.defaultRegion, playerCatalogEntry)
-mainLoop(world)
+if __name__ == '__main__':
+    world = World(headless=HEADLESS)
+    if not world.headless:
+        playerCatalogEntry = random.choice(world.playerCatalog.entries)
+        world.addPlayer(objects.defaultRegion, playerCatalogEntry)
+    try:
+        asyncio.run(mainLoop(world))
+    except KeyboardInterrupt:
+        pass
 
 
 # ========= End of Run It All ==========
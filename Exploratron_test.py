@@ -0,0 +1,130 @@
+#
+# Unit tests for Exploratron using the pytest library
+#
+
+import pygame
+pygame.init()
+from Exploratron import *
+from gamecomponents import Room, Location
+from mobile import Mobile
+from brain import RandomBrain
+
+
+def makeWorld():
+    """Returns a World with two empty rooms, a player in room 0 and two mobiles in room 1."""
+    world = World(headless=True, roomWarmTime=5000)
+    world.rooms = [Room([[objects.Dirt()] * 3 for y in range(3)]) for roomNumber in range(2)]
+    for room in world.rooms:
+        room.hasBeenEntered = True
+    player = world.playerCatalog.getEntryById("0").getPlayer(objects.defaultRegion)
+    world.players.append(player)
+    world.playerByPlayerId[player.playerId] = player
+    world.rooms[0].placeMobile(player, (0, 0))
+    mobiles = []
+    for position in [(1, 1), (2, 2)]:
+        mobile = Mobile(objects.defaultRegion, 'angry-bee', "bee", 10, 0, RandomBrain)
+        world.rooms[1].placeMobile(mobile, position)
+        mobiles.append(mobile)
+    world.addMobiles(mobiles)
+    return world, player, mobiles
+
+
+def test_roomsWithoutPlayersGoDormant():
+    world, player, mobiles = makeWorld()
+    world.timeRoomLastOccupied[world.rooms[1]] = 0
+    putIdleRoomsToSleep(world, 4000)
+    assert world.mobiles == mobiles
+    putIdleRoomsToSleep(world, 4500)
+    assert world.mobiles == mobiles # not checked again so soon
+    putIdleRoomsToSleep(world, 6000)
+    assert world.mobiles == []
+    assert len(world.mobileActionQueue) == 0
+    assert world.rooms[1].dormantMobiles == mobiles
+
+
+def test_roomWakesWhenAPlayerEnters():
+    world, player, mobiles = makeWorld()
+    world.timeRoomLastOccupied[world.rooms[1]] = 0
+    putIdleRoomsToSleep(world, 6000)
+    assert world.mobiles == []
+    player.goToLocation(Location(1, (0, 0)), world, ScreenChanges())
+    assert world.mobiles == mobiles
+    assert world.mobileActionQueue.popDue(6000) == mobiles
+    assert world.rooms[1].dormantMobiles == []
+
+
+def test_roomsPassedThroughBetweenChecksStayAwake():
+    world, player, mobiles = makeWorld()
+    world.timeRoomLastOccupied[world.rooms[1]] = 0
+    putIdleRoomsToSleep(world, 4000)
+    player.goToLocation(Location(1, (0, 0)), world, ScreenChanges())
+    player.goToLocation(Location(0, (0, 0)), world, ScreenChanges())
+    putIdleRoomsToSleep(world, 6000)
+    assert world.mobiles == mobiles
+    putIdleRoomsToSleep(world, 12000)
+    assert world.mobiles == []
+
+
+def test_mobilesThatWanderIntoANewRoomAreWoken():
+    world, player, mobiles = makeWorld()
+    world.rooms[1].hasBeenEntered = False
+    world.timeRoomLastOccupied[world.rooms[1]] = 0
+    putIdleRoomsToSleep(world, 6000)
+    assert world.rooms[1].dormantMobiles == mobiles
+    player.goToLocation(Location(1, (0, 0)), world, ScreenChanges())
+    assert world.mobiles == mobiles
+    assert world.rooms[1].dormantMobiles == []
+
+
+def test_occupiedRoomsStayAwake():
+    world, player, mobiles = makeWorld()
+    player.goToLocation(Location(1, (0, 0)), world, ScreenChanges())
+    for currentTime in range(0, 60000, 1000):
+        putIdleRoomsToSleep(world, currentTime)
+    assert world.mobiles == mobiles
+
+
+def test_roomsKnowWhoIsInThem():
+    world, player, mobiles = makeWorld()
+    assert world.rooms[0].getPlayers() == [player]
+    assert world.rooms[1].getMobiles() == mobiles
+    screenChanges = ScreenChanges()
+    player.goToLocation(Location(1, (0, 0)), world, screenChanges)
+    assert world.rooms[0].getPlayers() == []
+    assert world.rooms[1].getPlayers() == [player]
+    mobiles[0].takeDamage(100, screenChanges)
+    handleDeath(world, screenChanges)
+    assert world.rooms[1].getMobiles() == [mobiles[1]]
+    for room in world.rooms:
+        room.checkResidents()
+
+
+def test_droppedClientsAreToldToExit():
+    import time
+    from socket import socket, AF_INET, SOCK_DGRAM
+    world, player, mobiles = makeWorld()
+    clients = ServersideClientConnections(port=0)
+    serverAddress = ("127.0.0.1", clients.serverSocket.getsockname()[1])
+    clientSocket = socket(AF_INET, SOCK_DGRAM)
+    try:
+        clientSocket.sendto(JoinServerMessage("0").toBytes(), serverAddress)
+        time.sleep(0.05)
+        eventList = EventList()
+        processClientMessages(world, clients, eventList)
+        connection, = player.clientConnections
+        connection.timedOut = True # as if it had stopped acknowledging messages
+        clients.flush()
+        processClientMessages(world, clients, eventList)
+        assert player.clientConnections == []
+
+        clientSocket.sendto(KeyPressedMessage(KeyCode.GO_LEFT).toBytes(), serverAddress)
+        time.sleep(0.05)
+        processClientMessages(world, clients, eventList)
+        assert eventList.isEmpty()
+        clientSocket.settimeout(1)
+        clientSocket.recvfrom(UDP_MAX_SIZE) # the WelcomeClientMessage
+        byteStr, address = clientSocket.recvfrom(UDP_MAX_SIZE)
+        assert isinstance(bytesToMessage(byteStr), ClientShouldExitMessage)
+    finally:
+        clientSocket.close()
+        clients.serverSocket.close()
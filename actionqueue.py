@@ -0,0 +1,67 @@
+#
+# A priority queue of the mobiles waiting to act, so that each tick only has to look
+# at the ones whose turn has come.
+#
+
+import heapq
+import itertools
+
+
+class ActionQueue:
+    """Holds mobiles ordered by their whenItCanAct. A mobile is in the queue at most
+    once; remove() can be called at any time (such as when it dies) and is cheap,
+    since the entry is just marked as no longer valid and skipped when it reaches the
+    front."""
+
+    def __init__(self):
+        self.heap = [] # list of (whenItCanAct, tieBreaker, mobile), arranged as a heap
+        self.entryByMobile = {} # map of mobile -> its valid entry in heap; any other entries are stale
+        self.tieBreaker = itertools.count() # so mobiles due at the same time keep the order they were added
+
+    def __len__(self):
+        return len(self.entryByMobile)
+
+    def __contains__(self, mobile):
+        return mobile in self.entryByMobile
+
+    def add(self, mobile):
+        """Adds the mobile to the queue at its current whenItCanAct. If it was already
+        in the queue, it is moved to the new time."""
+        if mobile in self.entryByMobile:
+            self.remove(mobile)
+        entry = (mobile.whenItCanAct, next(self.tieBreaker), mobile)
+        self.entryByMobile[mobile] = entry
+        heapq.heappush(self.heap, entry)
+
+    def remove(self, mobile):
+        """Removes the mobile from the queue, if it is there."""
+        # The entry is left in the heap, but without a matching entryByMobile it is stale.
+        if self.entryByMobile.pop(mobile, None) is not None:
+            if len(self.heap) > 2 * len(self.entryByMobile) + 64:
+                self._compact()
+
+    def popDue(self, currentTime):
+        """Removes and returns a list of all mobiles whose whenItCanAct is at or before
+        currentTime, earliest first. The caller should add() each one back after it acts
+        (a mobile whose whenItCanAct did not change will be returned again next time)."""
+        result = []
+        heap = self.heap
+        entryByMobile = self.entryByMobile
+        while heap and heap[0][0] <= currentTime:
+            entry = heapq.heappop(heap)
+            mobile = entry[2]
+            if entryByMobile.get(mobile) is entry:
+                del entryByMobile[mobile]
+                result.append(mobile)
+        return result
+
+    def nextActionTime(self):
+        """Returns the earliest whenItCanAct in the queue, or None if it is empty."""
+        heap = self.heap
+        while heap and self.entryByMobile.get(heap[0][2]) is not heap[0]:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def _compact(self):
+        self.heap = list(self.entryByMobile.values())
+        heapq.heapify(self.heap)
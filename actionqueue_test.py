@@ -0,0 +1,57 @@
+#
+# Unit tests for actionqueue using the pytest library
+#
+
+from actionqueue import ActionQueue
+
+
+class FakeMobile:
+    def __init__(self, whenItCanAct):
+        self.whenItCanAct = whenItCanAct
+
+
+def test_popDueReturnsOnlyDueMobilesInOrder():
+    queue = ActionQueue()
+    mobiles = [FakeMobile(t) for t in [30, 10, 20, 10, 50]]
+    for mobile in mobiles:
+        queue.add(mobile)
+    assert queue.popDue(5) == []
+    assert queue.popDue(20) == [mobiles[1], mobiles[3], mobiles[2]]
+    assert len(queue) == 2
+    assert queue.nextActionTime() == 30
+
+
+def test_removeAndReAdd():
+    queue = ActionQueue()
+    first, second = FakeMobile(10), FakeMobile(20)
+    queue.add(first)
+    queue.add(second)
+    queue.remove(first)
+    queue.remove(first)
+    assert first not in queue
+    assert queue.nextActionTime() == 20
+    second.whenItCanAct = 5
+    queue.add(second)
+    assert len(queue) == 1
+    assert queue.popDue(100) == [second]
+    assert queue.nextActionTime() is None
+
+
+def test_mobileThatDoesNotAdvanceIsReturnedNextTime():
+    queue = ActionQueue()
+    mobile = FakeMobile(0)
+    queue.add(mobile)
+    for tick in range(3):
+        assert queue.popDue(tick) == [mobile]
+        queue.add(mobile)
+
+
+def test_manyRemovalsStayCompact():
+    queue = ActionQueue()
+    mobiles = [FakeMobile(i) for i in range(1000)]
+    for mobile in mobiles:
+        queue.add(mobile)
+    for mobile in mobiles[:990]:
+        queue.remove(mobile)
+    assert len(queue.heap) < 100
+    assert queue.popDue(10000) == mobiles[990:]
@@ -0,0 +1,600 @@
+#
+# Performance benchmarks. These are not tests; run them by hand with
+#
+#    python benchmarks.py [name ...]
+#
+# to print timings. With no names given, every benchmark is run.
+#
+
+from pygame import init as pygame_init
+pygame_init() # Need to run this before some of the code that runs during imports
+
+import sys
+import timeit
+
+
+def timePerCall(function, minimumTime=0.2):
+    """Calls function repeatedly for at least minimumTime seconds and returns the
+    average number of seconds per call."""
+    timer = timeit.Timer(function)
+    number, totalTime = timer.autorange()
+    while totalTime < minimumTime:
+        number *= 2
+        totalTime = timer.timeit(number)
+    return totalTime / number
+
+
+def benchmarkWireCodecs():
+    """Compares the JSON and binary codecs on one of each serverToClientMessage."""
+    import rooms
+    import objects
+    from exploranetworking import (serverToClientMessages, jsonCodec, binaryCodec, bytesToMessage,
+                                   WelcomeClientMessage, NewRoomMessage, RefreshRoomMessage, UpdateRoomMessage,
+                                   PlaySoundsMessage, UpdateVisibleDataMessage, InventoryMessage,
+                                   InfoTextMessage, ConsoleTextMessage, ClientShouldExitMessage, BatchMessage,
+                                   ReliableMessage)
+    from clientdata import GridDataChange, VisibleData, InventoryData
+    gridData = rooms.room8.gridData()
+    changes = [(x, y, gridData.cellAt(x, y)) for x, y in [(1,1), (1,2), (5,5), (6,5), (20,1), (21,1)]]
+    minotaur = objects.Minotar(extraInventory=[objects.Sword(), objects.HealingWand()])
+    messages = [
+        WelcomeClientMessage(gridData),
+        NewRoomMessage(gridData),
+        RefreshRoomMessage(gridData),
+        UpdateRoomMessage(GridDataChange(changes)),
+        PlaySoundsMessage([0, 3]),
+        UpdateVisibleDataMessage(VisibleData(health=7, maxHealth=9, mana=10, maxMana=10)),
+        InventoryMessage(InventoryData.fromInventory(minotaur.inventory)),
+        InfoTextMessage("Go East for Minotaur\n\nBeware - the only escape is\nto defeat the beast."),
+        ConsoleTextMessage("The fuming minotaur was killed."),
+        ClientShouldExitMessage(),
+        BatchMessage([UpdateRoomMessage(GridDataChange(changes)), PlaySoundsMessage([0]),
+                      ConsoleTextMessage("You hit the fuming minotaur.")]),
+        ReliableMessage(12, UpdateRoomMessage(GridDataChange(changes))),
+    ]
+    assert [type(x) for x in messages] == serverToClientMessages
+    print(f"{'message':<25} {'codec':<7} {'bytes':>6} {'encode us':>10} {'decode us':>10}")
+    for message in messages:
+        for codec in [jsonCodec, binaryCodec]:
+            byteStr = codec.encode(message)
+            encodeTime = timePerCall(lambda: codec.encode(message))
+            decodeTime = timePerCall(lambda: bytesToMessage(byteStr))
+            print(f"{type(message).__name__:<25} {codec.name:<7} {len(byteStr):>6} "
+                  f"{encodeTime * 1e6:>10.1f} {decodeTime * 1e6:>10.1f}")
+
+
+def makeCrowdedWorld(numRooms, mobilesPerRoom, seed=0):
+    """Returns a World with numRooms 20x20 rooms, each holding mobilesPerRoom unarmed bees
+    that wander randomly (unarmed so that they don't kill each other off)."""
+    import random
+    import objects
+    from gamecomponents import Room
+    from mobile import Mobile
+    from brain import RandomBrain
+    from Exploratron import World
+    rng = random.Random(seed)
+    world = World(headless=True)
+    world.rooms = []
+    dirt = objects.Dirt()
+    for roomNumber in range(numRooms):
+        room = Room([[dirt] * 20 for y in range(20)])
+        world.rooms.append(room)
+        newMobiles = []
+        for position in rng.sample([(x, y) for y in range(20) for x in range(20)], mobilesPerRoom):
+            mobile = Mobile(objects.defaultRegion, 'angry-bee', "bee", 10, 0, RandomBrain)
+            mobile.whenItCanAct = rng.randrange(500)
+            room.placeMobile(mobile, position)
+            newMobiles.append(mobile)
+        world.addMobiles(newMobiles)
+    return world
+
+
+def benchmarkActionQueue():
+    """Compares scanning every mobile each tick (the old moveMobiles()) with popping just
+    the ones that are due from the ActionQueue, for 10,000 mobiles in 100 rooms. In the
+    "idle" case only 1% of the mobiles ever get a turn, which is the case the queue is for."""
+    import random
+    from Exploratron import moveMobiles
+    from screenchanges import ScreenChanges
+
+    def scanningMoveMobiles(world, currentTime, screenChanges):
+        for mobile in world.mobiles:
+            if currentTime >= mobile.whenItCanAct:
+                mobile.takeOneAction(currentTime, world, screenChanges)
+
+    def timeTicks(world, moveFunction, numTicks=100, tickLength=20):
+        random.seed(1) # so both versions make the same moves
+        screenChanges = ScreenChanges()
+        startTime = timeit.default_timer()
+        for tick in range(numTicks):
+            screenChanges.clear()
+            moveFunction(world, tick * tickLength, screenChanges)
+        return (timeit.default_timer() - startTime) / numTicks
+
+    print(f"{'case':<8} {'scan ms/tick':>13} {'queue ms/tick':>14}")
+    for case in ["busy", "idle"]:
+        times = []
+        for moveFunction in [scanningMoveMobiles, moveMobiles]:
+            world = makeCrowdedWorld(100, 100)
+            if case == "idle":
+                for mobile in world.mobiles[100:]:
+                    mobile.whenItCanAct = 10 ** 9
+                for mobile in world.mobiles:
+                    world.mobileActionQueue.add(mobile)
+            times.append(timeTicks(world, moveFunction))
+        print(f"{case:<8} {times[0] * 1000:>13.3f} {times[1] * 1000:>14.3f}")
+
+
+class SweepingDijkstraMap:
+    """The DijkstraMap as it was before it did a breadth-first search: values are kept in
+    a list and filled in by sweeping the whole grid until nothing changes. It is kept here
+    only to compare against."""
+    def __init__(self, room):
+        from brain import Alignment, IMPASSABLE
+        from kindsofthing import Wall
+        from mobile import Mobile
+        self.width = room.width
+        self.height = room.height
+        self.data = [None] * (self.width * self.height)
+        for y in range(self.height):
+            for x in range(self.width):
+                roomCell = room.cellAt(x, y)
+                isImpassible = False
+                hasFriendly = False
+                for thing in roomCell.things:
+                    if isinstance(thing, Wall):
+                        isImpassible = True
+                    if isinstance(thing, Mobile) and thing.brain.getAlignment() is Alignment.FRIENDLY:
+                        hasFriendly = True
+                if isImpassible:
+                    self.setValueAt(x, y, IMPASSABLE)
+                elif hasFriendly:
+                    self.setValueAt(x, y, 0)
+
+    def valueAt(self, x, y):
+        assert 0 <= x < self.width
+        assert 0 <= y < self.height
+        return self.data[x + (y * self.width)]
+
+    def setValueAt(self, x, y, val):
+        from brain import IMPASSABLE, UNREACHABLE
+        assert 0 <= x < self.width
+        assert 0 <= y < self.height
+        assert val in (None, IMPASSABLE, UNREACHABLE) or (isinstance(val, int) and val >= 0)
+        self.data[x + (y * self.width)] = val
+
+    def neighborsOf(self, x, y):
+        if y > 0:
+            yield (x, y-1)
+        if y + 2 < self.height:
+            yield (x, y+1)
+        if x > 0:
+            yield (x-1, y)
+        if x +2 < self.width:
+            yield (x+1, y)
+
+    def numericNeighborsOf(self, x, y):
+        from brain import IMPASSABLE, UNREACHABLE
+        for neighborX, neighborY in self.neighborsOf(x, y):
+            neighborVal = self.valueAt(neighborX, neighborY)
+            if neighborVal not in (None, IMPASSABLE, UNREACHABLE):
+                yield neighborVal
+
+    def singlePassPopulateValues(self):
+        numUpdates = 0
+        for y in range(self.height):
+            for x in range(self.width):
+                if self.valueAt(x, y) is None:
+                    lowestNeighbor = min(self.numericNeighborsOf(x, y), default=None)
+                    if lowestNeighbor is not None:
+                        self.setValueAt(x, y, lowestNeighbor + 1)
+                        numUpdates += 1
+        return numUpdates
+
+    def populateValues(self):
+        from brain import UNREACHABLE
+        numUpdates = 1
+        while numUpdates:
+            numUpdates = self.singlePassPopulateValues()
+        for y in range(self.height):
+            for x in range(self.width):
+                if self.valueAt(x, y) is None:
+                    self.setValueAt(x, y, UNREACHABLE)
+
+
+def firstOpenCell(room):
+    """Returns the (x, y) of the first cell in the room without a wall in it."""
+    from kindsofthing import Wall
+    for y in range(room.height):
+        for x in range(room.width):
+            if not any(isinstance(thing, Wall) for thing in room.cellAt(x, y).things):
+                return x, y
+
+
+def benchmarkDijkstraMap():
+    """Compares building and populating a DijkstraMap with the old sweeping version, for
+    each room in rooms.rooms with a target in the first open cell. (The rooms start out
+    with no players in them, so the target is set directly.)"""
+    import rooms
+    from brain import DijkstraMap
+
+    def buildMap(mapClass, room, target):
+        dmap = mapClass(room)
+        dmap.setValueAt(*target, 0)
+        dmap.populateValues()
+        return dmap
+
+    print(f"{'room':<6} {'size':>7} {'sweep ms':>9} {'bfs ms':>8} {'speedup':>8}")
+    for roomNumber, room in enumerate(rooms.rooms):
+        target = firstOpenCell(room)
+        sweepTime = timePerCall(lambda: buildMap(SweepingDijkstraMap, room, target))
+        bfsTime = timePerCall(lambda: buildMap(DijkstraMap, room, target))
+        print(f"room{roomNumber:<2} {room.width:>3}x{room.height:<3} {sweepTime * 1000:>9.3f} "
+              f"{bfsTime * 1000:>8.3f} {sweepTime / bfsTime:>7.1f}x")
+
+
+def benchmarkDijkstraRepair():
+    """Compares repairing a DijkstraMap when its one target steps to a neighboring cell
+    with building it again from scratch, for each room in rooms.rooms."""
+    import rooms
+    from brain import DijkstraMap, IMPASSABLE
+
+    def buildMap(room, target):
+        dmap = DijkstraMap(room)
+        dmap.setValueAt(*target, 0)
+        dmap.populateValues()
+        return dmap
+
+    def repairMap(dmap, target, newTarget):
+        dmap.removeSource(*target)
+        dmap.addSource(*newTarget)
+
+    print(f"{'room':<6} {'size':>7} {'rebuild ms':>11} {'repair ms':>10} {'speedup':>8}")
+    for roomNumber, room in enumerate(rooms.rooms):
+        target = firstOpenCell(room)
+        dmap = buildMap(room, target)
+        x, y = target
+        newTarget = next(neighbor for neighbor in [(x+1, y), (x, y+1), (x-1, y), (x, y-1)]
+                         if 0 <= neighbor[0] < room.width and 0 <= neighbor[1] < room.height and
+                         dmap.valueAt(*neighbor) is not IMPASSABLE)
+        rebuildTime = timePerCall(lambda: buildMap(room, newTarget))
+        # Step back and forth so that every call is a one-cell move.
+        positions = [target, newTarget]
+        def stepBackAndForth():
+            repairMap(dmap, positions[0], positions[1])
+            positions.reverse()
+        repairTime = timePerCall(stepBackAndForth)
+        assert dmap.data == buildMap(room, positions[0]).data
+        print(f"room{roomNumber:<2} {room.width:>3}x{room.height:<3} {rebuildTime * 1000:>11.3f} "
+              f"{repairTime * 1000:>10.3f} {rebuildTime / repairTime:>7.1f}x")
+
+
+def benchmarkFlowFieldCache():
+    """Compares AgressiveBrain actions with and without the room's FlowFieldCache, for
+    room9 with a player in it and 5 to 20 unarmed mobiles chasing it. The cache is timed
+    both building the map again whenever the player moves and repairing it. The player
+    takes a step (if it can) before each round. (The doors are walled up so that nobody
+    leaves.)"""
+    import random
+    import objects
+    import rooms
+    from brain import AgressiveBrain, flowFieldCacheFor
+    from gamecomponents import Room
+    from kindsofthing import Door
+    from mobile import Mobile
+    from players import thePlayerCatalog
+    from screenchanges import ScreenChanges
+
+    def makeRoom(numMobiles):
+        background = [[rooms.bkw if isinstance(cell.things[0], Door) else cell.things[0] for cell in row]
+                      for row in rooms.room9.grid.cells]
+        room = Room(background)
+        openCells = [(x, y) for y in range(room.height) for x in range(room.width)
+                     if room.cellAt(x, y).canEnter(None)]
+        rng = random.Random(0)
+        positions = rng.sample(openCells, numMobiles + 1)
+        player = thePlayerCatalog.getEntryById("0").getPlayer(objects.defaultRegion)
+        room.placeMobile(player, positions[0])
+        mobiles = []
+        for position in positions[1:]:
+            mobile = Mobile(objects.defaultRegion, 'angry-bee', "bee", 10, 0, AgressiveBrain)
+            room.placeMobile(mobile, position)
+            mobiles.append(mobile)
+        return room, player, mobiles
+
+    def timeActions(numMobiles, mode, numRounds=200):
+        random.seed(1)
+        room, player, mobiles = makeRoom(numMobiles)
+        cache = flowFieldCacheFor(room)
+        if mode == "rebuild":
+            cache.maxRepairs = 0
+        screenChanges = ScreenChanges()
+        playerMoves = [((1, 0), player.moveEast), ((0, 1), player.moveSouth),
+                       ((-1, 0), player.moveWest), ((0, -1), player.moveNorth)]
+        def movePlayer(roundNumber):
+            # takes the first step it can, starting in a different direction each round
+            for i in range(4):
+                (deltaX, deltaY), move = playerMoves[(roundNumber + i) % 4]
+                x, y = player.position[0] + deltaX, player.position[1] + deltaY
+                if 0 <= x < room.width and 0 <= y < room.height and room.cellAt(x, y).canEnter(player):
+                    move(roundNumber, None, screenChanges)
+                    return
+        startTime = timeit.default_timer()
+        for roundNumber in range(numRounds):
+            screenChanges.clear()
+            movePlayer(roundNumber)
+            for mobile in mobiles:
+                if mode == "uncached":
+                    cache.clear()
+                mobile.takeOneAction(roundNumber, None, screenChanges)
+        return (timeit.default_timer() - startTime) / numRounds, cache
+
+    print(f"{'mobiles':>7} {'uncached':>9} {'rebuild':>9} {'repair':>9}  (ms/round)  {'hits':>6} {'misses':>7} {'repairs':>8}")
+    for numMobiles in [5, 10, 20]:
+        times = {}
+        for mode in ["uncached", "rebuild", "repair"]:
+            times[mode], cache = timeActions(numMobiles, mode)
+        print(f"{numMobiles:>7} {times['uncached'] * 1000:>9.3f} {times['rebuild'] * 1000:>9.3f} "
+              f"{times['repair'] * 1000:>9.3f}              {cache.numHits:>6} {cache.numMisses:>7} {cache.numRepairs:>8}")
+
+
+def makeSteppingBeeRoom():
+    """Returns (room, step): a copy of room8 (with its doors walled up) holding one bee,
+    and a function that makes the bee take one step back or forth."""
+    import objects
+    import rooms
+    from brain import RandomBrain
+    from gamecomponents import Room
+    from mobile import Mobile
+    from screenchanges import ScreenChanges
+    from kindsofthing import Door
+
+    background = [[rooms.bkw if isinstance(cell.things[0], Door) else cell.things[0] for cell in row]
+                  for row in rooms.room8.grid.cells]
+    room = Room(background)
+    bee = Mobile(objects.defaultRegion, 'angry-bee', "bee", 10, 0, RandomBrain)
+    position = firstOpenCell(room)
+    room.placeMobile(bee, position)
+    screenChanges = ScreenChanges()
+    moves = [bee.moveEast, bee.moveWest] if room.cellAt(position[0] + 1, position[1]).canEnter(bee) else \
+            [bee.moveSouth, bee.moveNorth]
+    def step():
+        moves.reverse()
+        moves[0](0, None, screenChanges)
+    return room, step
+
+
+def benchmarkGridData():
+    """Compares the per-frame cost of room8.gridData() when it built a new GridData on
+    every call with the cached one, both when nothing has changed and when a mobile
+    steps back and forth each frame."""
+    from clientdata import GridData, CellData
+
+    def rebuildGridData(grid):
+        allCells = []
+        for row in grid.cells:
+            allCells.extend([CellData(tuple(x.tileId for x in cell.things)) for cell in row])
+        return GridData(grid.width, grid.height, allCells)
+
+    room, step = makeSteppingBeeRoom()
+    def stepAndGetGridData():
+        step()
+        return room.gridData()
+
+    print(f"{'case':<24} {'us/frame':>9}")
+    print(f"{'rebuild every frame':<24} {timePerCall(lambda: rebuildGridData(room.grid)) * 1e6:>9.1f}")
+    print(f"{'cached, unchanged':<24} {timePerCall(room.gridData) * 1e6:>9.1f}")
+    print(f"{'cached, one step':<24} {timePerCall(stepAndGetGridData) * 1e6:>9.1f}")
+
+
+def benchmarkGridRender():
+    """Compares the time for PygameDisplay.show() to draw a frame of room8 when the
+    whole grid is redrawn (as it used to be) with drawing only the cells that changed,
+    both when nothing has changed and when a mobile steps back and forth each frame.
+    The full redraw is timed both blitting each tile of a cell separately and using
+    the CellImageCache. Run it with SDL_VIDEODRIVER=dummy to leave out the cost of the
+    real screen."""
+    import objects
+    from display import PygameDisplay, PygameGridDisplay, BLACK
+
+    class LayerByLayerGridDisplay(PygameGridDisplay):
+        def drawCell(self, surface, cellRect, cellData, imageLibrary):
+            surface.fill(BLACK, cellRect)
+            if cellData is not None:
+                for tileId in cellData.tileIds():
+                    surface.blit(imageLibrary.lookupById(tileId), cellRect)
+
+    room, step = makeSteppingBeeRoom()
+    display = PygameDisplay()
+    imageLibrary = objects.defaultRegion.imageLibrary
+    display.uiState.newRoom(room.gridData())
+    def fullRedraw():
+        display.gridDisplay.invalidate()
+        display.show(room.gridData(), imageLibrary)
+    def stepAndShow():
+        step()
+        display.show(room.gridData(), imageLibrary)
+
+    print(f"{'case':<30} {'ms/frame':>9}")
+    cachingGridDisplay = display.gridDisplay
+    display.gridDisplay = LayerByLayerGridDisplay()
+    print(f"{'full redraw, tile by tile':<30} {timePerCall(fullRedraw) * 1e3:>9.3f}")
+    display.gridDisplay = cachingGridDisplay
+    print(f"{'full redraw, cached stacks':<30} {timePerCall(fullRedraw) * 1e3:>9.3f}")
+    print(f"{'dirty cells, unchanged':<30} {timePerCall(lambda: display.show(room.gridData(), imageLibrary)) * 1e3:>9.3f}")
+    print(f"{'dirty cells, one step':<30} {timePerCall(stepAndShow) * 1e3:>9.3f}")
+    cache = display.gridDisplay.cellImageCache
+    print(f"CellImageCache: {len(cache)} stacks, {cache.numHits} hits, {cache.numMisses} misses")
+
+
+def benchmarkBlit():
+    """Compares blitting each tile in img/drawntiles64 onto the screen as it was loaded
+    from the file with blitting it after convertForDisplay(). Run it with
+    SDL_VIDEODRIVER=dummy if there is no screen."""
+    import os
+    import pygame
+    from images import TILE_SIZE, convertForDisplay
+
+    if pygame.display.get_surface() is None:
+        pygame.display.set_mode((16 * TILE_SIZE, 9 * TILE_SIZE))
+    screen = pygame.display.get_surface()
+    directory = './img/drawntiles64'
+    loaded = [pygame.image.load(f'{directory}/{name}') for name in sorted(os.listdir(directory)) if name.endswith('.png')]
+    converted = [convertForDisplay(image) for image in loaded]
+    numWithAlpha = sum(1 for image in converted if image.get_flags() & pygame.SRCALPHA)
+    def blitAll(images):
+        for i, image in enumerate(images):
+            screen.blit(image, ((i % 16) * TILE_SIZE, (i // 16 % 9) * TILE_SIZE))
+
+    print(f"{len(loaded)} tiles, {numWithAlpha} kept their alpha channel")
+    print(f"{'case':<24} {'us/blit':>8} {'blits/sec':>10}")
+    for name, images in [("as loaded", loaded), ("converted", converted)]:
+        secondsPerBlit = timePerCall(lambda: blitAll(images)) / len(images)
+        print(f"{name:<24} {secondsPerBlit * 1e6:>8.2f} {1 / secondsPerBlit:>10.0f}")
+
+
+def benchmarkImageLibrary():
+    """Compares the time to create the drawntiles64 ImageLibrary and load every image in
+    it from the separate files with loading them from the atlas built by buildatlas.py."""
+    from images import ImageLibrary
+
+    def loadAll(useAtlas):
+        library = ImageLibrary('drawntiles64', useAtlas)
+        for tileId in library._idByName.values():
+            library.lookupById(tileId)
+
+    print(f"{'case':<28} {'ms':>8}")
+    for name, useAtlas in [("separate files", False), ("atlas", True)]:
+        print(f"{name:<28} {timePerCall(lambda: loadAll(useAtlas)) * 1e3:>8.3f}")
+
+
+def benchmarkMediaStartup():
+    """Compares the time to start up the media now that it is only loaded when first
+    looked up: creating a Region (just the ids), loading all of it (which is what
+    creating a Region used to do), and loading only the images room8 needs."""
+    import rooms
+    from images import Region, ImageLibrary
+
+    def loadEverything():
+        region = Region()
+        for library in [region.imageLibrary, region.soundLibrary]:
+            for mediaId in library._idByName.values():
+                library.lookupById(mediaId)
+    def loadRoom8(useAtlas):
+        imageLibrary = ImageLibrary('drawntiles64', useAtlas)
+        for tileId in rooms.room8.gridData().tileIdsUsed():
+            imageLibrary.lookupById(tileId)
+
+    print(f"{'case':<34} {'ms':>8}")
+    print(f"{'Region, load everything':<34} {timePerCall(loadEverything) * 1e3:>8.3f}")
+    print(f"{'Region, ids only':<34} {timePerCall(Region) * 1e3:>8.3f}")
+    print(f"{'room8 images, separate files':<34} {timePerCall(lambda: loadRoom8(False)) * 1e3:>8.3f}")
+    print(f"{'room8 images, atlas':<34} {timePerCall(lambda: loadRoom8(True)) * 1e3:>8.3f}")
+
+
+def makeGeneratedBackground(size, seed=0):
+    """Returns a size x size background for a Room: dirt with walls around the edge
+    and scattered about (the same Thing objects are reused, as in rooms.py)."""
+    import random
+    import objects
+    rng = random.Random(seed)
+    dirt = objects.Dirt()
+    wall = objects.BrickWall()
+    return [[wall if x in (0, size - 1) or y in (0, size - 1) or rng.random() < 0.1 else dirt
+             for x in range(size)] for y in range(size)]
+
+
+def benchmarkLayeredGrid():
+    """Compares the memory and time to build big generated rooms with a Grid (a Cell for
+    every spot) and with a LayeredGrid (a layer of palette numbers plus the few cells that
+    hold more than their background), and the time for their first gridData()."""
+    import tracemalloc
+    import objects
+    from gamecomponents import Room, Grid, LayeredGrid
+
+    print(f"{'size':>9} {'grid':<12} {'memory KB':>10} {'build ms':>9} {'gridData ms':>12}")
+    for size in [100, 200, 400]:
+        background = makeGeneratedBackground(size)
+        items = {(x, size // 2): objects.Sword() for x in range(1, size - 1, 7)}
+        for gridClass in [Grid, LayeredGrid]:
+            tracemalloc.start()
+            startTime = timeit.default_timer()
+            room = Room(background, items, gridClass=gridClass)
+            buildTime = timeit.default_timer() - startTime
+            memoryUsed = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            startTime = timeit.default_timer()
+            room.gridData()
+            gridDataTime = timeit.default_timer() - startTime
+            print(f"{size:>4}x{size:<4} {gridClass.__name__:<12} {memoryUsed / 1024:>10.0f} "
+                  f"{buildTime * 1000:>9.1f} {gridDataTime * 1000:>12.1f}")
+            del room
+
+
+def benchmarkMemory():
+    """Uses tracemalloc to measure the memory taken by loading all the rooms (by reloading
+    the rooms module), and then the memory in use and at the peak while running 1,000
+    simulated ticks with every room's mobiles awake and the update messages for each
+    room being built and encoded."""
+    import importlib
+    import random
+    import tracemalloc
+    import objects
+    import rooms
+    from Exploratron import World, moveMobiles, handleDeath, regenMobiles, roomUpdateMessage
+    from exploranetworking import binaryCodec
+    from screenchanges import ScreenChanges
+
+    random.seed(0)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    importlib.reload(rooms)
+    roomsMemory = tracemalloc.get_traced_memory()[0] - baseline
+    world = World(headless=True)
+    world.rooms = rooms.rooms
+    world.addPlayer(objects.defaultRegion, world.playerCatalog.getEntryById("0"))
+    for room in world.rooms:
+        world.addMobiles(room.playerEntersRoom())
+    screenChanges = ScreenChanges()
+    tracemalloc.reset_peak()
+    beforeTicks = tracemalloc.get_traced_memory()[0]
+    for tick in range(1000):
+        currentTime = tick * 20
+        screenChanges.clear()
+        regenMobiles(world, currentTime)
+        moveMobiles(world, currentTime, screenChanges)
+        handleDeath(world, screenChanges)
+        for room in world.rooms:
+            message = roomUpdateMessage(room, screenChanges)
+            if message is not None:
+                binaryCodec.encode(message)
+    afterTicks, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{len(world.mobiles)} mobiles still alive after 1,000 ticks")
+    print(f"{'loading all rooms':<28} {roomsMemory / 1024:>8.0f} KB")
+    print(f"{'held after 1,000 ticks':<28} {(afterTicks - beforeTicks) / 1024:>8.0f} KB")
+    print(f"{'peak during the ticks':<28} {(peak - beforeTicks) / 1024:>8.0f} KB")
+
+
+allBenchmarks = {
+    "wirecodecs": benchmarkWireCodecs,
+    "actionqueue": benchmarkActionQueue,
+    "dijkstramap": benchmarkDijkstraMap,
+    "dijkstrarepair": benchmarkDijkstraRepair,
+    "flowfieldcache": benchmarkFlowFieldCache,
+    "griddata": benchmarkGridData,
+    "gridrender": benchmarkGridRender,
+    "blit": benchmarkBlit,
+    "imagelibrary": benchmarkImageLibrary,
+    "mediastartup": benchmarkMediaStartup,
+    "layeredgrid": benchmarkLayeredGrid,
+    "memory": benchmarkMemory,
+}
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(allBenchmarks)
+    for name in names:
+        print(f"===== {name} =====")
+        allBenchmarks[name]()
+        print()
@@ -7,10 +7,12 @@
 # ownership loops).
 #
 
+import heapq
 import random
+from array import array
+from collections import deque
 from enum import Enum
 from mobile import Mobile
-from kindsofthing import Wall
 
 
 
@@ -56,6 +58,31 @@ class _UnreachableClass:
         return "UNREACHABLE"
 UNREACHABLE = _UnreachableClass()
 
+# How DijkstraMap stores the values that aren't distances.
+_NONE_CODE = -1
+_IMPASSABLE_CODE = -2
+_UNREACHABLE_CODE = -3
+_VALUE_BY_CODE = {_NONE_CODE: None, _IMPASSABLE_CODE: IMPASSABLE, _UNREACHABLE_CODE: UNREACHABLE}
+_CODE_BY_VALUE = {value: code for code, value in _VALUE_BY_CODE.items()}
+
+# A FlowFieldCache repairs a map (instead of building it again) only if no more than
+# this many targets have arrived or left since it was last used. One target taking a
+# step is two: it leaves one cell and arrives in another.
+MAX_REPAIRS_PER_UPDATE = 2
+
+
+def _startingCode(cell, targetAlignment):
+    """Returns the code a DijkstraMap starts out with for a cell: IMPASSIBLE if it
+    has a wall, 0 if it has a mobile of targetAlignment, and None otherwise."""
+    grid = cell.grid
+    if grid.wallCounts[cell.index]:
+        return _IMPASSABLE_CODE
+    if grid.mobileCounts[cell.index]:
+        for thing in cell.things:
+            if isinstance(thing, Mobile) and thing.brain.getAlignment() is targetAlignment:
+                return 0
+    return _NONE_CODE
+
 
 class DijkstraMap:
     """This contains a grid of integers for each cell in a room. The first
@@ -63,39 +90,34 @@ class DijkstraMap:
     later I will generalize it.
 
     Throughout, this uses values, which are EITHER a non-negative integer
-    or None (meaning not yet initialized), or IMPASSIBLE or UNREACHABLE."""
-    def __init__(self, room):
+    or None (meaning not yet initialized), or IMPASSIBLE or UNREACHABLE.
+    Internally they are kept in an array of ints, using negative numbers
+    for the values that aren't distances."""
+    def __init__(self, room, targetAlignment=Alignment.FRIENDLY):
+        """The cells holding a mobile of targetAlignment start at 0, the ones with
+        walls are IMPASSIBLE, and the rest start out as None."""
         self.width = room.width
         self.height = room.height
-        self.data = [None] * (self.width * self.height)
-        for y in range(self.height):
-            for x in range(self.width):
-                roomCell = room.cellAt(x, y)
-                isImpassible = False
-                hasFriendly = False
-                for thing in roomCell.things:
-                    if isinstance(thing, Wall):
-                        isImpassible = True
-                    if isinstance(thing, Mobile) and thing.brain.getAlignment() is Alignment.FRIENDLY:
-                        hasFriendly = True
-                if isImpassible:
-                    self.setValueAt(x, y, IMPASSABLE)
-                elif hasFriendly:
-                    self.setValueAt(x, y, 0)
-                else:
-                    pass # leave the rest as None
+        self.targetAlignment = targetAlignment
+        grid = room.grid
+        self.data = array('i', [_IMPASSABLE_CODE if wallCount else _NONE_CODE for wallCount in grid.wallCounts])
+        for index, mobileCount in enumerate(grid.mobileCounts):
+            if mobileCount and not grid.wallCounts[index]:
+                cell = grid.cellAt(index % self.width, index // self.width)
+                self.data[index] = _startingCode(cell, targetAlignment)
 
     def valueAt(self, x, y):
         """Returns the integer value at that position."""
         assert 0 <= x < self.width
         assert 0 <= y < self.height
-        return self.data[x + (y * self.width)]
+        code = self.data[x + (y * self.width)]
+        return code if code >= 0 else _VALUE_BY_CODE[code]
 
     def setValueAt(self, x, y, val):
         assert 0 <= x < self.width
         assert 0 <= y < self.height
         assert val in (None, IMPASSABLE, UNREACHABLE) or (isinstance(val, int) and val >= 0)
-        self.data[x + (y * self.width)] = val
+        self.data[x + (y * self.width)] = val if isinstance(val, int) else _CODE_BY_VALUE[val]
 
     def dump(self):
         for y in range(self.height):
@@ -116,44 +138,223 @@ class DijkstraMap:
         if x +2 < self.width:
             yield (x+1, y)
 
-    def numericNeighborsOf(self, x, y):
-        """Given an x,y location, this returns an iterator of values in neighboring locations
-        which contain numbers. If no neighbors contain a number, this will return no values."""
-        for neighborX, neighborY in self.neighborsOf(x, y):
-            neighborVal = self.valueAt(neighborX, neighborY)
-            if neighborVal not in (None, IMPASSABLE, UNREACHABLE):
-                assert isinstance(neighborVal, int) and neighborVal >= 0
-                yield neighborVal
-
-    def singlePassPopulateValues(self):
-        """Performs a single pass of populating values. Returns the number of cells updated."""
-        numUpdates = 0
-        for y in range(self.height):
-            for x in range(self.width):
-                if self.valueAt(x, y) is None:
-                    # Try to populate it!
-                    lowestNeighbor = min(self.numericNeighborsOf(x, y), default=None)
-                    if lowestNeighbor is not None:
-                        self.setValueAt(x, y, lowestNeighbor + 1)
-                        numUpdates += 1
-        return numUpdates
-
-    def setNoneToUnreachable(self):
-        """Simply sets all values in the DijkstraMap that are None to UNREACHABLE."""
-        for y in range(self.height):
-            for x in range(self.width):
-                if self.valueAt(x, y) is None:
-                    self.setValueAt(x, y, UNREACHABLE)
-
     def populateValues(self):
-        """When this is called, it will iterate over the map until it has managed to
-        replace all None values with one of the other valid values."""
-        numUpdates = 1 # start with a dummy non-zero value
-        while numUpdates: # loop until there are no updates
-            numUpdates = self.singlePassPopulateValues()
-        self.setNoneToUnreachable()
-
+        """When this is called, it will replace all None values with one of the other
+        valid values: the distance to the nearest 0 (counting only steps between a cell
+        and the cells in its neighborsOf()), or UNREACHABLE if there is no way to get
+        to one. It does a breadth-first search out from the 0 cells."""
+        data = self.data
+        queue = deque(index for index, code in enumerate(data) if code == 0)
+        while queue:
+            index = queue.popleft()
+            distance = data[index] + 1
+            for dependent in self._cellsLookingAt(index):
+                if data[dependent] == _NONE_CODE:
+                    data[dependent] = distance
+                    queue.append(dependent)
+        for index, code in enumerate(data):
+            if code == _NONE_CODE:
+                data[index] = _UNREACHABLE_CODE
+
+    def _cellsLookingAt(self, index):
+        """Returns a list of the indexes of the cells that have this one among their
+        neighborsOf(), which are the cells whose value can depend on this one's. Note
+        that neighborsOf() skips the last row and column when looking south and east."""
+        width = self.width
+        x = index % width
+        y = index // width
+        result = []
+        if y + 1 < self.height:
+            result.append(index + width) # the cell to the south looks north to here
+            if y > 0:
+                result.append(index - width) # the cell to the north looks south to here
+        if x + 1 < width:
+            result.append(index + 1) # the cell to the east looks west to here
+            if x > 0:
+                result.append(index - 1) # the cell to the west looks east to here
+        return result
 
+    def addSource(self, x, y):
+        """After populateValues() has been called, this makes (x,y) a new 0 and updates
+        just the values that get closer because of it."""
+        data = self.data
+        index = x + (y * self.width)
+        assert data[index] != _IMPASSABLE_CODE
+        data[index] = 0
+        queue = deque([index])
+        while queue:
+            index = queue.popleft()
+            distance = data[index] + 1
+            for dependent in self._cellsLookingAt(index):
+                code = data[dependent]
+                if code == _UNREACHABLE_CODE or code > distance:
+                    data[dependent] = distance
+                    queue.append(dependent)
+
+    def removeSource(self, x, y):
+        """After populateValues() has been called, this makes (x,y) no longer a 0 and
+        updates just the values that depended on it (unless that is a large part of
+        the room, in which case it repopulates them all)."""
+        data = self.data
+        width = self.width
+        sourceIndex = x + (y * width)
+        assert data[sourceIndex] == 0
+        # -- first, the cheap checks --
+        numSources = data.count(0)
+        if numSources == 1:
+            # It was the only source, so nothing can be reached any more.
+            data[:] = array('i', [code if code < 0 else _UNREACHABLE_CODE for code in data])
+            return
+        if numSources < 4:
+            # Each source is the closest for more than a quarter of the room on average,
+            # so it is probably quicker to start over than to find the ones that depend on it.
+            self._repopulateWithout(sourceIndex)
+            return
+        # -- find the cells whose value has no support other than through the source --
+        # Cells come off the queue in order of their old value, so by the time a cell is
+        # checked every cell one step closer has already been marked or not.
+        affected = {sourceIndex}
+        queue = deque([sourceIndex])
+        while queue:
+            index = queue.popleft()
+            distance = data[index] + 1
+            for dependent in self._cellsLookingAt(index):
+                if data[dependent] == distance and dependent not in affected:
+                    for neighborX, neighborY in self.neighborsOf(dependent % width, dependent // width):
+                        neighbor = neighborX + (neighborY * width)
+                        if data[neighbor] == distance - 1 and neighbor not in affected:
+                            break # it can still get this distance from a cell that isn't affected
+                    else:
+                        affected.add(dependent)
+                        queue.append(dependent)
+            if len(affected) > len(data) // 4:
+                # So much depends on the source that it is quicker to start over.
+                self._repopulateWithout(sourceIndex)
+                return
+        # -- give each affected cell the best value it can get from outside --
+        for index in affected:
+            data[index] = _NONE_CODE
+        heap = []
+        for index in affected:
+            neighborCodes = [data[neighborX + (neighborY * width)]
+                             for neighborX, neighborY in self.neighborsOf(index % width, index // width)]
+            best = min((code for code in neighborCodes if code >= 0), default=None)
+            if best is not None:
+                heap.append((best + 1, index))
+        heapq.heapify(heap)
+        # -- and spread those values through the affected cells --
+        while heap:
+            distance, index = heapq.heappop(heap)
+            code = data[index]
+            if code != _NONE_CODE and code <= distance:
+                continue
+            data[index] = distance
+            for dependent in self._cellsLookingAt(index):
+                if dependent in affected:
+                    code = data[dependent]
+                    if code == _NONE_CODE or code > distance + 1:
+                        heapq.heappush(heap, (distance + 1, dependent))
+        for index in affected:
+            if data[index] == _NONE_CODE:
+                data[index] = _UNREACHABLE_CODE
+
+    def _repopulateWithout(self, sourceIndex):
+        """Clears every value except the IMPASSIBLE cells and the 0s (other than the one
+        at sourceIndex) and then calls populateValues()."""
+        data = self.data
+        for index, code in enumerate(data):
+            if code != 0 and code != _IMPASSABLE_CODE:
+                data[index] = _NONE_CODE
+        data[sourceIndex] = _NONE_CODE
+        self.populateValues()
+
+    def startingCodeAt(self, x, y):
+        """Returns the code this cell started out with before populateValues()
+        (see _startingCode())."""
+        code = self.data[x + (y * self.width)]
+        return code if code in (0, _IMPASSABLE_CODE) else _NONE_CODE
+
+
+class FlowFieldCache:
+    """Holds the populated DijkstraMaps for one room (one per alignment that mobiles
+    are heading towards) so that every brain in the room can share them instead of
+    each building its own. The room passes along each cell that ScreenChanges is told
+    has changed, and those are only looked at the next time the map is asked for. If
+    just a few targets arrived or left (such as one target taking a step) the map is
+    repaired in place; if more changed, or a wall came or went, it is built again."""
+    def __init__(self, room):
+        self.room = room
+        self.mapByAlignment = {} # map of targetAlignment -> populated DijkstraMap
+        self.changedCellsByAlignment = {} # map of targetAlignment -> set of (x,y) changed since that map was brought up to date
+        self.maxRepairs = MAX_REPAIRS_PER_UPDATE
+        self.numHits = 0
+        self.numMisses = 0
+        self.numRepairs = 0
+        self.numInvalidations = 0
+
+    def getMap(self, targetAlignment):
+        """Returns a populated DijkstraMap for the room with mobiles of targetAlignment
+        as the targets. The caller must not modify it."""
+        dmap = self.mapByAlignment.get(targetAlignment)
+        if dmap is not None:
+            changedCells = self.changedCellsByAlignment[targetAlignment]
+            if changedCells:
+                if not self._bringUpToDate(dmap, changedCells):
+                    self.numInvalidations += 1
+                    dmap = None
+                changedCells.clear()
+        if dmap is None:
+            self.numMisses += 1
+            dmap = DijkstraMap(self.room, targetAlignment)
+            dmap.populateValues()
+            self.mapByAlignment[targetAlignment] = dmap
+            self.changedCellsByAlignment[targetAlignment] = set()
+        else:
+            self.numHits += 1
+        return dmap
+
+    def _bringUpToDate(self, dmap, changedCells):
+        """Repairs dmap to account for changedCells. Returns False (having left dmap
+        alone) if it would be better to build it again instead."""
+        addedSources = []
+        removedSources = []
+        for x, y in changedCells:
+            oldCode = dmap.startingCodeAt(x, y)
+            newCode = _startingCode(self.room.cellAt(x, y), dmap.targetAlignment)
+            if oldCode == newCode:
+                pass
+            elif oldCode == _NONE_CODE and newCode == 0:
+                addedSources.append((x, y))
+            elif oldCode == 0 and newCode == _NONE_CODE:
+                removedSources.append((x, y))
+            else:
+                return False # a wall came or went
+        if len(addedSources) + len(removedSources) > self.maxRepairs:
+            return False
+        for x, y in removedSources:
+            dmap.removeSource(x, y)
+        for x, y in addedSources:
+            dmap.addSource(x, y)
+        self.numRepairs += len(addedSources) + len(removedSources)
+        return True
+
+    def cellChanged(self, x, y):
+        """Call this when the things in a cell of the room may have changed."""
+        for changedCells in self.changedCellsByAlignment.values():
+            changedCells.add((x, y))
+
+    def clear(self):
+        """Call this when anything in the room may have changed."""
+        self.numInvalidations += len(self.mapByAlignment)
+        self.mapByAlignment.clear()
+        self.changedCellsByAlignment.clear()
+
+
+def flowFieldCacheFor(room):
+    """Returns the room's FlowFieldCache, creating it the first time."""
+    if room.flowFieldCache is None:
+        room.flowFieldCache = FlowFieldCache(room)
+    return room.flowFieldCache
 
 
 class Brain:
@@ -219,11 +420,8 @@ class AgressiveBrain(Brain):
     def getAlignment(self):
         return Alignment.UNFRIENDLY
 
-    # FIXME: This creates the DijkstraMap every time. We can be smarter than that.
     def takeOneAction(self, mobile, currentTime, world, screenChanges):
-        room = mobile.room
-        dmap = DijkstraMap(room)
-        dmap.populateValues()
+        dmap = flowFieldCacheFor(mobile.room).getMap(Alignment.FRIENDLY)
         x, y = mobile.position
         bestScoreSoFar = None
         bestNeighbors = []
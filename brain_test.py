@@ -0,0 +1,183 @@
+#
+# Unit tests for brain using the pytest library
+#
+
+import pygame
+pygame.init()
+import random
+import rooms
+import objects
+from brain import DijkstraMap, IMPASSABLE, UNREACHABLE, AgressiveBrain, Alignment, flowFieldCacheFor
+from gamecomponents import Room
+from mobile import Mobile
+from players import thePlayerCatalog
+from screenchanges import ScreenChanges
+
+
+def reachableFrom(dmap, targets):
+    """Returns the set of (x, y) from which some target can be reached by stepping along
+    neighborsOf() through cells that aren't IMPASSABLE. Done the slow, obvious way."""
+    reachable = set(targets)
+    changed = True
+    while changed:
+        changed = False
+        for y in range(dmap.height):
+            for x in range(dmap.width):
+                if (x, y) not in reachable and dmap.valueAt(x, y) is not IMPASSABLE:
+                    if any(neighbor in reachable for neighbor in dmap.neighborsOf(x, y)):
+                        reachable.add((x, y))
+                        changed = True
+    return reachable
+
+
+def checkMap(dmap, targets):
+    reachable = reachableFrom(dmap, targets)
+    for y in range(dmap.height):
+        for x in range(dmap.width):
+            value = dmap.valueAt(x, y)
+            if value is IMPASSABLE:
+                continue
+            if (x, y) not in reachable:
+                assert value is UNREACHABLE
+            elif value == 0:
+                assert (x, y) in targets
+            else:
+                # A cell's value is one more than the best of its neighbors.
+                neighborValues = [dmap.valueAt(nx, ny) for nx, ny in dmap.neighborsOf(x, y)]
+                assert min(v for v in neighborValues if isinstance(v, int)) == value - 1
+
+
+def test_populateValuesInSmallRoom():
+    room = Room([[objects.Dirt()] * 4 for y in range(3)])
+    dmap = DijkstraMap(room)
+    dmap.setValueAt(0, 0, 0)
+    dmap.setValueAt(1, 1, IMPASSABLE)
+    dmap.populateValues()
+    assert [[dmap.valueAt(x, y) for x in range(4)] for y in range(3)] == [
+        [0, 1, 2, 3],
+        [1, IMPASSABLE, 3, 4],
+        [2, 3, 4, 5],
+    ]
+
+
+def test_noTargetsMeansUnreachable():
+    room = Room([[objects.Dirt()] * 3 for y in range(3)])
+    dmap = DijkstraMap(room)
+    dmap.populateValues()
+    assert dmap.valueAt(1, 1) is UNREACHABLE
+
+
+def test_populateValuesInEveryRoom():
+    rng = random.Random(0)
+    for room in rooms.rooms:
+        dmap = DijkstraMap(room)
+        openCells = [(x, y) for y in range(room.height) for x in range(room.width)
+                     if dmap.valueAt(x, y) is not IMPASSABLE]
+        targets = set(rng.sample(openCells, 2))
+        for x, y in targets:
+            dmap.setValueAt(x, y, 0)
+        dmap.populateValues()
+        checkMap(dmap, targets)
+
+
+def makeRoomWithPlayer():
+    """Returns (room, player, mobiles): a 5x5 room with a player at (0,0) and two unarmed
+    mobiles with AgressiveBrains."""
+    room = Room([[objects.Dirt()] * 5 for y in range(5)])
+    player = thePlayerCatalog.getEntryById("0").getPlayer(objects.defaultRegion)
+    room.placeMobile(player, (0, 0))
+    mobiles = []
+    for position in [(4, 4), (2, 3)]:
+        mobile = Mobile(objects.defaultRegion, 'angry-bee', "bee", 10, 0, AgressiveBrain)
+        room.placeMobile(mobile, position)
+        mobiles.append(mobile)
+    return room, player, mobiles
+
+
+def test_flowFieldIsSharedByTheRoom():
+    room, player, mobiles = makeRoomWithPlayer()
+    screenChanges = ScreenChanges()
+    for mobile in mobiles:
+        mobile.takeOneAction(0, None, screenChanges)
+    cache = flowFieldCacheFor(room)
+    assert (cache.numMisses, cache.numHits, cache.numInvalidations) == (1, 1, 0)
+    assert cache.getMap(Alignment.FRIENDLY).valueAt(2, 2) == 4
+
+
+def test_flowFieldIsRepairedWhenTargetsMove():
+    room, player, mobiles = makeRoomWithPlayer()
+    screenChanges = ScreenChanges()
+    cache = flowFieldCacheFor(room)
+    cache.getMap(Alignment.FRIENDLY)
+    mobiles[0].moveNorth(0, None, screenChanges)
+    player.moveEast(0, None, screenChanges)
+    assert cache.numRepairs == 0 # nothing is done until the map is needed
+    dmap = cache.getMap(Alignment.FRIENDLY)
+    assert (cache.numMisses, cache.numRepairs, cache.numInvalidations) == (1, 2, 0)
+    assert (dmap.valueAt(0, 0), dmap.valueAt(1, 0)) == (1, 0)
+    screenChanges.generalRoomChanges(room)
+    assert cache.numInvalidations == 1
+
+
+def test_flowFieldIsRebuiltAfterManyChanges():
+    room, player, mobiles = makeRoomWithPlayer()
+    screenChanges = ScreenChanges()
+    cache = flowFieldCacheFor(room)
+    cache.getMap(Alignment.FRIENDLY)
+    # Two steps between uses still only moves the target from one cell to another.
+    player.moveEast(0, None, screenChanges)
+    player.moveSouth(0, None, screenChanges)
+    cache.getMap(Alignment.FRIENDLY)
+    assert (cache.numMisses, cache.numRepairs, cache.numInvalidations) == (1, 2, 0)
+    cache.maxRepairs = 1
+    player.moveEast(0, None, screenChanges)
+    dmap = cache.getMap(Alignment.FRIENDLY)
+    assert (cache.numMisses, cache.numRepairs, cache.numInvalidations) == (2, 2, 1)
+    assert dmap.valueAt(2, 1) == 0
+
+
+def makeMapWithSources(room, sources):
+    dmap = DijkstraMap(room)
+    for x, y in sources:
+        dmap.setValueAt(x, y, 0)
+    dmap.populateValues()
+    return dmap
+
+
+def test_repairsMatchFullRecompute():
+    rng = random.Random(0)
+    for trial in range(40):
+        width = rng.randrange(2, 12)
+        height = rng.randrange(2, 12)
+        room = Room([[objects.BrickWall() if rng.random() < 0.25 else objects.Dirt() for x in range(width)]
+                     for y in range(height)])
+        dmap = DijkstraMap(room)
+        openCells = [(x, y) for y in range(height) for x in range(width) if dmap.valueAt(x, y) is not IMPASSABLE]
+        if not openCells:
+            continue
+        sources = set(rng.sample(openCells, rng.randrange(1, min(4, len(openCells)) + 1)))
+        dmap = makeMapWithSources(room, sources)
+        for move in range(30):
+            # Move a source one step, or add or remove one now and then.
+            if not sources:
+                newSource = rng.choice(openCells)
+                dmap.addSource(*newSource)
+                sources.add(newSource)
+            source = rng.choice(sorted(sources))
+            x, y = source
+            newPosition = rng.choice([(x-1, y), (x+1, y), (x, y-1), (x, y+1)])
+            if rng.random() < 0.1 and len(sources) > 1:
+                dmap.removeSource(*source)
+                sources.remove(source)
+            elif newPosition in openCells and newPosition not in sources:
+                dmap.removeSource(*source)
+                sources.remove(source)
+                if rng.random() < 0.9:
+                    dmap.addSource(*newPosition)
+                    sources.add(newPosition)
+            elif rng.random() < 0.1:
+                newSource = rng.choice(openCells)
+                if newSource not in sources:
+                    dmap.addSource(*newSource)
+                    sources.add(newSource)
+            assert dmap.data == makeMapWithSources(room, sources).data
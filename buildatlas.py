@@ -0,0 +1,86 @@
+#
+# Builds a texture atlas for a directory of images: all the images packed into one big
+# image, plus an index saying where each one is. ImageLibrary loads the atlas (in one
+# read) the first time any image is needed, instead of loading each of the files. Run it with
+#
+#    python buildatlas.py [subdir ...]
+#
+# whenever images are added to, changed in, or removed from one of the subdirs of ./img
+# (the default is drawntiles64), and commit the files it writes.
+#
+
+import json
+import os
+import sys
+import pygame
+from images import ATLAS_DIR
+
+MAX_ATLAS_WIDTH = 2048
+
+
+def packImages(sizes, atlasWidth):
+    """Given a list of (width, height), decides where each goes in an atlas atlasWidth
+    pixels wide (or as wide as the widest image). Taking the tallest images first, each
+    is put wherever its bottom edge will be highest up, resting on the "skyline" formed by
+    the images already placed. Returns (list of (x, y) in the same order as sizes, atlas size)."""
+    atlasWidth = max([atlasWidth] + [width for width, height in sizes])
+    skyline = [(0, 0, atlasWidth)] # list of (x, y, width), left to right: the first free y over each stretch
+    positions = [None] * len(sizes)
+    for i in sorted(range(len(sizes)), key=lambda i: -sizes[i][1]):
+        width, height = sizes[i]
+        best = None # (bottom, x, y)
+        for x, ignoredY, ignoredWidth in skyline:
+            if x + width > atlasWidth:
+                break
+            y = max(segY for segX, segY, segWidth in skyline if segX < x + width and segX + segWidth > x)
+            if best is None or y + height < best[0]:
+                best = (y + height, x, y)
+        bottom, x, y = best
+        positions[i] = x, y
+        newSkyline = [(segX, segY, min(segX + segWidth, x) - segX) for segX, segY, segWidth in skyline if segX < x]
+        newSkyline.append((x, bottom, width))
+        for segX, segY, segWidth in skyline:
+            if segX + segWidth > x + width:
+                left = max(segX, x + width)
+                newSkyline.append((left, segY, segX + segWidth - left))
+        skyline = newSkyline
+    atlasHeight = max(y + height for (x, y), (width, height) in zip(positions, sizes))
+    return positions, (atlasWidth, atlasHeight)
+
+
+def smallestPacking(sizes):
+    """Tries packImages() with atlas widths in steps of 32 pixels, and returns the result
+    with the smallest area. (Every pixel of the atlas, even an empty one, has to be
+    decoded when it is loaded.)"""
+    packings = [packImages(sizes, atlasWidth) for atlasWidth in range(32, MAX_ATLAS_WIDTH + 1, 32)]
+    return min(packings, key=lambda packing: packing[1][0] * packing[1][1])
+
+
+def buildAtlas(subdir):
+    """Writes ATLAS_DIR/subdir.bmp and ATLAS_DIR/subdir.json from the .png files in
+    ./img/subdir. The index lists the images in order by id (which is the sorted order
+    of the filenames, as LibraryWithIds uses), each with its name and [x, y, width, height]
+    in the atlas."""
+    directory = f'./img/{subdir}'
+    names = sorted(file[:-len('.png')] for file in os.listdir(directory) if file.endswith('.png'))
+    images = [pygame.image.load(f'{directory}/{name}.png') for name in names]
+    positions, atlasSize = smallestPacking([image.get_size() for image in images])
+    atlas = pygame.Surface(atlasSize, pygame.SRCALPHA)
+    atlas.fill((0, 0, 0, 0))
+    index = {'images': []}
+    for name, image, position in zip(names, images, positions):
+        atlas.blit(image, position, special_flags=pygame.BLEND_RGBA_MAX) # copies, since the atlas is all zeros
+        index['images'].append({'name': name, 'rect': list(position) + list(image.get_size())})
+    os.makedirs(ATLAS_DIR, exist_ok=True)
+    # An uncompressed .bmp, not a .png: for drawntiles64 it is about 9 times as big, but
+    # loading it is a copy rather than a decompression, and takes 0.25 ms instead of 4.2 ms.
+    pygame.image.save(atlas, f'{ATLAS_DIR}/{subdir}.bmp')
+    with open(f'{ATLAS_DIR}/{subdir}.json', 'w') as indexFile:
+        # one image per line, so changes to it are easy to read in a diff
+        indexFile.write('{"images": [\n' + ',\n'.join(json.dumps(entry) for entry in index['images']) + '\n]}\n')
+    print(f'Packed {len(names)} images from {directory} into a {atlasSize[0]}x{atlasSize[1]} atlas.')
+
+
+if __name__ == '__main__':
+    for subdir in sys.argv[1:] or ['drawntiles64']:
+        buildAtlas(subdir)
@@ -1,9 +1,13 @@
 import copy
+import struct
+from wireformat import writeVarint, writeUInt16
 
 
 class ClientDataStructure:
     """Common parent class for some types which are intended to be passed around in the
-    messages sent to the front-end."""
+    messages sent to the front-end. Each can be converted to JSON and also to the
+    compact binary wire format."""
+    __slots__ = ()
     def toJSON(self):
         raise NotImplementedError # subclasses should implement this
 
@@ -11,19 +15,42 @@ class ClientDataStructure:
     def fromJSON(cls):
         raise NotImplementedError # subclasses should implement this
 
+    def writeBinary(self, buffer):
+        """Appends the binary form of this to the bytearray buffer."""
+        raise NotImplementedError # subclasses should implement this
+
+    @classmethod
+    def readBinary(cls, reader):
+        """Reads one of these from a wireformat.ByteReader."""
+        raise NotImplementedError # subclasses should implement this
+
 
 class CellData(ClientDataStructure):
     """In JSON, a CellData is EITHER a number (representing the single tileId in that
     location) OR a list of numbers (representing the stack of tiles in that
     location)."""
+    __slots__ = ('_tileIds',)
     def __init__(self, tileIds):
         """Initialize a cell from a tuple of tileIds."""
         assert isinstance(tileIds, tuple)
         self._tileIds = tileIds
 
+    _sharedByTileIds = {} # map of tileIds -> CellData, for shared()
+
     def __eq__(self, other):
         return isinstance(other, CellData) and  self._tileIds == other._tileIds
 
+    @classmethod
+    def shared(cls, tileIds):
+        """Returns a CellData for the tuple tileIds, reusing one made earlier if there
+        is one. (CellDatas are never modified, so a room only needs one for each
+        different stack of tiles.)"""
+        cellData = cls._sharedByTileIds.get(tileIds)
+        if cellData is None:
+            cellData = cls(tileIds)
+            cls._sharedByTileIds[tileIds] = cellData
+        return cellData
+
     @classmethod
     def fromJSON(cls, json):
         """Initialize a cell from the corresponding JSON."""
@@ -42,9 +69,29 @@ class CellData(ClientDataStructure):
             return list(self._tileIds)
 
     def tileIds(self):
-        """Returns an iterable of the items in this cell."""
-        for x in self._tileIds:
-            yield x
+        """Returns a tuple of the items in this cell."""
+        return self._tileIds
+
+    def writeBinary(self, buffer):
+        """In binary, most cells hold a single tile, so that case is written as one
+        varint of (tileId << 1), which is a single byte for tileIds below 64. Any
+        other cell is written as a varint of ((number of tiles << 1) | 1) followed by
+        each tileId as a varint."""
+        if len(self._tileIds) == 1:
+            writeVarint(buffer, self._tileIds[0] << 1)
+        else:
+            writeVarint(buffer, (len(self._tileIds) << 1) | 1)
+            for tileId in self._tileIds:
+                writeVarint(buffer, tileId)
+
+    @classmethod
+    def readBinary(cls, reader):
+        firstValue = reader.readVarint()
+        if firstValue & 1 == 0:
+            return cls(tileIds=(firstValue >> 1,))
+        else:
+            numTiles = firstValue >> 1
+            return cls(tileIds=tuple(reader.readVarint() for i in range(numTiles)))
 
 
 class GridData(ClientDataStructure):
@@ -56,6 +103,10 @@ class GridData(ClientDataStructure):
         self.height = height
         self._allCells = allCells
 
+    def tileIdsUsed(self):
+        """Returns a set of every tileId that appears somewhere in the grid."""
+        return {tileId for cellData in self._allCells for tileId in cellData.tileIds()}
+
     @classmethod
     def fromJSON(cls, json):
         """Initialize a grid from the corresponding JSON."""
@@ -74,6 +125,38 @@ class GridData(ClientDataStructure):
         """Return this Grid in JSON format."""
         return [[self.cellAt(x,y).toJSON() for x in range(self.width)] for y in range(self.height)]
 
+    def writeBinary(self, buffer):
+        """In binary, a GridData is the width and height as uint16 followed by each
+        cell in the same order as _allCells."""
+        writeUInt16(buffer, self.width)
+        writeUInt16(buffer, self.height)
+        for cellData in self._allCells:
+            tileIds = cellData._tileIds
+            if len(tileIds) == 1 and tileIds[0] < 0x40:
+                buffer.append(tileIds[0] << 1) # the common case, inlined because rooms are big
+            else:
+                cellData.writeBinary(buffer)
+
+    @classmethod
+    def readBinary(cls, reader):
+        width = reader.readUInt16()
+        height = reader.readUInt16()
+        allCells = []
+        byteStr = reader.byteStr
+        singleTileCells = {} # single-tile CellDatas are never modified, so they can be shared
+        for i in range(width * height):
+            byte = byteStr[reader.position]
+            if byte < 0x80 and byte & 1 == 0:
+                cellData = singleTileCells.get(byte)
+                if cellData is None:
+                    cellData = CellData((byte >> 1,))
+                    singleTileCells[byte] = cellData
+                reader.position += 1
+            else:
+                cellData = CellData.readBinary(reader)
+            allCells.append(cellData)
+        return cls(width, height, allCells)
+
     def cellAt(self, x, y):
         """Returns the CellData at the specified x,y location (which must be valid for this GridData)."""
         assert 0 <= x < self.width
@@ -106,6 +189,25 @@ class GridDataChange(ClientDataStructure):
         """Return this GridChange in JSON format."""
         return [[x, y, cellData.toJSON()] for x, y, cellData in self._changes]
 
+    def writeBinary(self, buffer):
+        """In binary, a GridDataChange is the number of changes followed by x, y and
+        the cell for each one."""
+        writeVarint(buffer, len(self._changes))
+        for x, y, cellData in self._changes:
+            writeVarint(buffer, x)
+            writeVarint(buffer, y)
+            cellData.writeBinary(buffer)
+
+    @classmethod
+    def readBinary(cls, reader):
+        numChanges = reader.readVarint()
+        changes = []
+        for i in range(numChanges):
+            x = reader.readVarint()
+            y = reader.readVarint()
+            changes.append((x, y, CellData.readBinary(reader)))
+        return cls(changes=changes)
+
     def changes(self):
         """Returns an iterator of (x, y, CellData) tuples."""
         return iter(self._changes)
@@ -151,6 +253,23 @@ class VisibleData(ClientDataStructure):
         """Return this DisplayedPlayerData in JSON format."""
         return copy.copy(self.__dict__)
 
+    # Health can drop by fractional amounts, so these are sent as doubles.
+    _BINARY_FORMAT = struct.Struct('<4d')
+
+    def writeBinary(self, buffer):
+        buffer.extend(self._BINARY_FORMAT.pack(self.health, self.maxHealth, self.mana, self.maxMana))
+
+    @classmethod
+    def readBinary(cls, reader):
+        health, maxHealth, mana, maxMana = reader.readStruct(cls._BINARY_FORMAT)
+        return cls(_intIfWhole(health), _intIfWhole(maxHealth), _intIfWhole(mana), _intIfWhole(maxMana))
+
+
+def _intIfWhole(value):
+    """Doubles read from the wire come back as floats; this turns 10.0 back into 10
+    so the values look the same as they did on the server."""
+    return int(value) if value.is_integer() else value
+
 
 class InventoryItemData(ClientDataStructure):
     """This represents a single item in an inventory. It is defined as:
@@ -183,6 +302,20 @@ class InventoryItemData(ClientDataStructure):
         """Return this in JSON format."""
         return [self.uniqueId, self.tileId, self.featureCode]
 
+    def writeBinary(self, buffer):
+        """In binary this is the uniqueId and tileId as varints and then the one
+        character featureCode as a single byte."""
+        writeVarint(buffer, self.uniqueId)
+        writeVarint(buffer, self.tileId)
+        buffer.append(ord(self.featureCode))
+
+    @classmethod
+    def readBinary(cls, reader):
+        uniqueId = reader.readVarint()
+        tileId = reader.readVarint()
+        featureCode = chr(reader.readByte())
+        return cls(uniqueId, tileId, featureCode)
+
     def isWeapon(self):
         return self.featureCode == "W"
 
@@ -222,3 +355,22 @@ class InventoryData(ClientDataStructure):
             "wieldedWeaponId": self.wieldedWeaponId,
             "wieldedWandId": self.wieldedWandId,
         }
+
+    def writeBinary(self, buffer):
+        """In binary this is the number of items, each item, and then the two wielded
+        ids. The wielded ids are written as id+1 so that 0 can stand for None."""
+        writeVarint(buffer, len(self.items))
+        for item in self.items:
+            item.writeBinary(buffer)
+        writeVarint(buffer, 0 if self.wieldedWeaponId is None else self.wieldedWeaponId + 1)
+        writeVarint(buffer, 0 if self.wieldedWandId is None else self.wieldedWandId + 1)
+
+    @classmethod
+    def readBinary(cls, reader):
+        numItems = reader.readVarint()
+        items = [InventoryItemData.readBinary(reader) for i in range(numItems)]
+        wieldedWeaponId = reader.readVarint() - 1
+        wieldedWandId = reader.readVarint() - 1
+        return cls(items,
+                   None if wieldedWeaponId == -1 else wieldedWeaponId,
+                   None if wieldedWandId == -1 else wieldedWandId)
@@ -121,3 +121,19 @@ def test_InventoryData_1():
     jsonData = {"items": [[4392479488, 3, "N"], [4392386512, 4, "S"]], "wieldedWeaponId": None, "wieldedWandId": 4392386512}
     inventoryData = InventoryData.fromJSON(jsonData)
     assert inventoryData.toJSON() == jsonData
+
+
+def test_CellData_binary():
+    from wireformat import ByteReader
+    for tileIds in [(6,), (), (5, 13), (300,), (0, 70000, 2)]:
+        buffer = bytearray()
+        CellData(tileIds).writeBinary(buffer)
+        reader = ByteReader(bytes(buffer))
+        assert CellData.readBinary(reader) == CellData(tileIds)
+        assert reader.isAtEnd()
+
+
+def test_CellData_shared():
+    assert CellData.shared((5, 13)) is CellData.shared((5, 13))
+    assert CellData.shared((5, 13)) == CellData((5, 13))
+    assert not hasattr(CellData((5,)), "__dict__")
@@ -1,5 +1,6 @@
 
 import pygame
+from concurrent.futures import ThreadPoolExecutor
 from infotext import InfoTextPainter
 from images import TILE_SIZE
 from inventory_view import LocalInventoryView, RemoteInventoryView
@@ -15,25 +16,121 @@ PURPLE = (144, 9, 189)
 STARTING_WIDTH_IN_TILES = 16
 STARTING_HEIGHT_IN_TILES = 9
 CONSOLE_HEIGHT_IN_PIXELS = 6 * 19
+PREFETCH_THREADS = 2 # threads for loading images in the background; 0 turns it off
+
+
+class CellImageCache:
+    """Most cells in a room are one of a few stacks of tiles, such as just dirt or a player
+    standing on dirt. This keeps a single image for each stack (the tiles drawn on top of
+    each other over black) so a cell can be drawn with one blit. It holds the maxSize most
+    recently used stacks."""
+
+    def __init__(self, maxSize=256):
+        self.maxSize = maxSize
+        self.imageByTileIds = {} # map of tuple of tileIds -> image, least recently used first
+        self.imageLibrary = None # the library the images were made from
+        self.numHits = 0
+        self.numMisses = 0
+
+    def __len__(self):
+        return len(self.imageByTileIds)
+
+    def clear(self):
+        self.imageByTileIds.clear()
+
+    def imageFor(self, tileIds, imageLibrary):
+        """Returns an image of the tiles in the tuple tileIds drawn in order."""
+        if imageLibrary is not self.imageLibrary:
+            self.clear()
+            self.imageLibrary = imageLibrary
+        imageByTileIds = self.imageByTileIds
+        image = imageByTileIds.pop(tileIds, None)
+        if image is None:
+            self.numMisses += 1
+            image = pygame.Surface((TILE_SIZE, TILE_SIZE))
+            image.fill(BLACK)
+            for tileId in tileIds:
+                image.blit(imageLibrary.lookupById(tileId), (0, 0))
+            if len(imageByTileIds) >= self.maxSize:
+                del imageByTileIds[next(iter(imageByTileIds))]
+        else:
+            self.numHits += 1
+        imageByTileIds[tileIds] = image # (re)inserted so it is the most recently used
+        return image
 
 
 class PygameGridDisplay:
+    """Draws the grid. It keeps its own offscreen copy of what it drew last time, along
+    with the CellData shown in each spot, so each frame it only has to draw the cells
+    that changed (or that have something different scrolled into them)."""
+
+    def __init__(self):
+        self.surface = None # offscreen copy of the grid area, or None if nothing was drawn yet
+        self.shownCells = None # list of the CellData drawn in each spot (row by row), None for empty spots
+        self.cellImageCache = CellImageCache()
+
+    def invalidate(self):
+        """Forgets what was drawn, so the next call to show() redraws everything."""
+        self.surface = None
+        self.shownCells = None
+
     def show(self, screen, position, gridData, uiState, imageLibrary):
         """Draws the display to the screen. screen is the surface on which to draw and position is
         a rect within which it should do the drawing. For now, it is an error if the width and
-        height of position are not multiples of TILE_SIZE."""
+        height of position are not multiples of TILE_SIZE.
+
+        Only the cells that differ from what was drawn last time are drawn. It returns a
+        list of the rects (in screen coordinates) that were changed."""
         assert isinstance(gridData, GridData)
-        screen.fill(BLACK, position)
         screenWidth, screenHeight = uiState.screenWidthAndHeight
         assert position.width == TILE_SIZE * screenWidth
         assert position.height == TILE_SIZE * screenHeight
-        for screenY in range(min(screenHeight, gridData.height)):
-            for screenX in range(min(screenWidth, gridData.width)):
-                offsetX, offsetY = uiState.offset
-                cellData = gridData.cellAt(screenX + offsetX, screenY + offsetY)
-                for tileId in cellData.tileIds():
-                    image = imageLibrary.lookupById(tileId)
-                    screen.blit(image, (position.left + TILE_SIZE * screenX, position.top + TILE_SIZE * screenY))
+        if self.surface is None or self.surface.get_size() != position.size:
+            self.surface = pygame.Surface(position.size, 0, screen)
+            self.surface.fill(BLACK)
+            self.shownCells = [None] * (screenWidth * screenHeight)
+            redrawAll = True
+        else:
+            redrawAll = False
+        surface = self.surface
+        shownCells = self.shownCells
+        offsetX, offsetY = uiState.offset
+        visibleWidth = min(screenWidth, gridData.width - offsetX)
+        visibleHeight = min(screenHeight, gridData.height - offsetY)
+        dirtyRects = []
+        for screenY in range(screenHeight):
+            for screenX in range(screenWidth):
+                if screenX < visibleWidth and screenY < visibleHeight:
+                    cellData = gridData.cellAt(screenX + offsetX, screenY + offsetY)
+                else:
+                    cellData = None
+                shownIndex = screenY * screenWidth + screenX
+                shownCellData = shownCells[shownIndex]
+                if cellData is shownCellData or cellData == shownCellData:
+                    continue
+                cellRect = pygame.Rect(TILE_SIZE * screenX, TILE_SIZE * screenY, TILE_SIZE, TILE_SIZE)
+                self.drawCell(surface, cellRect, cellData, imageLibrary)
+                shownCells[shownIndex] = cellData
+                dirtyRects.append(cellRect.move(position.left, position.top))
+        if redrawAll:
+            dirtyRects = [position.copy()]
+        for rect in dirtyRects:
+            self.restore(screen, position, rect)
+        return dirtyRects
+
+    def drawCell(self, surface, cellRect, cellData, imageLibrary):
+        """Draws cellData (or black, if it is None) onto surface at cellRect."""
+        if cellData is None:
+            surface.fill(BLACK, cellRect)
+        else:
+            surface.blit(self.cellImageCache.imageFor(cellData.tileIds(), imageLibrary), cellRect)
+
+    def restore(self, screen, position, rect):
+        """Copies the grid as last drawn back onto the part of the screen in rect (in screen
+        coordinates), such as after something has been drawn over it."""
+        area = rect.clip(position)
+        if area.width and area.height:
+            screen.blit(self.surface, area, area.move(-position.left, -position.top))
 
 
 class PygameOverlayDisplay:
@@ -44,6 +141,8 @@ class PygameOverlayDisplay:
         self.infoTextPainter = InfoTextPainter()
 
     def show(self, uiState, imageLibrary):
+        """Draws the UI components. Returns a list of the rects that were drawn on."""
+        drawnRects = []
         # health and mana bars
         if uiState.visibleData:
             BAR_SPACE = 5
@@ -74,14 +173,18 @@ class PygameOverlayDisplay:
             self.surface.fill(BLACK, manaBorderRect)
             self.surface.fill(LIGHT_GREY, maxManaRect)
             self.surface.fill(PURPLE, manaRect)
+            drawnRects.extend([healthBorderRect, manaBorderRect])
 
         # InfoTexts
         if uiState.infoTexts:
-            self.infoTextPainter.paintInfoText(self.surface, uiState.infoTexts[0])
+            drawnRects.append(self.infoTextPainter.paintInfoText(self.surface, uiState.infoTexts[0]))
 
         # inventory
         if uiState.inventoryView:
             uiState.inventoryView.show(self.surface, imageLibrary)
+            drawnRects.append(self.surface.get_rect()) # it draws all over, so just count the whole thing
+
+        return drawnRects
 
 
 class PygameDisplay:
@@ -106,12 +209,39 @@ class PygameDisplay:
         self.gridDisplay = PygameGridDisplay()
         self.overlayDisplay = PygameOverlayDisplay(self.screen)
         self.console = Console(self.consolePosition.size)
+        self.overlayRects = [] # the rects the overlay drew on last frame
+        self.prefetchExecutor = ThreadPoolExecutor(PREFETCH_THREADS) if PREFETCH_THREADS else None
+        self.shownConsoleBackground = None # the console's background as of the last frame
 
     def show(self, gridData, imageLibrary):
-        self.gridDisplay.show(self.screen, self.gridPosition, gridData, self.uiState, imageLibrary)
-        self.overlayDisplay.show(self.uiState, imageLibrary)
+        """Draws a frame. Only the parts of the screen that changed are sent to the
+        display."""
+        dirtyRects = self.gridDisplay.show(self.screen, self.gridPosition, gridData, self.uiState, imageLibrary)
+        # Put back the grid from under last frame's overlay, since the overlay may have changed.
+        for rect in self.overlayRects:
+            self.gridDisplay.restore(self.screen, self.gridPosition, rect)
+        dirtyRects.extend(self.overlayRects)
+        self.overlayRects = self.overlayDisplay.show(self.uiState, imageLibrary)
+        dirtyRects.extend(self.overlayRects)
         self.console.show(self.screen, self.consolePosition)
-        pygame.display.flip()
+        if self.console.background is not self.shownConsoleBackground or \
+                self.consolePosition.collidelist(dirtyRects) != -1:
+            self.shownConsoleBackground = self.console.background
+            dirtyRects.append(self.consolePosition)
+        if dirtyRects:
+            pygame.display.update(dirtyRects)
+
+    def newRoom(self, gridData):
+        """Call this when the room being shown is replaced by another. The whole grid is
+        redrawn on the next show(), so nothing from the old room can be left behind."""
+        self.uiState.newRoom(gridData)
+        self.gridDisplay.invalidate()
+
+    def prefetchImagesFor(self, gridData, imageLibrary):
+        """Call this when a room is about to be shown; it starts loading (in the background)
+        any of the images it needs that haven't been loaded yet."""
+        if self.prefetchExecutor is not None:
+            imageLibrary.prefetch(gridData.tileIdsUsed(), self.prefetchExecutor)
 
     def playSounds(self, soundEffectIds, soundLibrary):
         """Causes the display to begin playing each of the sounds whose sound effect
@@ -131,6 +261,8 @@ class PygameDisplay:
         return pygame.event.get()
 
     def quit(self):
+        if self.prefetchExecutor is not None:
+            self.prefetchExecutor.shutdown(cancel_futures=True)
         pygame.quit()
 
 
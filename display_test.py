@@ -0,0 +1,81 @@
+#
+# Unit tests for display using the pytest library
+#
+
+import pygame
+pygame.init()
+from clientdata import GridData, CellData
+from display import PygameGridDisplay, CellImageCache, UIState
+from images import TILE_SIZE
+
+
+class SolidColorLibrary:
+    """Stands in for an ImageLibrary; tile n is a square of a color made from n."""
+    def lookupById(self, tileId):
+        image = pygame.Surface((TILE_SIZE, TILE_SIZE))
+        image.fill((tileId * 10, 0, 0))
+        return image
+
+
+def makeGridData(width, height, tileIdAt):
+    return GridData(width, height, [CellData((tileIdAt(x, y),)) for y in range(height) for x in range(width)])
+
+
+def showGrid(gridDisplay, screen, gridData, uiState):
+    return gridDisplay.show(screen, screen.get_rect(), gridData, uiState, SolidColorLibrary())
+
+
+def test_onlyChangedCellsAreRedrawn():
+    uiState = UIState(4, 3)
+    screen = pygame.Surface((4 * TILE_SIZE, 3 * TILE_SIZE))
+    gridDisplay = PygameGridDisplay()
+    gridData = makeGridData(6, 3, lambda x, y: 1)
+    assert showGrid(gridDisplay, screen, gridData, uiState) == [screen.get_rect()]
+    assert showGrid(gridDisplay, screen, gridData, uiState) == []
+
+    gridData = makeGridData(6, 3, lambda x, y: 2 if (x, y) == (1, 2) else 1)
+    assert showGrid(gridDisplay, screen, gridData, uiState) == [pygame.Rect(TILE_SIZE, 2 * TILE_SIZE, TILE_SIZE, TILE_SIZE)]
+    assert screen.get_at((TILE_SIZE, 2 * TILE_SIZE))[:3] == (20, 0, 0)
+
+    # Scrolling east by one moves the changed cell over; only the spots that differ are drawn.
+    uiState.offset = 1, 0
+    dirtyRects = showGrid(gridDisplay, screen, gridData, uiState)
+    assert sorted((rect.x // TILE_SIZE, rect.y // TILE_SIZE) for rect in dirtyRects) == [(0, 2), (1, 2)]
+    assert screen.get_at((0, 2 * TILE_SIZE))[:3] == (20, 0, 0)
+
+
+def test_spotsOutsideASmallerRoomAreCleared():
+    uiState = UIState(4, 3)
+    screen = pygame.Surface((4 * TILE_SIZE, 3 * TILE_SIZE))
+    gridDisplay = PygameGridDisplay()
+    showGrid(gridDisplay, screen, makeGridData(4, 3, lambda x, y: 1), uiState)
+    dirtyRects = showGrid(gridDisplay, screen, makeGridData(3, 3, lambda x, y: 1), uiState)
+    assert [(rect.x // TILE_SIZE, rect.y // TILE_SIZE) for rect in dirtyRects] == [(3, 0), (3, 1), (3, 2)]
+    assert screen.get_at((3 * TILE_SIZE, 0))[:3] == (0, 0, 0)
+
+
+def test_cellImageCacheKeepsTheMostRecentlyUsed():
+    cache = CellImageCache(maxSize=2)
+    imageLibrary = SolidColorLibrary()
+    image = cache.imageFor((1, 2), imageLibrary)
+    assert image.get_at((0, 0))[:3] == (20, 0, 0)
+    assert cache.imageFor((1, 2), imageLibrary) is image
+    cache.imageFor((3,), imageLibrary)
+    cache.imageFor((1, 2), imageLibrary)
+    cache.imageFor((4,), imageLibrary) # pushes out (3,)
+    assert set(cache.imageByTileIds) == {(1, 2), (4,)}
+    assert (cache.numHits, cache.numMisses) == (2, 3)
+    cache.imageFor((4,), SolidColorLibrary()) # a different library starts over
+    assert len(cache) == 1
+
+
+def test_invalidateRedrawsEverything():
+    uiState = UIState(4, 3)
+    screen = pygame.Surface((4 * TILE_SIZE, 3 * TILE_SIZE))
+    gridDisplay = PygameGridDisplay()
+    gridData = makeGridData(4, 3, lambda x, y: 1)
+    showGrid(gridDisplay, screen, gridData, uiState)
+    screen.fill((0, 0, 255)) # as if something else had drawn over the screen
+    gridDisplay.invalidate()
+    assert showGrid(gridDisplay, screen, gridData, uiState) == [screen.get_rect()]
+    assert screen.get_at((3 * TILE_SIZE, 2 * TILE_SIZE))[:3] == (10, 0, 0)
@@ -1,4 +1,7 @@
-import pygame
+try:
+    import pygame
+except ImportError:
+    pygame = None # only addPygameEvents() needs it
 
 
 class KeyCode:
@@ -17,7 +20,7 @@ class KeyCode:
 
     
 
-pygameKeyToKeyCode = {
+pygameKeyToKeyCode = {} if pygame is None else {
     pygame.K_w: KeyCode.GO_UP,
     pygame.K_s: KeyCode.GO_DOWN,
     pygame.K_a: KeyCode.GO_LEFT,
@@ -50,6 +53,7 @@ keyCodeToIsAction = {
 
 class Event:
     """Parent class for all events."""
+    __slots__ = ()
     def isActionEvent(self):
         """Returns True if this event can only be processed when the player
         has an action and False otherwise."""
@@ -57,22 +61,26 @@ class Event:
 
 class QuitGameEvent(Event):
     """An event for when the game is going to exit (on the server)."""
+    __slots__ = ()
     pass
 
 class NewPlayerAddedEvent(Event):
     """An event for when it is discovered that a new player needs to be
     added at the next update stage."""
+    __slots__ = ('playerCatalogEntry', 'clientConnection')
     def __init__(self, playerCatalogEntry, clientConnection):
         self.playerCatalogEntry = playerCatalogEntry
         self.clientConnection = clientConnection
 
 class PlayerEvent(Event):
     """Any event that affects a specific player."""
+    __slots__ = ('playerId',)
     def __init__(self, playerId):
         self.playerId = playerId
 
 class KeyPressedEvent(PlayerEvent):
     """An event where a key was pressed on the controls for a player."""
+    __slots__ = ('keyCode',)
     def __init__(self, playerId, keyCode):
         super().__init__(playerId)
         self.keyCode = keyCode
@@ -80,11 +88,13 @@ class KeyPressedEvent(PlayerEvent):
         return keyCodeToIsAction[self.keyCode]
 
 class ItemDroppedEvent(PlayerEvent):
+    __slots__ = ('itemUniqueId',)
     def __init__(self, playerId, itemUniqueId):
         super().__init__(playerId)
         self.itemUniqueId = itemUniqueId
 
 class EquipItemEvent(PlayerEvent):
+    __slots__ = ('equipmentTypeCode', 'itemUniqueId')
     def __init__(self, playerId, equipmentTypeCode, itemUniqueId):
         super().__init__(playerId)
         self.equipmentTypeCode = equipmentTypeCode
@@ -92,11 +102,13 @@ class EquipItemEvent(PlayerEvent):
 
 class ClientConnectEvent(PlayerEvent):
     """An event where a new client is connecting to a specific player."""
+    __slots__ = ()
     def __init__(self, playerId):
         super().__init__(playerId)
 
 class ClientDisconnectEvent(PlayerEvent):
     """An event where a client DISCONNECTS from a specific player."""
+    __slots__ = ()
     def __init__(self, playerId):
         super().__init__(playerId)
 
@@ -112,10 +124,15 @@ class EventList:
         """Remove all events."""
         self.actionEvents.clear()
         self.nonActionEvents.clear()
+    def isEmpty(self):
+        return not self.actionEvents and not self.nonActionEvents
     def getNonActionEvents(self):
         """Returns a list of all the events that do not need to wait until
         some player has a free action before they are processed."""
         return self.nonActionEvents
+    def getActionEvents(self):
+        """Returns a list of (playerId, actionEvent) for each player who has one."""
+        return list(self.actionEvents.items())
     def getFirstActionEvent(self, playerId):
         """Returns the first actionEvent (event which requires a player to
         have a free action) if there is one, or an empty list if there aren't
@@ -1,50 +1,102 @@
 
 import json
-import copy
 import select
+import asyncio
+import struct
+import time
+import random
 from socket import socket, AF_INET, SOCK_DGRAM
-from collections import defaultdict
+from collections import defaultdict, deque
 from clientdata import GridData, GridDataChange, VisibleData, InventoryData
+from wireformat import ByteReader, writeVarint
 
 
 # Max number of bytes WE choose to allow in a UDP packet.
 UDP_MAX_SIZE = 4096
 
+# Default limit on how many packets are read from a socket in one tick, so that a flood
+# of packets cannot stall the game loop.
+MAX_PACKETS_PER_TICK = 64
+
+# In the binary codec, the first byte of a packet is this plus the message type number.
+# Every JSON packet starts with "{" (which is below this), so the two can be told apart.
+_BINARY_TYPE_BASE = 0x80
+
+# A packet starting with this byte is one fragment of a message too big for a single
+# packet. See fragmentDatagram().
+_FRAGMENT_MARKER = 0xFF
+_FRAGMENT_HEADER = struct.Struct('<BIHH') # marker, sequenceId, fragmentIndex, fragmentCount
+_FRAGMENT_PAYLOAD_SIZE = UDP_MAX_SIZE - _FRAGMENT_HEADER.size
+
+# A partly received message is thrown away if its other fragments don't arrive within
+# this many seconds.
+REASSEMBLY_TIMEOUT = 2.0
+# Limits on how much a client will hold while waiting for missing fragments.
+MAX_MESSAGES_BEING_REASSEMBLED = 8
+MAX_REASSEMBLY_BYTES = 1024 * 1024
+
+# The server sends a reliable message again if the client hasn't acknowledged it within
+# this many seconds. Each time it is resent the wait doubles, up to MAX_RETRANSMIT_TIMEOUT.
+RETRANSMIT_TIMEOUT = 0.25
+MAX_RETRANSMIT_TIMEOUT = 2.0
+# A client is taken to have gone away (and its connection is dropped) if a reliable
+# message has been resent this many times without being acknowledged, or if this many
+# reliable messages are waiting to be acknowledged.
+MAX_RETRANSMITS = 10
+MAX_UNACKNOWLEDGED = 256
+
 
 class Message:
     """An abstract parent for all of the message types."""
+    __slots__ = ()
     @classmethod
     def messageName(cls):
         className = cls.__name__
         assert className.endswith("Message")
         return className[:-7]
     def dataJSON(self):
-        return copy.copy(self.__dict__)
+        """By default the data is each of the fields in the subclass's __slots__,
+        in order. Subclasses with data that isn't plain JSON override this."""
+        return {name: getattr(self, name) for name in self.__slots__}
     def toJSON(self):
         return {"message": self.messageName(), "data": self.dataJSON()}
     def __repr__(self):
         return f"Message<{str(self)}>"
     def __str__(self):
         return str(self.toJSON())
-    def toBytes(self):
-        byteStr = json.dumps(self.toJSON(), separators=(',',':')).encode('utf-8')
-        if len(byteStr) > UDP_MAX_SIZE:
-            raise Exception("Message too long for our UDP buffers.")
-        return byteStr
+    def toBytes(self, codec=None):
+        """Returns the bytes to send for this message. codec is one of the codecs
+        in codecByName; if it is None the JSON codec will be used. The result may be
+        longer than UDP_MAX_SIZE, in which case it has to be fragmented to be sent."""
+        return (codec or jsonCodec).encode(self)
     @classmethod
     def fromDataJSON(cls, dataJSON):
         return cls(**dataJSON)
+    def writeDataBytes(self, buffer):
+        """Appends the data of this message to the bytearray buffer for the binary
+        codec. By default this is just the JSON of the data; subclasses that carry
+        bulky data override it with something more compact."""
+        buffer.extend(json.dumps(self.dataJSON(), separators=(',',':')).encode('utf-8'))
+    @classmethod
+    def fromDataBytes(cls, reader):
+        """Reads the data written by writeDataBytes() from a wireformat.ByteReader."""
+        return cls.fromDataJSON(json.loads(reader.readRest().decode('utf-8')))
 
 
         
 class JoinServerMessage(Message):
-    """A message sent when a client wants to sign on to a server."""
-    def __init__(self, playerId):
+    """A message sent when a client wants to sign on to a server. codecName says which
+    codec the client would like the server to use when sending to it; clients that
+    don't send one get JSON."""
+    __slots__ = ('playerId', 'codecName')
+    def __init__(self, playerId, codecName="json"):
         self.playerId = playerId
+        self.codecName = codecName
 
 class WelcomeClientMessage(Message):
     """A message the servers sends to a client immediately after they join. It
     includes everything needed for a NewRoomMessage."""
+    __slots__ = ('gridData',)
     def __init__(self, gridData):
         """Constructor. Accepts a GridData."""
         assert isinstance(gridData, GridData)
@@ -54,9 +106,15 @@ class WelcomeClientMessage(Message):
     @classmethod
     def fromDataJSON(cls, dataJSON):
         return cls(gridData=GridData.fromJSON(dataJSON))
+    def writeDataBytes(self, buffer):
+        self.gridData.writeBinary(buffer)
+    @classmethod
+    def fromDataBytes(cls, reader):
+        return cls(gridData=GridData.readBinary(reader))
 
 class NewRoomMessage(Message):
     """A message sent when a server wants a client to display a new room."""
+    __slots__ = ('gridData',)
     def __init__(self, gridData):
         """Constructor. Accepts a GridData."""
         assert isinstance(gridData, GridData)
@@ -66,10 +124,16 @@ class NewRoomMessage(Message):
     @classmethod
     def fromDataJSON(cls, dataJSON):
         return cls(gridData=GridData.fromJSON(dataJSON))
+    def writeDataBytes(self, buffer):
+        self.gridData.writeBinary(buffer)
+    @classmethod
+    def fromDataBytes(cls, reader):
+        return cls(gridData=GridData.readBinary(reader))
 
 class RefreshRoomMessage(Message):
     """A message sent when a server wants to refresh all the tiles in the
     current room."""
+    __slots__ = ('gridData',)
     def __init__(self, gridData):
         """Constructor. Accepts a GridData."""
         assert isinstance(gridData, GridData)
@@ -79,11 +143,17 @@ class RefreshRoomMessage(Message):
     @classmethod
     def fromDataJSON(cls, dataJSON):
         return cls(gridData=GridData.fromJSON(dataJSON))
+    def writeDataBytes(self, buffer):
+        self.gridData.writeBinary(buffer)
+    @classmethod
+    def fromDataBytes(cls, reader):
+        return cls(gridData=GridData.readBinary(reader))
 
 
 class UpdateRoomMessage(Message):
     """A message sent when a server wants to refresh just certain cells of the
     current room."""
+    __slots__ = ('gridDataChange',)
     def __init__(self, gridDataChange):
         """Constructor. Accepts a GridDataChange."""
         assert isinstance(gridDataChange, GridDataChange)
@@ -93,10 +163,16 @@ class UpdateRoomMessage(Message):
     @classmethod
     def fromDataJSON(cls, dataJSON):
         return cls(gridDataChange=GridDataChange.fromJSON(dataJSON))
+    def writeDataBytes(self, buffer):
+        self.gridDataChange.writeBinary(buffer)
+    @classmethod
+    def fromDataBytes(cls, reader):
+        return cls(gridDataChange=GridDataChange.readBinary(reader))
 
 class PlaySoundsMessage(Message):
     """A message sent by the server to instruct the client to begin playing some
     sounds."""
+    __slots__ = ('soundIds',)
     def __init__(self, soundIds):
         """Constructor. soundIds is a list of sound ids."""
         self.soundIds = soundIds
@@ -104,6 +180,7 @@ class PlaySoundsMessage(Message):
 class UpdateVisibleDataMessage(Message):
     """A message sent by the server to update the properties of the currently-displayed
     player."""
+    __slots__ = ('visibleData',)
     def __init__(self, visibleData):
         assert isinstance(visibleData, VisibleData)
         self.visibleData = visibleData
@@ -112,17 +189,25 @@ class UpdateVisibleDataMessage(Message):
     @classmethod
     def fromDataJSON(cls, dataJSON):
         return cls(visibleData=VisibleData.fromJSON(dataJSON))
+    def writeDataBytes(self, buffer):
+        self.visibleData.writeBinary(buffer)
+    @classmethod
+    def fromDataBytes(cls, reader):
+        return cls(visibleData=VisibleData.readBinary(reader))
 
 class KeyPressedMessage(Message):
     """A message sent when a client wants a server to know a key has been pressed."""
+    __slots__ = ('keyCode',)
     def __init__(self, keyCode):
         self.keyCode = keyCode
 
 class RequestInventoryMessage(Message):
     """A message a client sends to request the inventory of the current player."""
+    __slots__ = ()
 
 class InventoryMessage(Message):
     """A message the server sends on request to provide the current inventory of a player."""
+    __slots__ = ('inventoryData',)
     def __init__(self, inventoryData):
         self.inventoryData = inventoryData
     def dataJSON(self):
@@ -130,9 +215,15 @@ class InventoryMessage(Message):
     @classmethod
     def fromDataJSON(cls, dataJSON):
         return cls(inventoryData=InventoryData.fromJSON(dataJSON))
+    def writeDataBytes(self, buffer):
+        self.inventoryData.writeBinary(buffer)
+    @classmethod
+    def fromDataBytes(cls, reader):
+        return cls(inventoryData=InventoryData.readBinary(reader))
 
 class DropItemMessage(Message):
     """A message the client sends to have the current player drop an item."""
+    __slots__ = ('itemUniqueId',)
     def __init__(self, itemUniqueId):
         self.itemUniqueId = itemUniqueId
 
@@ -140,70 +231,430 @@ class EquipMessage(Message):
     """A message the client sends to have the current player wield a weapon or wand in their inventory.
     None can be used for the uniqueId which will un-wield an item. Attempting to wield an item not
     found in the inventory or an item of the wron type will have no affect."""
+    __slots__ = ('equipmentTypeCode', 'itemUniqueId')
     def __init__(self, equipmentTypeCode, itemUniqueId):
         self.equipmentTypeCode = equipmentTypeCode
         self.itemUniqueId = itemUniqueId
 
 class InfoTextMessage(Message):
     """A message the server sends to the client to queue up a text message to be displayed."""
+    __slots__ = ('text',)
     def __init__(self, text):
         self.text = text
 
 # FIXME: Wouldn't it be a better design if this contained a LIST of text messages?
 class ConsoleTextMessage(Message):
     """A message the server sends to the client to append a new text message onto the console."""
+    __slots__ = ('text',)
     def __init__(self, text):
         self.text = text
 
 class ClientShouldExitMessage(Message):
     """A message sent when the server is telling the client to quit playing."""
+    __slots__ = ()
 
 class ClientDisconnectingMessage(Message):
     """A message the client sends to the server when it is going to disconnect and
     no longer needs to receive updates."""
+    __slots__ = ()
+
+class ReliableMessage(Message):
+    """A message the server sends wrapped around one of the reliableMessageClasses. The
+    sequenceNumber counts up from 0 for each client; the client delivers these in order,
+    holding back any that arrive early, and acknowledges them with an AckMessage. These
+    are normally built by ServersideClientConnection.sendRaw() (using the codec's
+    encodeReliable()) rather than constructed directly."""
+    __slots__ = ('sequenceNumber', 'message')
+    def __init__(self, sequenceNumber, message):
+        self.sequenceNumber = sequenceNumber
+        self.message = message
+    def dataJSON(self):
+        return {"sequenceNumber": self.sequenceNumber, "message": self.message.toJSON()}
+    @classmethod
+    def fromDataJSON(cls, dataJSON):
+        return cls(dataJSON["sequenceNumber"], _jsonToMessage(dataJSON["message"]))
+    def writeDataBytes(self, buffer):
+        writeVarint(buffer, self.sequenceNumber)
+        buffer.extend(binaryCodec.encode(self.message))
+    @classmethod
+    def fromDataBytes(cls, reader):
+        sequenceNumber = reader.readVarint()
+        return cls(sequenceNumber, binaryCodec.decode(reader.readRest()))
+
+class AckMessage(Message):
+    """A message the client sends to say which ReliableMessages it has received. It has
+    every sequenceNumber below nextSequenceNumber, plus the ones in heldSequenceNumbers
+    (which arrived early and are waiting for a missing one)."""
+    __slots__ = ('nextSequenceNumber', 'heldSequenceNumbers')
+    def __init__(self, nextSequenceNumber, heldSequenceNumbers):
+        self.nextSequenceNumber = nextSequenceNumber
+        self.heldSequenceNumbers = heldSequenceNumbers
+    def writeDataBytes(self, buffer):
+        writeVarint(buffer, self.nextSequenceNumber)
+        for sequenceNumber in self.heldSequenceNumbers:
+            writeVarint(buffer, sequenceNumber)
+    @classmethod
+    def fromDataBytes(cls, reader):
+        nextSequenceNumber = reader.readVarint()
+        heldSequenceNumbers = []
+        while not reader.isAtEnd():
+            heldSequenceNumbers.append(reader.readVarint())
+        return cls(nextSequenceNumber, heldSequenceNumbers)
+
+class BatchMessage(Message):
+    """A message the server sends that packs several other messages into a single packet.
+    The receiver should handle the contained messages in order. These are normally
+    built by ServersideClientConnection.flush() (using the codec's encodeBatch())
+    rather than constructed directly."""
+    __slots__ = ('messages',)
+    def __init__(self, messages):
+        self.messages = messages
+    def dataJSON(self):
+        return [message.toJSON() for message in self.messages]
+    @classmethod
+    def fromDataJSON(cls, dataJSON):
+        return cls(messages=[_jsonToMessage(x) for x in dataJSON])
+    def writeDataBytes(self, buffer):
+        for message in self.messages:
+            byteStr = binaryCodec.encode(message)
+            writeVarint(buffer, len(byteStr))
+            buffer.extend(byteStr)
+    @classmethod
+    def fromDataBytes(cls, reader):
+        messages = []
+        while not reader.isAtEnd():
+            messages.append(binaryCodec.decode(reader.readBytes(reader.readVarint())))
+        return cls(messages=messages)
 
 
 clientToServerMessages = [JoinServerMessage, KeyPressedMessage, RequestInventoryMessage, DropItemMessage,
-                          EquipMessage, ClientDisconnectingMessage]
+                          EquipMessage, ClientDisconnectingMessage, AckMessage]
 serverToClientMessages = [WelcomeClientMessage, NewRoomMessage, RefreshRoomMessage,
                           UpdateRoomMessage, PlaySoundsMessage, UpdateVisibleDataMessage, InventoryMessage,
-                          InfoTextMessage, ConsoleTextMessage, ClientShouldExitMessage]
+                          InfoTextMessage, ConsoleTextMessage, ClientShouldExitMessage, BatchMessage,
+                          ReliableMessage]
+
+# Messages that keep the client's picture of the game correct, so they are resent until
+# the client acknowledges them. The rest (like sounds and visible data) are soon out of
+# date anyway, so losing one now and then does no harm.
+reliableMessageClasses = {WelcomeClientMessage, NewRoomMessage, RefreshRoomMessage, UpdateRoomMessage,
+                          UpdateVisibleDataMessage, InventoryMessage, ClientShouldExitMessage}
+
+# A reliable message of one of these classes makes any earlier ones of the classes it maps
+# to unnecessary (for instance, a NewRoomMessage replaces everything the client was told
+# about the room it was in), so those stop being resent.
+supersededMessageClasses = {
+    NewRoomMessage: {NewRoomMessage, RefreshRoomMessage, UpdateRoomMessage},
+    RefreshRoomMessage: {RefreshRoomMessage, UpdateRoomMessage},
+    UpdateVisibleDataMessage: {UpdateVisibleDataMessage},
+}
 
 _messageClass = {msg.messageName(): msg for msg in clientToServerMessages + serverToClientMessages}
+_messageClassByTypeNumber = clientToServerMessages + serverToClientMessages
+_typeNumberByMessageClass = {msg: i for i, msg in enumerate(_messageClassByTypeNumber)}
+assert _BINARY_TYPE_BASE + len(_messageClassByTypeNumber) <= _FRAGMENT_MARKER
 
 
-def bytesToMessage(byteString):
-    jsonMessage = json.loads(byteString.decode('utf-8'))
+def _jsonToMessage(jsonMessage):
     messageType = jsonMessage["message"]
     return _messageClass[messageType].fromDataJSON(jsonMessage["data"])
 
 
+class JsonCodec:
+    """Sends messages as compact JSON text. It is bigger and slower than the binary
+    codec, but easy to read in a packet dump, so it is kept for debugging."""
+    name = "json"
+    _BATCH_START = b'{"message":"Batch","data":['
+    _BATCH_END = b']}'
+    def encode(self, message):
+        return json.dumps(message.toJSON(), separators=(',',':')).encode('utf-8')
+    def decode(self, byteString):
+        return _jsonToMessage(json.loads(byteString.decode('utf-8')))
+    def encodeBatch(self, encodedMessages):
+        """Passed a list of messages that were already encoded with this codec, this
+        returns the bytes of a BatchMessage containing them."""
+        return self._BATCH_START + b','.join(encodedMessages) + self._BATCH_END
+    def batchSize(self, numMessages, totalMessageSize):
+        """Returns the length encodeBatch() would return for numMessages messages whose
+        lengths add up to totalMessageSize."""
+        return len(self._BATCH_START) + totalMessageSize + (numMessages - 1) + len(self._BATCH_END)
+    def encodeReliable(self, sequenceNumber, encodedMessage):
+        """Passed a message that was already encoded with this codec, this returns the
+        bytes of a ReliableMessage containing it."""
+        return b'{"message":"Reliable","data":{"sequenceNumber":%d,"message":%s}}' % (sequenceNumber, encodedMessage)
+
+
+class BinaryCodec:
+    """Sends messages as a single message-type byte followed by the struct-packed
+    data of the message (see Message.writeDataBytes())."""
+    name = "binary"
+    def encode(self, message):
+        buffer = bytearray()
+        buffer.append(_BINARY_TYPE_BASE + _typeNumberByMessageClass[type(message)])
+        message.writeDataBytes(buffer)
+        return bytes(buffer)
+    def decode(self, byteString):
+        reader = ByteReader(byteString)
+        messageClass = _messageClassByTypeNumber[reader.readByte() - _BINARY_TYPE_BASE]
+        return messageClass.fromDataBytes(reader)
+    def encodeBatch(self, encodedMessages):
+        """Passed a list of messages that were already encoded with this codec, this
+        returns the bytes of a BatchMessage containing them."""
+        buffer = bytearray()
+        buffer.append(_BINARY_TYPE_BASE + _typeNumberByMessageClass[BatchMessage])
+        for byteStr in encodedMessages:
+            writeVarint(buffer, len(byteStr))
+            buffer.extend(byteStr)
+        return bytes(buffer)
+    def batchSize(self, numMessages, totalMessageSize):
+        """Returns an upper bound on the length encodeBatch() would return for numMessages
+        messages whose lengths add up to totalMessageSize. (It assumes each length fits
+        in a 2-byte varint, which is true for any batch small enough to send.)"""
+        return 1 + totalMessageSize + 2 * numMessages
+    def encodeReliable(self, sequenceNumber, encodedMessage):
+        """Passed a message that was already encoded with this codec, this returns the
+        bytes of a ReliableMessage containing it."""
+        buffer = bytearray()
+        buffer.append(_BINARY_TYPE_BASE + _typeNumberByMessageClass[ReliableMessage])
+        writeVarint(buffer, sequenceNumber)
+        buffer.extend(encodedMessage)
+        return bytes(buffer)
+
+
+jsonCodec = JsonCodec()
+binaryCodec = BinaryCodec()
+codecByName = {codec.name: codec for codec in [jsonCodec, binaryCodec]}
+
+
+class EncodedMessage:
+    """Holds a message along with the bytes it encodes to in each codec, so a message
+    going to many clients is only encoded once per codec. Pass one of these (instead of
+    the Message) to ServersideClientConnections.sendMessageToPlayer() or sendMessageToAll();
+    the same EncodedMessage can be passed for several players."""
+    def __init__(self, message):
+        assert isinstance(message, Message)
+        self.message = message
+        self.byteStrByCodec = {}
+
+
+def packIntoDatagrams(codec, encodedMessages):
+    """Passed a list of messages already encoded with codec, this returns a list of
+    datagrams to send. Consecutive messages are combined into BatchMessages as long as
+    the result fits within UDP_MAX_SIZE; a message that ends up alone is sent as is.
+    The order of the messages is preserved. A message that is too big to fit in a
+    packet ends up alone in a datagram longer than UDP_MAX_SIZE, which the caller
+    must break up with fragmentDatagram()."""
+    datagrams = []
+    group = []
+    groupSize = 0
+    for byteStr in encodedMessages:
+        if group and codec.batchSize(len(group) + 1, groupSize + len(byteStr)) > UDP_MAX_SIZE:
+            datagrams.append(group[0] if len(group) == 1 else codec.encodeBatch(group))
+            group = []
+            groupSize = 0
+        group.append(byteStr)
+        groupSize += len(byteStr)
+    if group:
+        datagrams.append(group[0] if len(group) == 1 else codec.encodeBatch(group))
+    return datagrams
+
+
+def fragmentDatagram(byteStr, sequenceId):
+    """Splits a datagram that is longer than UDP_MAX_SIZE into a list of fragments, each
+    of which fits in a packet. The fragments all carry the given sequenceId (which
+    should differ for each message sent to a particular client) along with their index
+    and the total count, so a FragmentReassembler can put them back together."""
+    chunks = [byteStr[start:start + _FRAGMENT_PAYLOAD_SIZE]
+              for start in range(0, len(byteStr), _FRAGMENT_PAYLOAD_SIZE)]
+    if len(chunks) > 0xFFFF:
+        raise Exception("Message too long even for fragmenting.")
+    return [_FRAGMENT_HEADER.pack(_FRAGMENT_MARKER, sequenceId, index, len(chunks)) + chunk
+            for index, chunk in enumerate(chunks)]
+
+
+def isFragment(byteStr):
+    """Returns True if the packet is one fragment of a larger message."""
+    return byteStr[0] == _FRAGMENT_MARKER
+
+
+class _PartialDatagram:
+    """The fragments received so far for one sequenceId."""
+    def __init__(self, fragmentCount, arrivalTime):
+        self.fragments = [None] * fragmentCount
+        self.numReceived = 0
+        self.numBytes = 0
+        self.arrivalTime = arrivalTime # when the first fragment arrived
+
+
+class FragmentReassembler:
+    """Collects fragments made by fragmentDatagram() and returns the original datagram
+    once all of its fragments have arrived. Fragments can arrive in any order. A message
+    whose fragments don't all show up within timeout seconds is discarded, and to keep
+    the memory bounded only a limited number of messages (and bytes) are held at once;
+    when a new message would go over the limit the oldest ones are discarded."""
+    def __init__(self, timeout=REASSEMBLY_TIMEOUT, maxMessages=MAX_MESSAGES_BEING_REASSEMBLED,
+                 maxBytes=MAX_REASSEMBLY_BYTES):
+        self.timeout = timeout
+        self.maxMessages = maxMessages
+        self.maxBytes = maxBytes
+        self.partials = {} # map of sequenceId -> _PartialDatagram, oldest first
+        self.numBytes = 0
+        self.numDiscarded = 0 # number of messages given up on, for diagnostics
+    def addFragment(self, byteStr, currentTime=None):
+        """Passed a packet for which isFragment() is true. Returns the complete datagram if
+        this was its last missing fragment, and None otherwise."""
+        if currentTime is None:
+            currentTime = time.monotonic()
+        self._discardExpired(currentTime)
+        marker, sequenceId, index, fragmentCount = _FRAGMENT_HEADER.unpack_from(byteStr)
+        payload = byteStr[_FRAGMENT_HEADER.size:]
+        partial = self.partials.get(sequenceId)
+        if partial is None:
+            partial = _PartialDatagram(fragmentCount, currentTime)
+            self.partials[sequenceId] = partial
+        if index >= len(partial.fragments) or len(partial.fragments) != fragmentCount:
+            return None # doesn't match the other fragments; ignore it
+        if partial.fragments[index] is not None:
+            return None # a duplicate
+        partial.fragments[index] = payload
+        partial.numReceived += 1
+        partial.numBytes += len(payload)
+        self.numBytes += len(payload)
+        if partial.numReceived == fragmentCount:
+            self._remove(sequenceId)
+            return b''.join(partial.fragments)
+        self._enforceLimits()
+        return None
+    def _remove(self, sequenceId):
+        partial = self.partials.pop(sequenceId)
+        self.numBytes -= partial.numBytes
+    def _discard(self, sequenceId):
+        self._remove(sequenceId)
+        self.numDiscarded += 1
+    def _discardExpired(self, currentTime):
+        expired = [sequenceId for sequenceId, partial in self.partials.items()
+                   if currentTime - partial.arrivalTime > self.timeout]
+        for sequenceId in expired:
+            self._discard(sequenceId)
+    def _enforceLimits(self):
+        while len(self.partials) > self.maxMessages or self.numBytes > self.maxBytes:
+            self._discard(next(iter(self.partials)))
+
+
+def bytesToMessage(byteString):
+    """Decodes a packet. Either codec may have been used; the first byte tells us which."""
+    if byteString[0] >= _BINARY_TYPE_BASE:
+        return binaryCodec.decode(byteString)
+    else:
+        return jsonCodec.decode(byteString)
+
+
+class LossySocket:
+    """Wraps a socket and throws away some of the packets sent through it, to test how
+    things behave on a bad network. Which packets get lost is decided by a random number
+    generator with a fixed seed, so a test will lose the same ones every time it runs.
+    Everything other than sendto() is passed straight through to the real socket."""
+    def __init__(self, sock, lossRate, seed=0):
+        self.sock = sock
+        self.lossRate = lossRate
+        self.random = random.Random(seed)
+        self.numDropped = 0
+    def sendto(self, byteStr, address):
+        if self.random.random() < self.lossRate:
+            self.numDropped += 1
+            return len(byteStr)
+        return self.sock.sendto(byteStr, address)
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+
+def _isReadable(sock):
+    """Returns True if there is a packet waiting to be read from the socket."""
+    readyToReadSockets, (), () = select.select([sock], [], [], 0)
+    return bool(readyToReadSockets)
+
+
 class ClientsideConnection:
     """Each client keeps one instance of this class, which has information about the
     connection."""
-    def __init__(self, serverAddress, playerId):
+    def __init__(self, serverAddress, playerId, codecName="binary"):
+        """codecName picks the codec used in both directions; "json" is easier to debug."""
         self.serverAddress = serverAddress
         self.playerId = playerId
+        self.codec = codecByName[codecName]
         self.clientSocket = socket(AF_INET, SOCK_DGRAM)
         self.clientSocket.settimeout(1)
-        self.clientSocket.sendto(JoinServerMessage(playerId).toBytes(), serverAddress)
+        self.clientSocket.sendto(JoinServerMessage(playerId, codecName).toBytes(self.codec), serverAddress)
+        self.reassembler = FragmentReassembler()
+        self.nextSequenceNumber = 0 # the sequenceNumber of the next ReliableMessage to deliver
+        self.heldMessages = {} # map of sequenceNumber -> Message, for ReliableMessages that arrived early
+        self.messagesBeforeWelcome = [] # other messages that arrived before the WelcomeClientMessage
     def send(self, message):
         assert isinstance(message, Message)
         print(f"sending to {self.serverAddress}: {message}")
-        self.clientSocket.sendto(message.toBytes(), self.serverAddress)
-    def receiveOneMessage(self):
-        """This should be called at least once per event loop. It will check to see if there
-        are messages ready to read. The method will return None if no messages are ready to
-        be received, if one or more messages are available to be read it will return one
-        Message."""
-        readyToReadSockets, (), () = select.select([self.clientSocket], [], [], 0)
-        if readyToReadSockets:
-            byteStr, address = readyToReadSockets[0].recvfrom(UDP_MAX_SIZE)
+        byteStr = message.toBytes(self.codec)
+        if len(byteStr) > UDP_MAX_SIZE:
+            raise Exception("Message too long for our UDP buffers.")
+        self.clientSocket.sendto(byteStr, self.serverAddress)
+    def receiveMessages(self, maxPackets=MAX_PACKETS_PER_TICK):
+        """This should be called once per event loop. It reads every packet that is
+        waiting (up to maxPackets of them) and returns a list of the Messages in the
+        order they arrived; the list is empty if nothing was waiting. A BatchMessage
+        is never returned; instead, the messages inside it are included in order. Nor
+        is a ReliableMessage: the message inside it is returned once every earlier
+        ReliableMessage has been, and duplicates are dropped. Nothing is returned until
+        the WelcomeClientMessage (always the first ReliableMessage) has arrived; anything
+        that came before it is returned right after it."""
+        result = []
+        receivedReliableMessage = False
+        for i in range(maxPackets):
+            if not _isReadable(self.clientSocket):
+                break
+            byteStr, address = self.clientSocket.recvfrom(UDP_MAX_SIZE)
+            if isFragment(byteStr):
+                byteStr = self.reassembler.addFragment(byteStr)
+                if byteStr is None:
+                    continue # still waiting for more fragments
             print(f"Server sent: {byteStr}.")
             message = bytesToMessage(byteStr)
-            return message
-        else:
-            return None
+            for innerMessage in (message.messages if isinstance(message, BatchMessage) else [message]):
+                if isinstance(innerMessage, ReliableMessage):
+                    receivedReliableMessage = True
+                    self._receiveReliable(innerMessage, result)
+                elif self.nextSequenceNumber == 0:
+                    self.messagesBeforeWelcome.append(innerMessage)
+                else:
+                    result.append(innerMessage)
+        if receivedReliableMessage:
+            # One ack per tick covers everything received so far (including duplicates,
+            # whose ack must have been lost).
+            self.send(AckMessage(self.nextSequenceNumber, sorted(self.heldMessages)))
+        return result
+    def _receiveReliable(self, reliableMessage, result):
+        """Appends to result any messages that are now ready to deliver in order."""
+        sequenceNumber = reliableMessage.sequenceNumber
+        if sequenceNumber < self.nextSequenceNumber or sequenceNumber in self.heldMessages:
+            return # a duplicate
+        self.heldMessages[sequenceNumber] = reliableMessage.message
+        while self.nextSequenceNumber in self.heldMessages:
+            message = self.heldMessages.pop(self.nextSequenceNumber)
+            # (One the server no longer needed to send is replaced by an empty BatchMessage.)
+            result.extend(message.messages if isinstance(message, BatchMessage) else [message])
+            if self.nextSequenceNumber == 0:
+                result.extend(self.messagesBeforeWelcome)
+                self.messagesBeforeWelcome = []
+            self.nextSequenceNumber += 1
+
+
+class _UnacknowledgedMessage:
+    """A ReliableMessage the server has sent (or is about to) and must keep resending
+    until the client acknowledges it."""
+    __slots__ = ('byteStr', 'messageClass', 'timeLastSent', 'numSends')
+    def __init__(self, byteStr, messageClass):
+        self.byteStr = byteStr # the encoded ReliableMessage
+        self.messageClass = messageClass # the class of the message inside, or None once it is superseded
+        self.timeLastSent = None
+        self.numSends = 0
 
 
 class ServersideClientConnection:
@@ -214,38 +665,120 @@ class ServersideClientConnection:
         self.serverSocket = serverSocket
         self.address = address
         self.playerId = joinServerMessage.playerId
+        self.codec = codecByName.get(joinServerMessage.codecName, jsonCodec) # the codec the client asked for
         self.visibleData = None # Either None, or the last VisibleData sent to this client.
+        self.outgoing = [] # encoded messages waiting for the next flush()
+        self.nextFragmentSequenceId = 0
+        self.nextSequenceNumber = 0 # for the next ReliableMessage
+        self.unacknowledged = {} # map of sequenceNumber -> _UnacknowledgedMessage
+        self.timedOut = False # set once the client seems to have gone away without saying so
     def send(self, message):
+        """Queues a message to be sent the next time flush() is called. Messages in
+        reliableMessageClasses will be resent until the client acknowledges them."""
         assert isinstance(message, Message)
         print(f"sending to {self.address}: {message}")
-        self.sendRaw(message.toBytes())
-    def sendRaw(self, byteStr):
-        """Like send(), but the caller converts to bytes and checks the length."""
-        self.serverSocket.sendto(byteStr, self.address)
+        self.sendRaw(message.toBytes(self.codec), type(message))
+    def sendRaw(self, byteStr, messageClass):
+        """Like send(), but the caller converts the message to bytes (using self.codec)
+        and passes those along with the class of the message."""
+        if messageClass in reliableMessageClasses:
+            supersededClasses = supersededMessageClasses.get(messageClass)
+            if supersededClasses:
+                self._supersede(supersededClasses)
+            byteStr = self.codec.encodeReliable(self.nextSequenceNumber, byteStr)
+            self.unacknowledged[self.nextSequenceNumber] = _UnacknowledgedMessage(byteStr, messageClass)
+            self.nextSequenceNumber += 1
+            if len(self.unacknowledged) > MAX_UNACKNOWLEDGED:
+                self.timedOut = True
+        self.outgoing.append(byteStr)
+    def _supersede(self, messageClasses):
+        """Any unacknowledged messages of the given classes are no longer needed. The
+        client still has to receive something with each sequenceNumber (or it would wait
+        for it forever), so from now on they are resent as an empty BatchMessage."""
+        for sequenceNumber, entry in self.unacknowledged.items():
+            if entry.messageClass in messageClasses:
+                entry.byteStr = self.codec.encodeReliable(sequenceNumber, self.codec.encodeBatch([]))
+                entry.messageClass = None
+    def receiveAck(self, ackMessage):
+        """Stops resending the ReliableMessages that an AckMessage says have arrived."""
+        for sequenceNumber in [x for x in self.unacknowledged if x < ackMessage.nextSequenceNumber]:
+            del self.unacknowledged[sequenceNumber]
+        for sequenceNumber in ackMessage.heldSequenceNumbers:
+            self.unacknowledged.pop(sequenceNumber, None)
+    def flush(self, currentTime=None):
+        """Actually sends everything queued since the last flush. This should be called
+        once per tick; the messages are packed into as few datagrams as possible, and any
+        message too big for one packet is sent as several fragments. Reliable messages
+        that have gone unacknowledged for RETRANSMIT_TIMEOUT are sent again (waiting twice
+        as long each time). If one has been resent MAX_RETRANSMITS times, timedOut is set."""
+        if currentTime is None:
+            currentTime = time.monotonic()
+        resends = []
+        for entry in self.unacknowledged.values():
+            if entry.timeLastSent is not None:
+                timeout = min(RETRANSMIT_TIMEOUT * 2 ** (entry.numSends - 1), MAX_RETRANSMIT_TIMEOUT)
+                if currentTime - entry.timeLastSent < timeout:
+                    continue
+                if entry.numSends > MAX_RETRANSMITS:
+                    self.timedOut = True
+                    break
+                resends.append(entry.byteStr)
+            entry.timeLastSent = currentTime
+            entry.numSends += 1
+        self.outgoing = resends + self.outgoing
+        if self.outgoing:
+            for datagram in packIntoDatagrams(self.codec, self.outgoing):
+                if len(datagram) > UDP_MAX_SIZE:
+                    for fragment in fragmentDatagram(datagram, self.nextFragmentSequenceId):
+                        self.serverSocket.sendto(fragment, self.address)
+                    self.nextFragmentSequenceId = (self.nextFragmentSequenceId + 1) % 0x100000000
+                else:
+                    self.serverSocket.sendto(datagram, self.address)
+            self.outgoing = []
         
 
 
 class ServersideClientConnections:
     """The server maintains an instance of this class, which keeps track of the clients
     that are currently connected."""
-    def __init__(self):
+    def __init__(self, port=12000, maxPacketsPerTick=MAX_PACKETS_PER_TICK):
+        """maxPacketsPerTick limits how many packets one call to receiveMessages() will read."""
         self.connectionsByAddr = {} # a map of address -> ServersideClientConnection
         self.connectionsByPlayer = defaultdict(list) # a map of "playerId" -> [ServersideClientConnection]
-        self.serverSocket = socket(AF_INET, SOCK_DGRAM)
-        self.serverSocket.bind(('', 12000))
+        self.maxPacketsPerTick = maxPacketsPerTick
+        self.timedOutConnections = [] # connections dropped by flush() but not yet reported by receiveMessages()
+        # Counts the calls to receiveMessages() that stopped at maxPacketsPerTick while more packets
+        # were still waiting. (This is not the number of packets left waiting; the socket can't
+        # tell us that.)
+        self.numTimesReadBudgetHit = 0
+        # Counts of messages encoded for clients, and of the times an encoding was reused for
+        # another connection instead of encoding the same message again.
+        self.numEncodes = 0
+        self.numEncodesSaved = 0
+        self.serverSocket = self._openSocket(port)
+    def _openSocket(self, port):
+        serverSocket = socket(AF_INET, SOCK_DGRAM)
+        serverSocket.bind(('', port))
+        return serverSocket
     def numConnections(self):
         return len(self.connectionsByAddr)
     def receiveMessages(self):
-        """This should be called once per event loop. It will check to see if there are
-        messages ready to read. The method will return a list of (Message, clientConnection)
-        pairs (0 pairs if no messages that the server needs to respond to were received).
-        The Message can be any clientToServerMessage and the clientConnection is the
-        connection to that client."""
-        result = []
-        readyToReadSockets, (), () = select.select([self.serverSocket], [], [], 0)
-        for socket in readyToReadSockets:
-            # Read ONE message from the socket (FIXME: Should it read more if they are ready?)
-            byteStr, address = socket.recvfrom(UDP_MAX_SIZE)
+        """This should be called once per event loop. It reads all the packets that are
+        waiting (but no more than maxPacketsPerTick of them). The method will return a list
+        of (Message, clientConnection) pairs (0 pairs if no messages that the server needs
+        to respond to were received). The Message can be any clientToServerMessage except
+        AckMessage (which is handled here) and the clientConnection is the connection to
+        that client. A client that stopped acknowledging messages (see
+        ServersideClientConnection.timedOut) is reported as if it had sent a
+        ClientDisconnectingMessage; anything it (or any other address that hasn't joined)
+        sends after that is answered with a ClientShouldExitMessage instead."""
+        result = [(ClientDisconnectingMessage(), x) for x in self.timedOutConnections]
+        self.timedOutConnections = []
+        for i in range(self.maxPacketsPerTick):
+            packet = self._readPacket()
+            if packet is None:
+                break
+            byteStr, address = packet
             message = bytesToMessage(byteStr)
             if isinstance(message, JoinServerMessage):
                 clientConnection = ServersideClientConnection(self.serverSocket, address, message)
@@ -261,19 +794,117 @@ class ServersideClientConnections:
                     # Strangely, some client we don't know tried to disconnect.
                     # FIXME: Should probably log this or something.
                     pass
-            else:
+            elif isinstance(message, AckMessage):
                 clientConnection = self.connectionsByAddr.get(address)
+                if clientConnection is not None:
+                    clientConnection.receiveAck(message)
+            elif address in self.connectionsByAddr:
+                clientConnection = self.connectionsByAddr[address]
                 print(f"Client {clientConnection} sent message {message}.")
                 result.append( (message, clientConnection) )
+            else:
+                # Most likely a client that was dropped for not acknowledging messages.
+                # It is told to exit, since nothing it sends will be listened to.
+                print(f"Unknown client {address} sent message {message}.")
+                self.serverSocket.sendto(ClientShouldExitMessage().toBytes(), address)
+        else:
+            if self._packetsAreWaiting():
+                self.numTimesReadBudgetHit += 1
         return result
+    def _readPacket(self):
+        """Returns the next (byteStr, address) waiting, or None if there isn't one."""
+        if not _isReadable(self.serverSocket):
+            return None
+        return self.serverSocket.recvfrom(UDP_MAX_SIZE)
+    def _packetsAreWaiting(self):
+        """Returns True if there is at least one packet waiting to be read."""
+        return _isReadable(self.serverSocket)
     def sendMessageToAll(self, message):
+        """Sends a message (or EncodedMessage) to every connection."""
+        encodedMessage = self._toEncodedMessage(message)
         for clientConnection in self.connectionsByAddr.values():
-            clientConnection.send(message)
+            self._sendEncoded(clientConnection, encodedMessage)
+    def flush(self, currentTime=None):
+        """Sends out everything that was queued for any of the clients. Call this once
+        at the end of each tick."""
+        for clientConnection in list(self.connectionsByAddr.values()):
+            clientConnection.flush(currentTime)
+            if clientConnection.timedOut:
+                print(f"Client {clientConnection.address} stopped responding; dropping it.")
+                del self.connectionsByAddr[clientConnection.address]
+                self.connectionsByPlayer[clientConnection.playerId].remove(clientConnection)
+                self.timedOutConnections.append(clientConnection)
     def sendMessageToPlayer(self, playerId, message):
-        """Sends a message to all connections for a given playerId."""
+        """Sends a message (or EncodedMessage) to all connections for a given playerId."""
+        encodedMessage = self._toEncodedMessage(message)
         for clientConnection in self.connectionsByPlayer.get(playerId):
-            clientConnection.send(message)
+            self._sendEncoded(clientConnection, encodedMessage)
+    def _toEncodedMessage(self, message):
+        if isinstance(message, EncodedMessage):
+            return message
+        print(f"sending: {message}")
+        return EncodedMessage(message)
+    def _sendEncoded(self, clientConnection, encodedMessage):
+        codec = clientConnection.codec
+        byteStr = encodedMessage.byteStrByCodec.get(codec)
+        if byteStr is None:
+            byteStr = encodedMessage.message.toBytes(codec)
+            encodedMessage.byteStrByCodec[codec] = byteStr
+            self.numEncodes += 1
+        else:
+            self.numEncodesSaved += 1
+        clientConnection.sendRaw(byteStr, type(encodedMessage.message))
     def numClients(self, playerId):
         """Given a playerId, returns the number of currently connected clients
         following that player."""
         return len(self.connectionsByPlayer.get(playerId))
+
+
+class _ServerDatagramProtocol(asyncio.DatagramProtocol):
+    """Hands the packets asyncio receives to an AsyncServersideClientConnections."""
+    def __init__(self, clients):
+        self.clients = clients
+    def datagram_received(self, byteStr, address):
+        self.clients.incoming.append((byteStr, address))
+        self.clients.packetArrived.set()
+    def error_received(self, exc):
+        print(f"Network error: {exc}")
+
+
+class AsyncServersideClientConnections(ServersideClientConnections):
+    """A version of ServersideClientConnections that receives packets through asyncio
+    instead of polling a socket, so the server's main loop can sleep until either a
+    packet arrives or it is time for the next tick (see waitForPackets()). Create it
+    and then await start() from inside the event loop before using it."""
+    def __init__(self, port=12000, maxPacketsPerTick=MAX_PACKETS_PER_TICK):
+        super().__init__(port, maxPacketsPerTick)
+        self.port = port
+        self.incoming = deque() # (byteStr, address) pairs received but not yet handled
+        self.packetArrived = asyncio.Event()
+    def _openSocket(self, port):
+        # This is done by start(), and the asyncio transport is used in place of the socket:
+        # it has a sendto() just like a socket's, so the ServersideClientConnections can use
+        # it in exactly the same way.
+        return None
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        transport, protocol = await loop.create_datagram_endpoint(
+            lambda: _ServerDatagramProtocol(self), local_addr=('0.0.0.0', self.port))
+        self.serverSocket = transport
+    def close(self):
+        self.serverSocket.close()
+    def getPort(self):
+        return self.serverSocket.get_extra_info('sockname')[1]
+    async def waitForPackets(self, timeout):
+        """Waits until some packets are ready for receiveMessages(), or until timeout
+        seconds have passed, whichever comes first."""
+        if not self.incoming:
+            try:
+                await asyncio.wait_for(self.packetArrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self.packetArrived.clear()
+    def _readPacket(self):
+        return self.incoming.popleft() if self.incoming else None
+    def _packetsAreWaiting(self):
+        return len(self.incoming) > 0
@@ -0,0 +1,419 @@
+#
+# Unit tests for exploranetworking using the pytest library
+#
+
+import pygame
+pygame.init()
+import random
+from exploranetworking import *
+from clientdata import CellData, InventoryItemData
+
+
+def sampleMessages():
+    """Returns one example of each kind of message."""
+    gridData = GridData.fromJSON([[4,4,4], [[4,2],4,[4,7,8]]])
+    inventoryData = InventoryData(
+        [InventoryItemData(4392479488, 3, "N"), InventoryItemData(4392386512, 4, "S")],
+        None, 4392386512)
+    return [
+        JoinServerMessage("1", "binary"),
+        KeyPressedMessage(3),
+        RequestInventoryMessage(),
+        DropItemMessage(4392386512),
+        EquipMessage("W", None),
+        ClientDisconnectingMessage(),
+        AckMessage(3, [5, 9]),
+        WelcomeClientMessage(gridData),
+        NewRoomMessage(gridData),
+        RefreshRoomMessage(gridData),
+        UpdateRoomMessage(GridDataChange([(0, 1, CellData((4,))), (300, 2, CellData((4, 200)))])),
+        PlaySoundsMessage([0, 3]),
+        UpdateVisibleDataMessage(VisibleData(health=2.5, maxHealth=10, mana=4, maxMana=8)),
+        InventoryMessage(inventoryData),
+        InfoTextMessage("Go East\nfor Minotaur"),
+        ConsoleTextMessage("You hit the giant bee."),
+        ClientShouldExitMessage(),
+        BatchMessage([KeyPressedMessage(3), InfoTextMessage("hi")]),
+        ReliableMessage(300, InventoryMessage(inventoryData)),
+    ]
+
+
+def test_sampleMessagesCoverEveryClass():
+    assert {type(x) for x in sampleMessages()} == set(clientToServerMessages + serverToClientMessages)
+
+
+def test_jsonRoundTrip():
+    for message in sampleMessages():
+        assert bytesToMessage(message.toBytes(jsonCodec)).toJSON() == message.toJSON()
+
+
+def test_binaryRoundTrip():
+    for message in sampleMessages():
+        assert bytesToMessage(message.toBytes(binaryCodec)).toJSON() == message.toJSON()
+
+
+def test_defaultCodecIsJSON():
+    message = KeyPressedMessage(3)
+    assert message.toBytes() == message.toBytes(jsonCodec)
+
+
+def test_binaryIsSmallerForRooms():
+    gridData = GridData(30, 30, [CellData((2,))] * 900)
+    message = NewRoomMessage(gridData)
+    assert len(message.toBytes(binaryCodec)) < len(message.toBytes(jsonCodec)) * 0.6
+
+
+def test_joinServerWithoutCodecName():
+    message = bytesToMessage(b'{"message":"JoinServer","data":{"playerId":"0"}}')
+    assert message.codecName == "json"
+
+
+class RecordingSocket:
+    """Stands in for a socket and just remembers what was sent."""
+    def __init__(self):
+        self.sent = []
+    def sendto(self, byteStr, address):
+        self.sent.append((byteStr, address))
+
+
+def test_encodeBatchMatchesBatchMessage():
+    messages = [ConsoleTextMessage("one"), PlaySoundsMessage([2]), ConsoleTextMessage("two")]
+    for codec in [jsonCodec, binaryCodec]:
+        encodedMessages = [codec.encode(x) for x in messages]
+        assert codec.encodeBatch(encodedMessages) == codec.encode(BatchMessage(messages))
+        assert len(codec.encodeBatch(encodedMessages)) <= codec.batchSize(3, sum(len(x) for x in encodedMessages))
+
+
+def test_packIntoDatagrams_single():
+    byteStr = ConsoleTextMessage("one").toBytes(binaryCodec)
+    assert packIntoDatagrams(binaryCodec, [byteStr]) == [byteStr]
+
+
+def test_packIntoDatagrams_splitsAndKeepsOrder():
+    for codec in [jsonCodec, binaryCodec]:
+        texts = [f"message number {i} " + "x" * 300 for i in range(40)]
+        encodedMessages = [ConsoleTextMessage(text).toBytes(codec) for text in texts]
+        datagrams = packIntoDatagrams(codec, encodedMessages)
+        assert 1 < len(datagrams) < len(texts)
+        received = []
+        for datagram in datagrams:
+            assert len(datagram) <= UDP_MAX_SIZE
+            message = bytesToMessage(datagram)
+            received.extend(message.messages if isinstance(message, BatchMessage) else [message])
+        assert [x.text for x in received] == texts
+
+
+def test_flushSendsOneDatagram():
+    socket = RecordingSocket()
+    connection = ServersideClientConnection(socket, ("127.0.0.1", 5000), JoinServerMessage("0", "binary"))
+    connection.send(InfoTextMessage("Go East"))
+    connection.send(ConsoleTextMessage("You hit the giant bee."))
+    connection.send(PlaySoundsMessage([1]))
+    assert socket.sent == []
+    connection.flush()
+    assert len(socket.sent) == 1
+    byteStr, address = socket.sent[0]
+    assert address == ("127.0.0.1", 5000)
+    batch = bytesToMessage(byteStr)
+    assert [type(x) for x in batch.messages] == [InfoTextMessage, ConsoleTextMessage, PlaySoundsMessage]
+    connection.flush()
+    assert len(socket.sent) == 1
+
+
+def test_receiveMessagesDrainsUpToTheCap():
+    import time
+    from socket import socket, AF_INET, SOCK_DGRAM
+    clients = ServersideClientConnections(port=0, maxPacketsPerTick=3)
+    serverAddress = ("127.0.0.1", clients.serverSocket.getsockname()[1])
+    clientSocket = socket(AF_INET, SOCK_DGRAM)
+    try:
+        clientSocket.sendto(JoinServerMessage("0").toBytes(), serverAddress)
+        for keyCode in [1, 2, 3, 4]:
+            clientSocket.sendto(KeyPressedMessage(keyCode).toBytes(binaryCodec), serverAddress)
+        time.sleep(0.05)
+        firstTick = clients.receiveMessages()
+        assert [type(message) for message, connection in firstTick] == [JoinServerMessage, KeyPressedMessage, KeyPressedMessage]
+        assert clients.numTimesReadBudgetHit == 1
+        secondTick = clients.receiveMessages()
+        assert [message.keyCode for message, connection in secondTick] == [3, 4]
+        assert clients.numTimesReadBudgetHit == 1
+        assert clients.receiveMessages() == []
+    finally:
+        clientSocket.close()
+        clients.serverSocket.close()
+
+
+def makeGeneratedRoom(seed, width=200, height=200):
+    """Returns a large Room with a random mix of backgrounds and items, as a stand-in for
+    procedurally generated levels."""
+    import objects
+    from gamecomponents import Room
+    rng = random.Random(seed)
+    backgrounds = [objects.Dirt(), objects.Grass(), objects.BrickWall()]
+    background = [[rng.choice(backgrounds) for x in range(width)] for y in range(height)]
+    itemTypes = [objects.Sword, objects.HealingWand, objects.Dirt]
+    items = {(rng.randrange(width), rng.randrange(height)): rng.choice(itemTypes)()
+             for i in range(width * height // 20)}
+    return Room(background, items=items)
+
+
+def receiveFragments(fragments, reassembler):
+    """Feeds fragments to the reassembler and returns the list of completed datagrams."""
+    results = [reassembler.addFragment(x, currentTime=0) for x in fragments]
+    return [x for x in results if x is not None]
+
+
+def test_largeRoomsRoundTripThroughFragments():
+    for seed in [1, 2]:
+        message = NewRoomMessage(makeGeneratedRoom(seed).gridData())
+        for codec in [jsonCodec, binaryCodec]:
+            socket = RecordingSocket()
+            connection = ServersideClientConnection(socket, ("127.0.0.1", 5000), JoinServerMessage("0", codec.name))
+            connection.send(message)
+            connection.flush()
+            fragments = [byteStr for byteStr, address in socket.sent]
+            assert len(fragments) > 1
+            assert all(len(x) <= UDP_MAX_SIZE and isFragment(x) for x in fragments)
+            random.Random(seed).shuffle(fragments)
+            [datagram] = receiveFragments(fragments, FragmentReassembler())
+            assert bytesToMessage(datagram).message.toJSON() == message.toJSON()
+
+
+def test_smallMessagesAreNotFragments():
+    for message in sampleMessages():
+        for codec in [jsonCodec, binaryCodec]:
+            assert not isFragment(message.toBytes(codec))
+
+
+def test_interleavedFragmentsAndDuplicates():
+    first = bytes(range(256)) * 40
+    second = b"abc" * 5000
+    firstFragments = fragmentDatagram(first, 7)
+    secondFragments = fragmentDatagram(second, 8)
+    mixed = [secondFragments[0], firstFragments[0], firstFragments[0]] + firstFragments[1:] + secondFragments[1:]
+    assert receiveFragments(mixed, FragmentReassembler()) == [first, second]
+
+
+def test_reassemblyTimesOut():
+    reassembler = FragmentReassembler(timeout=2.0)
+    fragments = fragmentDatagram(b"x" * 10000, 1)
+    assert reassembler.addFragment(fragments[0], currentTime=0) is None
+    assert reassembler.addFragment(fragments[1], currentTime=5) is None
+    assert reassembler.numDiscarded == 1
+    assert reassembler.addFragment(fragments[2], currentTime=5) is None
+    assert len(reassembler.partials) == 1
+
+
+def test_reassemblyIsBounded():
+    reassembler = FragmentReassembler(maxMessages=3, maxBytes=3 * UDP_MAX_SIZE)
+    for sequenceId in range(10):
+        reassembler.addFragment(fragmentDatagram(b"y" * 10000, sequenceId)[0], currentTime=0)
+        assert len(reassembler.partials) <= 3
+        assert reassembler.numBytes <= 3 * UDP_MAX_SIZE
+    assert list(reassembler.partials) == [7, 8, 9]
+    assert reassembler.numDiscarded == 7
+
+
+def test_encodeReliableMatchesReliableMessage():
+    message = UpdateRoomMessage(GridDataChange([(0, 1, CellData((4,)))]))
+    for codec in [jsonCodec, binaryCodec]:
+        assert codec.encodeReliable(130, codec.encode(message)) == codec.encode(ReliableMessage(130, message))
+
+
+def test_onlyReliableClassesAreWrapped():
+    socket = RecordingSocket()
+    connection = ServersideClientConnection(socket, ("127.0.0.1", 5000), JoinServerMessage("0", "binary"))
+    connection.send(PlaySoundsMessage([1]))
+    connection.send(InventoryMessage(InventoryData([], None, None)))
+    connection.flush(currentTime=0)
+    batch = bytesToMessage(socket.sent[0][0])
+    assert [type(x) for x in batch.messages] == [PlaySoundsMessage, ReliableMessage]
+    assert list(connection.unacknowledged) == [0]
+
+
+def test_retransmitsUntilAcknowledged():
+    socket = RecordingSocket()
+    connection = ServersideClientConnection(socket, ("127.0.0.1", 5000), JoinServerMessage("0", "binary"))
+    connection.send(ClientShouldExitMessage())
+    connection.send(ClientShouldExitMessage())
+    connection.flush(currentTime=0)
+    connection.flush(currentTime=RETRANSMIT_TIMEOUT / 2)
+    assert len(socket.sent) == 1
+    connection.receiveAck(AckMessage(0, [1]))
+    connection.flush(currentTime=RETRANSMIT_TIMEOUT)
+    assert len(socket.sent) == 2
+    assert bytesToMessage(socket.sent[1][0]).sequenceNumber == 0
+    connection.receiveAck(AckMessage(2, []))
+    connection.flush(currentTime=RETRANSMIT_TIMEOUT * 3)
+    assert len(socket.sent) == 2
+
+
+def test_retransmitsBackOff():
+    socket = RecordingSocket()
+    connection = ServersideClientConnection(socket, ("127.0.0.1", 5000), JoinServerMessage("0", "binary"))
+    connection.send(ClientShouldExitMessage())
+    sendTimes = []
+    for tick in range(1000):
+        if connection.timedOut:
+            break
+        currentTime = tick * RETRANSMIT_TIMEOUT / 2
+        numSent = len(socket.sent)
+        connection.flush(currentTime)
+        if len(socket.sent) > numSent:
+            sendTimes.append(currentTime)
+    gaps = [later - earlier for earlier, later in zip(sendTimes, sendTimes[1:])]
+    assert gaps[:5] == [RETRANSMIT_TIMEOUT, 2 * RETRANSMIT_TIMEOUT, 4 * RETRANSMIT_TIMEOUT,
+                        MAX_RETRANSMIT_TIMEOUT, MAX_RETRANSMIT_TIMEOUT]
+    assert len(sendTimes) == MAX_RETRANSMITS + 1
+    assert connection.timedOut
+
+
+def test_clientThatStopsAckingIsDropped():
+    clients = ServersideClientConnections(port=0)
+    try:
+        socket = RecordingSocket()
+        connection = ServersideClientConnection(socket, ("127.0.0.1", 5000), JoinServerMessage("0", "binary"))
+        clients.connectionsByAddr[connection.address] = connection
+        clients.connectionsByPlayer["0"].append(connection)
+        currentTime = 0
+        while clients.numConnections() > 0:
+            clients.sendMessageToPlayer("0", UpdateRoomMessage(GridDataChange([(0, 0, CellData((4,)))])))
+            clients.flush(currentTime)
+            assert len(connection.unacknowledged) <= MAX_UNACKNOWLEDGED + 1
+            currentTime += 0.02
+        assert clients.connectionsByPlayer["0"] == []
+        assert [(type(message), x) for message, x in clients.receiveMessages()] == [(ClientDisconnectingMessage, connection)]
+        assert clients.receiveMessages() == []
+    finally:
+        clients.serverSocket.close()
+
+
+def test_supersededMessagesAreResentEmpty():
+    socket = RecordingSocket()
+    connection = ServersideClientConnection(socket, ("127.0.0.1", 5000), JoinServerMessage("0", "binary"))
+    gridData = GridData.fromJSON([[4, 4]])
+    connection.send(UpdateRoomMessage(GridDataChange([(0, 0, CellData((4,)))])))
+    connection.send(InventoryMessage(InventoryData([], None, None)))
+    connection.send(NewRoomMessage(gridData))
+    connection.flush(currentTime=0)
+    connection.flush(currentTime=RETRANSMIT_TIMEOUT)
+    resent = [x.messages if isinstance(x, BatchMessage) else [x] for x in [bytesToMessage(socket.sent[1][0])]][0]
+    assert [(x.sequenceNumber, type(x.message)) for x in resent] == \
+           [(0, BatchMessage), (1, InventoryMessage), (2, NewRoomMessage)]
+    assert resent[0].message.messages == []
+
+
+def test_nothingIsDeliveredBeforeTheWelcome():
+    clients = ServersideClientConnections(port=0)
+    serverAddress = ("127.0.0.1", clients.serverSocket.getsockname()[1])
+    clientConnection = ClientsideConnection(serverAddress, "0")
+    try:
+        select.select([clients.serverSocket], [], [], 1)
+        (joinMessage, connection), = clients.receiveMessages()
+        realSocket = connection.serverSocket
+        connection.serverSocket = RecordingSocket() # the Welcome is lost
+        connection.send(WelcomeClientMessage(GridData.fromJSON([[4]])))
+        connection.flush(currentTime=0)
+        connection.serverSocket = realSocket
+        connection.send(PlaySoundsMessage([1]))
+        connection.send(ConsoleTextMessage("hello"))
+        connection.flush(currentTime=0.01)
+        select.select([clientConnection.clientSocket], [], [], 1)
+        assert clientConnection.receiveMessages() == []
+        connection.flush(currentTime=RETRANSMIT_TIMEOUT)
+        select.select([clientConnection.clientSocket], [], [], 1)
+        received = clientConnection.receiveMessages()
+        assert [type(x) for x in received] == [WelcomeClientMessage, PlaySoundsMessage, ConsoleTextMessage]
+    finally:
+        clientConnection.clientSocket.close()
+        clients.serverSocket.close()
+
+
+def test_reliableMessagesSurviveLoss():
+    clients = ServersideClientConnections(port=0)
+    clients.serverSocket = LossySocket(clients.serverSocket, lossRate=0.3, seed=1)
+    serverAddress = ("127.0.0.1", clients.serverSocket.getsockname()[1])
+    clientConnection = ClientsideConnection(serverAddress, "0")
+    try:
+        for i in range(10):
+            if clients.receiveMessages():
+                break
+        clientConnection.clientSocket = LossySocket(clientConnection.clientSocket, lossRate=0.3, seed=2)
+        received = []
+        currentTime = 0
+        for tick in range(80):
+            if tick < 30:
+                clients.sendMessageToAll(InventoryMessage(InventoryData([InventoryItemData(tick, 2, "S")], None, None)))
+                clients.sendMessageToAll(UpdateRoomMessage(GridDataChange([(0, 0, CellData((4, tick)))])))
+                clients.sendMessageToAll(PlaySoundsMessage([1]))
+            clients.flush(currentTime)
+            select.select([clientConnection.clientSocket], [], [], 0.01)
+            received.extend(clientConnection.receiveMessages())
+            select.select([clients.serverSocket], [], [], 0.01)
+            clients.receiveMessages()
+            currentTime += RETRANSMIT_TIMEOUT
+        assert clients.serverSocket.numDropped > 0 and clientConnection.clientSocket.numDropped > 0
+        updates = [x.gridDataChange.toJSON()[0][2][1] for x in received if isinstance(x, UpdateRoomMessage)]
+        assert updates == list(range(30))
+        assert len([x for x in received if isinstance(x, InventoryMessage)]) == 30
+        assert len([x for x in received if isinstance(x, PlaySoundsMessage)]) < 30
+        connection, = clients.connectionsByAddr.values()
+        assert connection.unacknowledged == {}
+    finally:
+        clientConnection.clientSocket.close()
+        clients.serverSocket.close()
+
+
+def test_sharedMessageIsEncodedOncePerCodec():
+    clients = ServersideClientConnections(port=0)
+    try:
+        socket = RecordingSocket()
+        for port, playerId, codecName in [(5000, "0", "binary"), (5001, "0", "json"), (5002, "1", "binary")]:
+            connection = ServersideClientConnection(socket, ("127.0.0.1", port), JoinServerMessage(playerId, codecName))
+            clients.connectionsByAddr[connection.address] = connection
+            clients.connectionsByPlayer[playerId].append(connection)
+        message = EncodedMessage(UpdateRoomMessage(GridDataChange([(0, 1, CellData((4,)))])))
+        clients.sendMessageToPlayer("0", message)
+        clients.sendMessageToPlayer("1", message)
+        assert (clients.numEncodes, clients.numEncodesSaved) == (2, 1)
+        clients.flush(currentTime=0)
+        received = {address[1]: bytesToMessage(byteStr) for byteStr, address in socket.sent}
+        assert sorted(received) == [5000, 5001, 5002]
+        for reliableMessage in received.values():
+            assert reliableMessage.message.toJSON() == message.message.toJSON()
+    finally:
+        clients.serverSocket.close()
+
+
+def test_asyncServerWakesOnPackets():
+    import time
+    from socket import socket, AF_INET, SOCK_DGRAM
+    async def run():
+        clients = AsyncServersideClientConnections(port=0, maxPacketsPerTick=2)
+        await clients.start()
+        clientSocket = socket(AF_INET, SOCK_DGRAM)
+        try:
+            startTime = time.perf_counter()
+            await clients.waitForPackets(0.05)
+            assert time.perf_counter() - startTime >= 0.04
+            assert clients.receiveMessages() == []
+            serverAddress = ("127.0.0.1", clients.getPort())
+            clientSocket.sendto(JoinServerMessage("0", "binary").toBytes(), serverAddress)
+            for keyCode in [1, 2]:
+                clientSocket.sendto(KeyPressedMessage(keyCode).toBytes(binaryCodec), serverAddress)
+            startTime = time.perf_counter()
+            while len(clients.incoming) < 3:
+                await clients.waitForPackets(5)
+            assert time.perf_counter() - startTime < 1
+            assert [type(x) for x, connection in clients.receiveMessages()] == [JoinServerMessage, KeyPressedMessage]
+            assert clients.numTimesReadBudgetHit == 1
+            connection, = clients.connectionsByAddr.values()
+            connection.send(ConsoleTextMessage("welcome"))
+            clients.flush()
+            clientSocket.settimeout(1)
+            byteStr, address = clientSocket.recvfrom(UDP_MAX_SIZE)
+            assert bytesToMessage(byteStr).text == "welcome"
+        finally:
+            clientSocket.close()
+            clients.close()
+    asyncio.run(run())
@@ -1,32 +1,47 @@
-from kindsofthing import Thing
+from array import array
+from kindsofthing import Thing, Wall
 from mobile import Mobile
 from clientdata import GridData, CellData
+from spatialindex import SpatialHash
 
 
 class Location:
     """This is a way to specify a particular place."""
+    __slots__ = ('roomNumber', 'coordinates')
     def __init__(self, roomNumber, coordinates):
         self.roomNumber = roomNumber
         self.coordinates = coordinates
 
 class Cell:
-    """Contains a stack of things."""
-    def __init__(self):
+    """Contains a stack of things. It also keeps its Grid's counts of walls and
+    mobiles up to date as things are added and removed."""
+    __slots__ = ('things', 'grid', 'index')
+    def __init__(self, grid, index):
         self.things = []
+        self.grid = grid
+        self.index = index # the position of this cell in the grid's counts
     def addThing(self, thing):
         assert isinstance(thing, Thing)
         self.things.append(thing)
+        self.grid.cellChanged(self.index)
+        if isinstance(thing, Wall):
+            self.grid.wallCounts[self.index] += 1
+        elif isinstance(thing, Mobile):
+            self.grid.mobileCounts[self.index] += 1
     def removeThing(self, thing):
         """This will remove the thing from this cell if it is in this
         cell. If it is not there then this raises ValueError."""
         self.things.remove(thing)
+        self.grid.cellChanged(self.index)
+        if isinstance(thing, Wall):
+            self.grid.wallCounts[self.index] -= 1
+        elif isinstance(thing, Mobile):
+            self.grid.mobileCounts[self.index] -= 1
     def canEnter(self, mobile):
         """This returns True if the mobile is able to enter into this
-        cell."""
-        for thing in self.things:
-            if not thing.canEnter(mobile):
-                return False
-        return True
+        cell. Walls and mobiles are the only things that block, so this
+        just checks the grid's counts."""
+        return self.grid.wallCounts[self.index] == 0 and self.grid.mobileCounts[self.index] == 0
     def doEnter(self, mobile, world, screenChanges):
         """This gets called when a mobile enters into this cell. It should
         make sure that all the things in the cell that do anything when you
@@ -49,25 +64,147 @@ class Cell:
 
 
 class Grid:
-    """A grid has rows and columns of cells."""
+    """A grid has rows and columns of cells. It also keeps a count of the walls
+    and of the mobiles in each cell (indexed by x + y * width), so those can be
+    checked without looking through the things in the cell."""
     def __init__(self, width, height):
-        self.cells = [ [Cell() for x in range(width)] for y in range(height)]
         self.width = width
         self.height = height
+        self.wallCounts = bytearray(width * height)
+        self.mobileCounts = bytearray(width * height)
+        self.version = 0 # goes up by one every time a cell changes
+        self._gridData = None # built the first time toGridData() is called
+        self._allCellData = None # the list of CellDatas inside _gridData
+        self._dirtyIndexes = set() # the cells that have changed since _gridData was last brought up to date
+        self._makeCells()
+    def _makeCells(self):
+        self.cells = [ [Cell(self, x + y * self.width) for x in range(self.width)] for y in range(self.height)]
+    def setBackground(self, background):
+        """Puts one thing in each cell from background, a list of rows of Things."""
+        assert len(background) == self.height
+        for y, row in enumerate(background):
+            assert len(row) == self.width
+            for x, thing in enumerate(row):
+                self.cellAt(x,y).addThing(thing)
     def cellAt(self, x, y):
         return self.cells[y][x]
+    def cellChanged(self, index):
+        """Cell calls this whenever its things change."""
+        self.version += 1
+        if self._gridData is not None:
+            self._dirtyIndexes.add(index)
+    def _cellDataAt(self, index):
+        cell = self.cellAt(index % self.width, index // self.width)
+        return CellData.shared(tuple(x.tileId for x in cell.things))
     def toGridData(self):
         """This returns the information of what is in the grid in the form of
-        a GridData."""
-        allCells = []
-        for row in self.cells:
-            allCells.extend([CellData(tuple(x.tileId for x in cell.things)) for cell in row])
-        return GridData(self.width, self.height, allCells)
+        a GridData. The same GridData is returned every time, patched to match
+        any cells that have changed, so callers must not modify it (and must
+        copy it if they want to keep a snapshot)."""
+        if self._gridData is None:
+            self._allCellData = [self._cellDataAt(index) for index in range(self.width * self.height)]
+            self._gridData = GridData(self.width, self.height, self._allCellData)
+        elif self._dirtyIndexes:
+            for index in self._dirtyIndexes:
+                self._allCellData[index] = self._cellDataAt(index)
+        self._dirtyIndexes.clear()
+        return self._gridData
+    def isPassable(self, x, y):
+        """Returns True if there is no wall at (x,y)."""
+        return self.wallCounts[x + y * self.width] == 0
+    def isOccupied(self, x, y):
+        """Returns True if there is a mobile at (x,y)."""
+        return self.mobileCounts[x + y * self.width] != 0
+    def checkCounts(self):
+        """Raises AssertionError if the wall or mobile counts don't match the
+        things in the cells. Meant for tests and debugging."""
+        for y in range(self.height):
+            for x in range(self.width):
+                cell = self.cellAt(x, y)
+                index = x + y * self.width
+                assert cell.grid is self and cell.index == index
+                numWalls = sum(1 for thing in cell.things if isinstance(thing, Wall))
+                numMobiles = sum(1 for thing in cell.things if isinstance(thing, Mobile))
+                assert self.wallCounts[index] == numWalls, f"wall count wrong at {(x, y)}"
+                assert self.mobileCounts[index] == numMobiles, f"mobile count wrong at {(x, y)}"
+                assert cell.canEnter(None) == all(thing.canEnter(None) for thing in cell.things)
+
+
+class LayeredCell(Cell):
+    """A Cell of a LayeredGrid. It starts out holding just the background thing
+    for its spot. Once anything is added or removed, the grid keeps hold of it
+    until it is back to holding just that background thing. (So a cell that hasn't
+    been promoted that way should not be held onto while another one for the same
+    spot is changed.)"""
+    __slots__ = ()
+    def __init__(self, grid, index, backgroundThing):
+        super().__init__(grid, index)
+        self.things.append(backgroundThing)
+    def addThing(self, thing):
+        super().addThing(thing)
+        self.grid._promote(self)
+    def removeThing(self, thing):
+        super().removeThing(thing)
+        if len(self.things) == 1 and self.things[0] is self.grid.backgroundThingAt(self.index):
+            self.grid._demote(self)
+        else:
+            self.grid._promote(self)
+
+
+class LayeredGrid(Grid):
+    """A Grid that uses far less memory for big rooms. Instead of a Cell for every
+    spot, it keeps the background as one layer of palette numbers (an index into
+    a list of the distinct background things), plus a dict of cells that hold
+    anything else, such as items or mobiles. cellAt() returns a LayeredCell that
+    behaves just like any other Cell."""
+    def _makeCells(self):
+        self.palette = [] # the distinct background things
+        self.paletteNumberByThing = {} # map of background thing -> its position in palette
+        self.paletteCellData = [] # a CellData for each background thing by itself
+        self.background = array('H', bytes(2 * self.width * self.height)) # palette number of each cell
+        self.promotedCells = {} # map of index -> LayeredCell, for cells that aren't just their background
+    def setBackground(self, background):
+        assert len(background) == self.height
+        index = 0
+        for row in background:
+            assert len(row) == self.width
+            for thing in row:
+                assert isinstance(thing, Thing) and not isinstance(thing, Mobile)
+                paletteNumber = self.paletteNumberByThing.get(thing)
+                if paletteNumber is None:
+                    paletteNumber = len(self.palette)
+                    if paletteNumber > 0xFFFF:
+                        raise ValueError("A LayeredGrid can have at most 65536 different background things.")
+                    self.palette.append(thing)
+                    self.paletteNumberByThing[thing] = paletteNumber
+                    self.paletteCellData.append(CellData.shared((thing.tileId,)))
+                self.background[index] = paletteNumber
+                if isinstance(thing, Wall):
+                    self.wallCounts[index] = 1
+                index += 1
+        self.version += 1
+    def backgroundThingAt(self, index):
+        return self.palette[self.background[index]]
+    def cellAt(self, x, y):
+        index = x + y * self.width
+        cell = self.promotedCells.get(index)
+        if cell is None:
+            cell = LayeredCell(self, index, self.palette[self.background[index]])
+        return cell
+    def _promote(self, cell):
+        promotedCell = self.promotedCells.setdefault(cell.index, cell)
+        assert promotedCell is cell, "another cell for this spot was changed while this one was held"
+    def _demote(self, cell):
+        self.promotedCells.pop(cell.index, None)
+    def _cellDataAt(self, index):
+        if index in self.promotedCells:
+            return super()._cellDataAt(index)
+        return self.paletteCellData[self.background[index]]
 
 
 class Room:
     """A room is a location that mobiles can move through."""
-    def __init__(self, background, items=None, mobilesAtEntry=None):
+    def __init__(self, background, items=None, mobilesAtEntry=None, gridClass=Grid):
         """The background should be a 2-D list of Things which lays out
         the stuff in the background in the room. This is used to determine
         the width and height of the room. items can be None (for
@@ -76,16 +213,19 @@ class Room:
         of things to be placed in that location. Finally, mobiles is None
         or a map where keys are a location and values are a mobile who
         should be added to the room atthat spot the first time the room
-        is entered."""
+        is entered. gridClass can be LayeredGrid for a room too big to
+        have a Cell for every spot."""
         self.width = len(background[0])
         self.height = len(background)
         self.hasBeenEntered = False
         self.mobilesAtEntry = mobilesAtEntry
-        self.grid = Grid(self.width, self.height)
-        for y, row in enumerate(background):
-            assert len(row) == self.width
-            for x, thing in enumerate(row):
-                self.cellAt(x,y).addThing(thing)
+        self.dormantMobiles = [] # mobiles that were put to sleep when players stopped visiting
+        self.flowFieldCache = None # a brain.FlowFieldCache, created the first time a brain needs one
+        self.residentPlayers = {} # the players in the room, in order of arrival (the values are all None)
+        self.residentMobiles = {} # the other mobiles in the room, including dormant ones (values are None)
+        self.mobileIndex = SpatialHash() # where all the resident players and mobiles are
+        self.grid = gridClass(self.width, self.height)
+        self.grid.setBackground(background)
         if items:
             for location, thingOrThings in items.items():
                 x,y = location
@@ -98,38 +238,98 @@ class Room:
         assert 0 <= x < self.width
         assert 0 <= y < self.height
         return self.grid.cellAt(x,y)
+    def cellChanged(self, x, y):
+        """Call this when the things in a cell have changed (ScreenChanges does this
+        for every cell it is told about), so anything cached about the room can be
+        updated."""
+        if self.flowFieldCache is not None:
+            self.flowFieldCache.cellChanged(x, y)
+    def allCellsChanged(self):
+        """Like cellChanged() but for when anything in the room may have changed."""
+        if self.flowFieldCache is not None:
+            self.flowFieldCache.clear()
+    def placeMobile(self, mobile, position):
+        """Puts a mobile (or player) that isn't in any room yet at position, an (x,y)
+        tuple."""
+        x,y = position
+        mobile.setLocation(self, position)
+        self.cellAt(x,y).addThing(mobile)
+        self.cellChanged(x, y)
     def playerEntersRoom(self):
         """The Game will call this when a player enters the room. The first
-        time it is entered, this will add the mobiles; all other times it
-        will do nothing. It returns a list of the newly added mobiles."""
-        if self.hasBeenEntered:
-            return []
-        else:
+        time it is entered, this will add the mobiles; it also wakes any
+        dormant mobiles (a mobile can wander into a room before any player
+        has entered it). It returns a list of the mobiles that should
+        become active."""
+        result = self.wakeDormantMobiles()
+        if not self.hasBeenEntered:
             self.hasBeenEntered = True
-            result = []
             if self.mobilesAtEntry:
                 for location, mobile in self.mobilesAtEntry.items():
-                    x,y = location
                     assert isinstance(mobile, Mobile)
-                    mobile.setLocation(self, location)
-                    self.cellAt(x,y).addThing(mobile)
+                    self.placeMobile(mobile, location)
                     result.append(mobile)
-            return result
+        return result
+    def wakeDormantMobiles(self):
+        """Returns the list of dormant mobiles, which are no longer dormant."""
+        result = self.dormantMobiles
+        self.dormantMobiles = []
+        return result
     def gridData(self):
         """Returns an exploranetworking.GridData of the information in the
-        room."""
+        room. This is kept from one call to the next and only the cells that
+        have changed are rebuilt (see Grid.toGridData())."""
         return self.grid.toGridData()
+    def gridDataVersion(self):
+        """Returns a number that changes whenever anything in the room's
+        gridData() does."""
+        return self.grid.version
+    def addResident(self, mobile):
+        """Mobile.setLocation() calls this when a mobile (or player) arrives in the room,
+        after setting its position."""
+        if mobile.isPlayer():
+            self.residentPlayers[mobile] = None
+        else:
+            self.residentMobiles[mobile] = None
+        self.mobileIndex.add(mobile, mobile.position)
+    def removeResident(self, mobile):
+        """Call this when a mobile (or player) leaves the room or is removed from the game,
+        before changing its position."""
+        if mobile.isPlayer():
+            del self.residentPlayers[mobile]
+        else:
+            del self.residentMobiles[mobile]
+        self.mobileIndex.remove(mobile, mobile.position)
+    def mobilesInRect(self, x0, y0, x1, y1):
+        """Returns a list of the mobiles (including players) with x0 <= x <= x1 and
+        y0 <= y <= y1."""
+        return self.mobileIndex.inRect(x0, y0, x1, y1)
+    def mobilesWithinRadius(self, x, y, radius):
+        """Returns a list of the mobiles (including players) no more than radius cells
+        from (x,y), measured in a straight line."""
+        return self.mobileIndex.withinRadius(x, y, radius)
     def getPlayers(self):
-        """Returns a list of the players in the room. This could be made more
-        efficient if we need to for performance reasons, which is the main
-        reason it gets its own method."""
-        result = []
+        """Returns a list of the players in the room."""
+        return list(self.residentPlayers)
+    def getMobiles(self):
+        """Returns a list of the mobiles (not players) in the room."""
+        return list(self.residentMobiles)
+    def checkResidents(self):
+        """Raises AssertionError if the resident players and mobiles (or their
+        positions in the mobileIndex) aren't the same as what is found by scanning
+        every cell. Meant for tests and debugging."""
+        players = set()
+        mobiles = set()
         for y in range(self.grid.height):
             for x in range(self.grid.width):
                 cell = self.grid.cellAt(x, y)
                 for thing in cell.things:
-                    if isinstance(thing, Mobile) and thing.isPlayer():
-                        result.append(thing)
-        return result
-
-
+                    if isinstance(thing, Mobile):
+                        assert thing.room is self and thing.position == (x, y)
+                        if thing.isPlayer():
+                            players.add(thing)
+                        else:
+                            mobiles.add(thing)
+        assert set(self.residentPlayers) == players
+        assert set(self.residentMobiles) == mobiles
+        assert self.mobileIndex.positions() == {mobile: mobile.position for mobile in players | mobiles}
@@ -0,0 +1,90 @@
+#
+# Unit tests for gamecomponents using the pytest library
+#
+
+import pygame
+pygame.init()
+import rooms
+import objects
+from gamecomponents import Room, LayeredGrid
+from mobile import Mobile
+from brain import RandomBrain
+from screenchanges import ScreenChanges
+
+
+def test_countsMatchTheRooms():
+    for room in rooms.rooms:
+        room.grid.checkCounts()
+
+
+def test_countsFollowAddAndRemove():
+    room = Room([[objects.Dirt(), objects.BrickWall()], [objects.Dirt(), objects.Dirt()]])
+    assert not room.grid.isPassable(1, 0)
+    assert room.grid.isPassable(0, 0)
+    bee = Mobile(objects.defaultRegion, 'angry-bee', "bee", 10, 0, RandomBrain)
+    room.placeMobile(bee, (0, 0))
+    assert room.grid.isOccupied(0, 0)
+    assert not room.cellAt(0, 0).canEnter(None)
+    room.grid.checkCounts()
+    bee.moveSouth(0, None, ScreenChanges())
+    assert (room.grid.isOccupied(0, 0), room.grid.isOccupied(0, 1)) == (False, True)
+    assert room.cellAt(0, 0).canEnter(None)
+    room.grid.checkCounts()
+
+
+def test_roomFindsNearbyMobiles():
+    room = Room([[objects.Dirt()] * 10 for y in range(10)])
+    bees = []
+    for position in [(0, 0), (3, 4), (9, 9)]:
+        bee = Mobile(objects.defaultRegion, 'angry-bee', "bee", 10, 0, RandomBrain)
+        room.placeMobile(bee, position)
+        bees.append(bee)
+    assert set(room.mobilesWithinRadius(0, 0, 5)) == {bees[0], bees[1]}
+    bees[1].moveEast(0, None, ScreenChanges())
+    assert room.mobilesWithinRadius(0, 0, 5) == [bees[0]]
+    assert set(room.mobilesInRect(4, 4, 9, 9)) == {bees[1], bees[2]}
+    room.checkResidents()
+
+
+def test_gridDataIsPatchedAsCellsChange():
+    dirt = objects.Dirt()
+    room = Room([[dirt] * 3 for y in range(2)])
+    gridData = room.gridData()
+    version = room.gridDataVersion()
+    assert room.gridData() is gridData and room.gridDataVersion() == version
+    bee = Mobile(objects.defaultRegion, 'angry-bee', "bee", 10, 0, RandomBrain)
+    room.placeMobile(bee, (0, 0))
+    bee.moveEast(0, None, ScreenChanges())
+    assert room.gridDataVersion() != version
+    assert room.gridData() is gridData
+    assert gridData.toJSON() == [[dirt.tileId, [dirt.tileId, bee.tileId], dirt.tileId], [dirt.tileId] * 3]
+
+
+def makeRoomPair():
+    """Returns the same 6x5 room twice, once with a Grid and once with a LayeredGrid."""
+    dirt = objects.Dirt()
+    wall = objects.BrickWall()
+    background = [[wall] * 6] + [[wall] + [dirt] * 4 + [wall] for y in range(3)] + [[wall] * 6]
+    items = {(2, 2): objects.Sword()}
+    return Room(background, items), Room(background, items, gridClass=LayeredGrid)
+
+
+def test_layeredGridBehavesLikeGrid():
+    rooms = makeRoomPair()
+    screenChanges = ScreenChanges()
+    assert rooms[1].gridData().toJSON() == rooms[0].gridData().toJSON()
+    bees = []
+    for room in rooms:
+        bee = Mobile(objects.defaultRegion, 'angry-bee', "bee", 10, 0, RandomBrain)
+        room.placeMobile(bee, (1, 1))
+        bees.append(bee)
+    for move in ["moveEast", "moveSouth", "moveNorth", "moveNorth", "moveWest", "moveSouth", "moveSouth"]:
+        for bee in bees:
+            getattr(bee, move)(0, None, screenChanges)
+        assert rooms[1].gridData().toJSON() == rooms[0].gridData().toJSON()
+        assert bees[1].position == bees[0].position
+    for room in rooms:
+        room.grid.checkCounts()
+        room.checkResidents()
+    # Only the cells with more than their background are kept.
+    assert sorted(rooms[1].grid.promotedCells) == [2 + 2 * 6, bees[1].position[0] + bees[1].position[1] * 6]
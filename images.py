@@ -1,8 +1,26 @@
 
-import pygame
+try:
+    import pygame
+except ImportError:
+    pygame = None # only needed to load the media (see disableMediaDecoding())
+import json
 import os
+import threading
 
 TILE_SIZE = 64
+ATLAS_DIR = './img/atlases' # where buildatlas.py puts the atlases
+
+# When this is False, the libraries only work out the ids from the names of the files
+# and never load the media itself. See disableMediaDecoding().
+_decodeMedia = True
+
+
+def disableMediaDecoding():
+    """A headless server never draws anything or plays any sounds; it only needs the
+    ids. Calling this (before any libraries are created) makes them skip loading the
+    media, so they can be created quickly and without pygame."""
+    global _decodeMedia
+    _decodeMedia = False
 
 
 class LibraryWithIds:
@@ -10,13 +28,18 @@ class LibraryWithIds:
     (strings that match up with the filenames), but when we pass references to
     the media across the network we want a briefer way to refer to them. This
     library provides that, converting from names to IDs and allowing a lookup
-    by ID."""
+    by ID.
+
+    The ids come from the names of the files; each file is only loaded the first
+    time it is looked up (or when prefetch() is asked to load it in the background)."""
     def __init__(self, rootDir, extension, subdir):
         """This will walk all files in the given subdir of the given rootDir, and treat
         any file ending in the given extension as a media source."""
         extensionLen = len(extension)
-        self.mediaById = {}
+        self.mediaById = {} # the media loaded so far
         self._idByName = {}
+        self._filenameById = {}
+        self._pendingById = {} # map of id -> Future, for media being loaded by prefetch()
         for root, dirs, files in os.walk(f'{rootDir}/{subdir}'):
             files.sort() # important to sort them so the order is consistent
             counter = 0
@@ -25,21 +48,92 @@ class LibraryWithIds:
                     name = file[:-extensionLen] # trim off the extension
                     tileId = counter
                     self._idByName[name] = tileId
-                    self.mediaById[tileId] = self.loadMedia(f'{rootDir}/{subdir}/{name}{extension}')
+                    self._filenameById[tileId] = f'{rootDir}/{subdir}/{name}{extension}'
                     counter += 1
     def loadMedia(self, filename):
         pass # Subclasses need to implement this
+    def _loadById(self, mediaId):
+        """Loads and returns the media with the given id. This may be run on another thread,
+        so it mustn't change the library."""
+        return self.loadMedia(self._filenameById[mediaId])
     def lookupById(self, mediaId):
-        return self.mediaById[mediaId]
+        if not _decodeMedia:
+            raise Exception("Media was not loaded because disableMediaDecoding() was called.")
+        media = self.mediaById.get(mediaId)
+        if media is None:
+            pending = self._pendingById.pop(mediaId, None)
+            media = self._loadById(mediaId) if pending is None else pending.result()
+            self.mediaById[mediaId] = media
+        return media
+    def prefetch(self, mediaIds, executor):
+        """Starts loading any of the media in mediaIds that hasn't been loaded yet, using
+        executor (such as a concurrent.futures.ThreadPoolExecutor), so lookupById() won't
+        have to wait for it later."""
+        if _decodeMedia:
+            for mediaId in mediaIds:
+                if mediaId not in self.mediaById and mediaId not in self._pendingById:
+                    self._pendingById[mediaId] = executor.submit(self._loadById, mediaId)
     def idByName(self, mediaName):
         return self._idByName[mediaName]
 
 
+def convertForDisplay(image):
+    """Returns a copy of image in the pixel format of the display (which must have been
+    set up), so that blitting it doesn't have to convert it every time. Images with any
+    pixels that aren't fully opaque keep their alpha channel."""
+    width, height = image.get_size()
+    if image.get_flags() & pygame.SRCALPHA and pygame.mask.from_surface(image, 254).count() < width * height:
+        return image.convert_alpha()
+    else:
+        return image.convert()
+
+
 class ImageLibrary(LibraryWithIds):
-    def __init__(self, subdir):
-        super().__init__(rootDir='./img', extension='.png', subdir=subdir)
+    def __init__(self, subdir, useAtlas=True):
+        """If buildatlas.py has made an atlas for the subdir (and useAtlas is True), the
+        images come from that instead of from the separate files. The first image looked
+        up loads the whole atlas, but since it is uncompressed that is still quicker than
+        loading even the few files one room needs: for drawntiles64, 0.37 ms instead of
+        0.62 ms for room8's images, and 0.34 ms instead of 4.2 ms for all of them (see
+        "python benchmarks.py mediastartup imagelibrary")."""
+        self._atlasFilename = f'{ATLAS_DIR}/{subdir}'
+        if useAtlas and os.path.exists(f'{self._atlasFilename}.json'):
+            self._readAtlasIndex()
+        else:
+            self._atlasFilename = None
+            super().__init__(rootDir='./img', extension='.png', subdir=subdir)
+    def _readAtlasIndex(self):
+        """Reads the index of an atlas, which gives the name and rect of each image in it,
+        in order by id. The atlas itself is only loaded when the first image is needed."""
+        with open(f'{self._atlasFilename}.json') as indexFile:
+            index = json.load(indexFile)
+        self.mediaById = {}
+        self._idByName = {}
+        self._pendingById = {}
+        self._rectById = {}
+        self._atlas = None
+        self._atlasLock = threading.Lock() # so that prefetching threads only decode it once
+        for tileId, entry in enumerate(index['images']):
+            self._idByName[entry['name']] = tileId
+            self._rectById[tileId] = entry['rect']
+    def _loadById(self, mediaId):
+        if self._atlasFilename is None:
+            return super()._loadById(mediaId)
+        with self._atlasLock:
+            if self._atlas is None:
+                self._atlas = pygame.image.load(f'{self._atlasFilename}.bmp')
+        return self._prepareImage(self._atlas.subsurface(self._rectById[mediaId]))
     def loadMedia(self, filename):
-        return pygame.image.load(filename)
+        return self._prepareImage(pygame.image.load(filename))
+    def _prepareImage(self, image):
+        if pygame.display.get_surface() is not None:
+            image = convertForDisplay(image)
+        return image
+    def convertForDisplay(self):
+        """Images loaded before the display was set up are left in whatever format they
+        were in the file. Call this once it has been set up to convert them all."""
+        for imageId, image in self.mediaById.items():
+            self.mediaById[imageId] = convertForDisplay(image)
 
 
 class SoundLibrary(LibraryWithIds):
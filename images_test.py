@@ -0,0 +1,56 @@
+#
+# Unit tests for images using the pytest library
+#
+
+import pygame
+pygame.init()
+from concurrent.futures import ThreadPoolExecutor
+import images
+from images import ImageLibrary, SoundLibrary, TILE_SIZE
+
+
+def test_idsAreTheSameWithoutDecoding():
+    decodedImages = ImageLibrary('drawntiles64')
+    decodedSounds = SoundLibrary('foundassets/freesound.org')
+    images.disableMediaDecoding()
+    try:
+        listedImages = ImageLibrary('drawntiles64')
+        listedSounds = SoundLibrary('foundassets/freesound.org')
+    finally:
+        images._decodeMedia = True
+    assert listedImages._idByName == decodedImages._idByName
+    assert listedSounds._idByName == decodedSounds._idByName
+    assert listedImages.mediaById == {}
+
+
+def test_atlasMatchesTheFiles():
+    fromAtlas = ImageLibrary('drawntiles64')
+    fromFiles = ImageLibrary('drawntiles64', useAtlas=False)
+    assert fromAtlas._idByName == fromFiles._idByName # if not, rerun buildatlas.py
+    for imageId in fromFiles._idByName.values():
+        image = fromFiles.lookupById(imageId)
+        atlasImage = fromAtlas.lookupById(imageId)
+        assert atlasImage.get_size() == image.get_size()
+        assert pygame.image.tobytes(atlasImage, 'RGBA') == pygame.image.tobytes(image, 'RGBA')
+
+
+def test_mediaIsLoadedWhenFirstNeeded():
+    for useAtlas in [True, False]:
+        library = ImageLibrary('drawntiles64', useAtlas)
+        assert library.mediaById == {}
+        imageId = library.idByName('dirt-1')
+        image = library.lookupById(imageId)
+        assert library.lookupById(imageId) is image
+        assert list(library.mediaById) == [imageId]
+
+
+def test_prefetch():
+    for useAtlas in [True, False]:
+        library = ImageLibrary('drawntiles64', useAtlas)
+        imageIds = [library.idByName('dirt-1'), library.idByName('wall-1')]
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            library.prefetch(imageIds, executor)
+            assert set(library._pendingById) == set(imageIds)
+            images = [library.lookupById(imageId) for imageId in imageIds]
+        assert library._pendingById == {}
+        assert [image.get_size() for image in images] == [(TILE_SIZE, TILE_SIZE)] * 2
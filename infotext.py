@@ -4,7 +4,10 @@
 # user dismisses it.
 #
 
-import pygame
+try:
+    import pygame
+except ImportError:
+    pygame = None # only InfoTextPainter needs it
 
 
 
@@ -40,6 +43,7 @@ class InfoTextPainter:
         self.defaultFont = pygame.font.SysFont(MESSAGE_FONT, MESSAGE_FONT_SIZE)
 
     def paintInfoText(self, surface, infoText):
+        """Paints the infoText in the middle of the surface. Returns the rect it covered."""
         assert isinstance(infoText, InfoText)
 
         # -- render each line in the proper font --
@@ -63,3 +67,5 @@ class InfoTextPainter:
         for renderedLine in renderedLines:
             surface.blit(renderedLine, (textRect.left, linePositionY))
             linePositionY += lineHeight
+
+        return backgroundRect
@@ -28,7 +28,7 @@ class Crosshair:
     def drawAt(self, surface, xy):
         """Draw the crosshair centered at the given xy = (x,y) location."""
         if self.image is None:
-            self.image = pygame.image.load(f"./img/special/{self.specialImageName}.png")
+            self.image = pygame.image.load(f"./img/special/{self.specialImageName}.png").convert_alpha()
         x, y = xy
         surface.blit(self.image, (x - HALF_CROSSHAIR_SIZE, y - HALF_CROSSHAIR_SIZE))
 pointer = Crosshair("crosshair")
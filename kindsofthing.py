@@ -7,6 +7,7 @@ from infotext import InfoText
 
 class Thing:
     """Represents any kind of thing in the world."""
+    __slots__ = ('tileId', 'displayName')
     def __init__(self, region, tileName, displayName):
         assert isinstance(region, Region)
         assert isinstance(tileName, str)
@@ -27,12 +28,14 @@ class Thing:
 
 class Wall(Thing):
     """A thing that the player cannot enter."""
+    __slots__ = ()
     def canEnter(self, mobile):
         return False
 
 
 class Door(Thing):
     """A thing that teleports you to a new location when you enter."""
+    __slots__ = ('destination', 'soundEffectId')
     def __init__(self, region, tileName, displayName, destination, soundEffectName=None):
         super().__init__(region, tileName, displayName)
         self.destination = destination
@@ -44,6 +47,7 @@ class Door(Thing):
 
 class Sign(Thing):
     """A thing that displays a message when you enter it."""
+    __slots__ = ('infoText',)
     def __init__(self, region, tileName, displayName, text):
         """Create a new sign with the string messageText."""
         super().__init__(region, tileName, displayName)
@@ -54,12 +58,14 @@ class Sign(Thing):
 
 class Trap(Thing):
     """A thing that makes you take damage"""
+    __slots__ = ()
     def doEnter(self, mobile, world, screenChanges):
         mobile.takeDamage(1, screenChanges)
         
 
 class Item(Thing):
     """A parent class for any Thing that can be put in an inventory."""
+    __slots__ = ()
     def uniqueId(self):
         """All Items have a unique ID used to identify them when managing inventory
         remotely on the client."""
@@ -74,6 +80,7 @@ class Item(Thing):
 
 
 class Weapon(Item):
+    __slots__ = ('damage', 'hitSoundEffectId')
     def __init__(self, region, tileName, displayName, damage, hitSoundEffectName):
         super().__init__(region, tileName, displayName)
         self.damage = damage
@@ -87,6 +94,7 @@ class Weapon(Item):
 
 
 class Wand(Item):
+    __slots__ = ('manaCost', 'spell')
     def __init__(self, region, displayName, manaCost, spell, tileName="wand"):
         super().__init__(region, tileName, displayName)
         self.manaCost = manaCost
@@ -107,6 +115,7 @@ class Wand(Item):
 
 class SelfOnlyWand(Wand):
     """A wand with a spell that affects the caster. No aiming needed."""
+    __slots__ = ()
     def __init__(self, region, displayName, manaCost, spell, tileName="wand"):
         assert isinstance(spell, SingleTargetSpell)
         super().__init__(region, displayName, manaCost, spell, tileName)
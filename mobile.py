@@ -2,6 +2,7 @@ from kindsofthing import Thing, Item, Weapon, Wand
 
 
 class Stats:
+    __slots__ = ('health', 'maxHealth', 'mana', 'maxMana', 'speed')
     def __init__(self, health=0, maxHealth=0, mana=0, maxMana=0, speed=0):
         """Create a new Stats, with all stats set to 0."""
         self.health = health
@@ -98,6 +99,7 @@ class Inventory:
 
 
 class Mobile(Thing):
+    __slots__ = ('whenItCanAct', 'isDead', 'inventory', 'stats', 'brain', 'room', 'position')
     def __init__(self, region, tileName, displayName, maxHealth, maxMana, brainType, inventory=()):
         super().__init__(region, tileName, displayName)
         self.whenItCanAct = 0
@@ -107,6 +109,8 @@ class Mobile(Thing):
                            mana=maxMana, maxMana=maxMana,
                            speed=5)
         self.brain = brainType()
+        self.room = None
+        self.position = None
     def canEnter(self, mobile):
         return False
 
@@ -136,8 +140,16 @@ class Mobile(Thing):
         return self.inventory.getWieldedWand()
     def setLocation(self, room, position):
         """This sets the location of a player to a specific grid and (x,y) coordinate."""
-        self.room = room
-        self.position = position
+        if room is not self.room:
+            if self.room is not None:
+                self.room.removeResident(self)
+            self.room = room
+            self.position = position
+            room.addResident(self)
+        else:
+            oldPosition = self.position
+            self.position = position
+            room.mobileIndex.move(self, oldPosition, position)
     def moveSouth(self, currentTime, world, screenChanges):
         # -- find the new location --
         oldX, oldY = self.position
@@ -152,6 +164,7 @@ class Mobile(Thing):
         if newCell.canEnter(self):
             # -- update my position and the cell --
             self.position = (newX, newY)
+            self.room.mobileIndex.move(self, (oldX, oldY), self.position)
             oldCell.removeThing(self)
             newCell.addThing(self)
             screenChanges.changeTwoCells(self.room, oldX, oldY, newX, newY)
@@ -174,6 +187,7 @@ class Mobile(Thing):
         if newCell.canEnter(self):
             # -- update my position and the cell --
             self.position = (newX, newY)
+            self.room.mobileIndex.move(self, (oldX, oldY), self.position)
             oldCell.removeThing(self)
             newCell.addThing(self)
             screenChanges.changeTwoCells(self.room, oldX, oldY, newX, newY)
@@ -196,6 +210,7 @@ class Mobile(Thing):
         if newCell.canEnter(self):
             # -- update my position and the cell --
             self.position = (newX, newY)
+            self.room.mobileIndex.move(self, (oldX, oldY), self.position)
             oldCell.removeThing(self)
             newCell.addThing(self)
             screenChanges.changeTwoCells(self.room, oldX, oldY, newX, newY)
@@ -218,6 +233,7 @@ class Mobile(Thing):
         if newCell.canEnter(self):
             # -- update my position and the cell --
             self.position = (newX, newY)
+            self.room.mobileIndex.move(self, (oldX, oldY), self.position)
             oldCell.removeThing(self)
             newCell.addThing(self)
             screenChanges.changeTwoCells(self.room, oldX, oldY, newX, newY)
@@ -230,10 +246,11 @@ class Mobile(Thing):
     def goToLocation(self, location, world, screenChanges):
         """Calling this makes the player move from it's current location to
         the new location specified."""
-        oldCell = self.room.cellAt(self.position[0], self.position[1])
+        oldX, oldY = self.position
+        oldCell = self.room.cellAt(oldX, oldY)
         oldCell.removeThing(self)
-        self.room = world.rooms[location.roomNumber]
-        self.position = location.coordinates
+        screenChanges.changeCell(self.room, oldX, oldY)
+        self.setLocation(world.rooms[location.roomNumber], location.coordinates)
         x,y = location.coordinates
         newCell = self.room.cellAt(x, y)
         newCell.addThing(self)
@@ -246,6 +263,7 @@ class Mobile(Thing):
         self.stats.health = self.stats.health-amount
         if self.stats.health < 1:
             self.isDead = True
+            screenChanges.mobileDied(self)
             screenChanges.addConsoleTextForRoom( self.room, f"{self.displayName} was killed.")
 
     def receiveItem(self, item):
@@ -297,7 +315,7 @@ class Mobile(Thing):
             # item wasn't removable from inventory. Do nothing
             return False
         else:
-            self.room.cellAt(self.position[0], self.position[1]).things.append(item)
+            self.room.cellAt(self.position[0], self.position[1]).addThing(item)
             screenChanges.changeCell(self.room, self.position[0], self.position[1])
             return True
     def isPlayer(self):
@@ -7,39 +7,48 @@ from spells import HealingSpell, TeleportSpell
 defaultRegion = Region()
 
 class BrickWall(Wall):
+    __slots__ = ()
     def __init__(self):
         super().__init__(defaultRegion, 'wall-1', "brick wall")
 
 class InnerSecretDoor(Thing):
+    __slots__ = ()
     def __init__(self):
         super().__init__(defaultRegion, 'wall-1', "secret door")
 
 class Dirt(Thing):
+    __slots__ = ()
     def __init__(self):
         super().__init__(defaultRegion, 'grey_tile', "dirt")
 
 class Grass(Thing):
+    __slots__ = ()
     def __init__(self):
         super().__init__(defaultRegion, 'grassBlock', "grass")
 
 class StairsDown(Door):
+    __slots__ = ()
     def __init__(self, destination):
         super().__init__(defaultRegion, 'stairs-down', "stairs", destination)
 
 class Chest(Thing):
+    __slots__ = ()
     def __init__(self):
         super().__init__(defaultRegion, 'chest2', "chest")
 
 class Tree(Thing):
+    __slots__ = ()
     def __init__(self):
         super().__init__(defaultRegion, 'Tree', "tree")
 
 class WoodenDoor(Door):
+    __slots__ = ()
     def __init__(self, destination):
         super().__init__(defaultRegion, 'doorway-1', "wooden door", destination,
                          soundEffectName="364922__mattix__door-opened")
 
 class InnerDoor(Thing):
+    __slots__ = ('soundEffectId',)
     def __init__(self):
         super().__init__(defaultRegion, 'doorway-1', "door")
         self.soundEffectId = defaultRegion.soundLibrary.idByName(
@@ -49,14 +58,17 @@ class InnerDoor(Thing):
         screenChanges.roomPlaySound(mobile.room, self.soundEffectId)
 
 class PublicSign(Sign):
+    __slots__ = ()
     def __init__(self, messageText):
         super().__init__(defaultRegion, "sign", "sign", messageText)
 
 class GiantBee(Mobile):
+    __slots__ = ()
     def __init__(self):
         super().__init__(defaultRegion, 'angry-bee', "giant bee", 11, 1, RandomBrain, inventory=[Sting(), BluePotion()])
         
 class MouseMan(Mobile):
+    __slots__ = ()
     def __init__(self):
         super().__init__(defaultRegion, 'mouseman', "mouse man",
                          maxHealth=3,
@@ -65,39 +77,47 @@ class MouseMan(Mobile):
                          inventory=[Bite()])
 
 class SnakeTrap(Trap):
+    __slots__ = ()
     def __init__(self):
         super().__init__(defaultRegion, 'green-snake', "snake trap")
 
 class BluePotion(Item):
+    __slots__ = ()
     def __init__(self):
         super().__init__(defaultRegion, "potion-blue", "potion of ____")
 
 class Sword(Weapon):
+    __slots__ = ()
     def __init__(self):
         super().__init__(defaultRegion, "sword", "sword", 3,
                          "348112__mattix__crunch")
 
 class Spear(Weapon):
+    __slots__ = ()
     def __init__(self):
         super().__init__(defaultRegion, "spear", "spear", 2,
                          "348112__mattix__crunch")
 
 class Bite(Weapon):
+    __slots__ = ()
     def __init__(self):
         super().__init__(defaultRegion, "transparent", "teeth", 2,
                          "348112__mattix__crunch")
 
 class ViciousHorns(Weapon):
+    __slots__ = ()
     def __init__(self):
         super().__init__(defaultRegion, "transparent", "vicious horns", 1,
                          "348112__mattix__crunch")
 
 class FuzzAttack(Weapon):
+    __slots__ = ()
     def __init__(self):
         super().__init__(defaultRegion, "transparent", "fuzz ball fangs", .5,
                          "348112__mattix__crunch")
 
 class Minotar(Mobile):
+    __slots__ = ()
     def __init__(self, extraInventory=[]):
         super().__init__(defaultRegion, "minotaur", "fuming minotaur",
                          maxHealth=12,
@@ -107,6 +127,7 @@ class Minotar(Mobile):
         self.stats.speed = 3
 
 class RedFuzzball(Mobile):
+    __slots__ = ()
     def __init__(self, extraInventory=[]):
         super().__init__(defaultRegion, "redFuzzball", "Cherry Fuzz",
                          maxHealth=3,
@@ -116,6 +137,7 @@ class RedFuzzball(Mobile):
         self.stats.speed = 1
 
 class OrangeFuzzball(Mobile):
+    __slots__ = ()
     def __init__(self, extraInventory=[]):
         super().__init__(defaultRegion, "orangeFuzzball","Orange Fuzz",
                             maxHealth=3,
@@ -126,6 +148,7 @@ class OrangeFuzzball(Mobile):
 
 
 class GreenFuzzball(Mobile):
+    __slots__ = ()
     def __init__(self, extraInventory=[]):
         super().__init__(defaultRegion, "greenFuzzball", "Mint Fuzz",
                             maxHealth=3,
@@ -135,6 +158,7 @@ class GreenFuzzball(Mobile):
         self.stats.speed = 1
 
 class BleuFuzzball(Mobile):
+    __slots__ = ()
     def __init__(self, extraInventory=[]):
         super().__init__(defaultRegion, "bleuFuzzball", "Blueberry Fuzz",
                             maxHealth=3,
@@ -144,6 +168,7 @@ class BleuFuzzball(Mobile):
         self.stats.speed = 1
 
 class BlueFuzzball(Mobile):
+    __slots__ = ()
     def __init__(self, extraInventory=[]):
         super().__init__(defaultRegion, "blueFuzzball", "Bluebear Fuzz",
                             maxHealth=3,
@@ -153,21 +178,25 @@ class BlueFuzzball(Mobile):
         self.stats.speed = 1
 
 class Sting(Weapon):
+    __slots__ = ()
     def __init__(self):
         super().__init__(defaultRegion, "transparent", "bee stinger", 3,
                          "365658__mattix__bird-thrush-nightingale-01")
 
 class Witch(Mobile):
+    __slots__ = ()
     def __init__(self):
         super().__init__(defaultRegion, "witch", "The Wicked Witch of the Feast", maxHealth=8, maxMana=19, brainType=RandomBrain)
 
 
 class HealingWand(SelfOnlyWand):
+    __slots__ = ()
     def __init__(self):
         super().__init__(defaultRegion, "Medicinal wand", manaCost=6,
                          spell=HealingSpell(defaultRegion, healthHealed=4))
 
 class TeleportWand(SelfOnlyWand):
+    __slots__ = ()
     def __init__(self, destination):
         super().__init__(defaultRegion, "Wand of teleportation", manaCost=8,
                          spell=TeleportSpell(defaultRegion, destination))
@@ -10,6 +10,7 @@ from brain import PlayerBrain
 
 
 class Player(Mobile):
+    __slots__ = ('queuedEvent', 'playerId', 'clientConnections', 'displayed')
     def __init__(self, region, tileName, health, maxMana, playerId):
         super().__init__(region, tileName,"person", health, maxMana, brainType=PlayerBrain)
         self.queuedEvent = None
@@ -23,6 +24,7 @@ class Player(Mobile):
         super().goToLocation(location, world, screenChanges)
         if self.room != oldRoom:
             screenChanges.playerSwitchedRooms(self, oldRoom, self.room)
+            world.playerEnteredRoom(self.room)
             newMobiles = self.room.playerEntersRoom()
             if newMobiles:
                 world.addMobiles(newMobiles)
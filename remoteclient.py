@@ -20,12 +20,13 @@ from infotext import InfoText
 
 SERVER_ADDRESS = ("127.0.0.1", 12000)
 PLAYER_ID = "0"
+CODEC_NAME = "binary" # switch to "json" to make the traffic readable when debugging
 
 class RemoteClient():
     def __init__(self, playerId):
         print(f'Test Client')
         self.playerId = playerId
-        self.clientsideConnection = ClientsideConnection(SERVER_ADDRESS, playerId)
+        self.clientsideConnection = ClientsideConnection(SERVER_ADDRESS, playerId, CODEC_NAME)
 
     def mainLoop(self):
         display = None
@@ -60,9 +61,8 @@ class RemoteClient():
                     else:
                         raise Exception(f"pygame event type {pygameEvent.type} not supported")
 
-            # --- Read a message ---
-            message = self.clientsideConnection.receiveOneMessage()
-            if message:
+            # --- Read every waiting message, so the frame we draw is up to date ---
+            for message in self.clientsideConnection.receiveMessages():
                 if isinstance(message, WelcomeClientMessage):
                     currentGridData = message.gridData
                     if display is None:
@@ -70,11 +70,13 @@ class RemoteClient():
                         defaultRegion = images.Region()
                         imageLibrary = defaultRegion.imageLibrary
                         soundLibrary = defaultRegion.soundLibrary
-                    display.uiState.newRoom(currentGridData)
+                    display.newRoom(currentGridData)
+                    display.prefetchImagesFor(currentGridData, imageLibrary)
                     display.setDisplayedPlayerId(self.playerId)
                 elif isinstance(message, NewRoomMessage):
                     currentGridData = message.gridData
-                    display.uiState.newRoom(currentGridData)
+                    display.newRoom(currentGridData)
+                    display.prefetchImagesFor(currentGridData, imageLibrary)
                 elif isinstance(message, RefreshRoomMessage):
                     currentGridData = message.gridData
                 elif isinstance(message, UpdateRoomMessage):
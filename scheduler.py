@@ -0,0 +1,81 @@
+#
+# Decides when the server's main loop should update the world and when it should
+# draw, so that it can sleep the rest of the time.
+#
+
+import time
+
+
+class TickScheduler:
+    """Keeps track of two schedules: simulation ticks, which happen on a fixed grid of
+    ticksPerSecond, and frames (drawing the local display), which happen at most
+    framesPerSecond. A tick is only run when something is due to happen, so when the
+    world is idle the loop can sleep until timeToWake(). Ticks that take longer than a
+    tick's length are counted as overruns.
+
+    All times are in seconds as returned by the clock (time.perf_counter by default)."""
+
+    def __init__(self, ticksPerSecond, framesPerSecond=None, clock=time.perf_counter):
+        """framesPerSecond may be None if there is no local display to draw."""
+        self.tickLength = 1 / ticksPerSecond
+        self.frameLength = None if framesPerSecond is None else 1 / framesPerSecond
+        self.clock = clock
+        startTime = clock()
+        self.timeOfNextTick = startTime
+        self.timeOfNextFrame = startTime
+        self.numTicks = 0
+        self.numOverruns = 0
+        self.worstTickTime = 0.0
+        self.timeOfLastOverrunReport = startTime
+
+    def isTickDue(self, currentTime, timeOfNextAction):
+        """Returns True if a tick should run now. timeOfNextAction is the earliest time that
+        anything in the world needs to happen (or None if nothing is waiting)."""
+        return (currentTime >= self.timeOfNextTick and
+                timeOfNextAction is not None and currentTime >= timeOfNextAction)
+
+    def tickDone(self, startTime, endTime):
+        """Call this after each tick, passing the times it started and finished."""
+        self.numTicks += 1
+        tickTime = endTime - startTime
+        self.worstTickTime = max(self.worstTickTime, tickTime)
+        if tickTime > self.tickLength:
+            self.numOverruns += 1
+            if endTime - self.timeOfLastOverrunReport >= 1.0:
+                print(f"Tick overran: took {tickTime * 1000:.1f} ms of {self.tickLength * 1000:.1f} ms "
+                      f"({self.numOverruns} of {self.numTicks} ticks have overrun).")
+                self.timeOfLastOverrunReport = endTime
+        self.timeOfNextTick = self._nextOnGrid(self.timeOfNextTick, self.tickLength, endTime)
+
+    def isFrameDue(self, currentTime):
+        return self.frameLength is not None and currentTime >= self.timeOfNextFrame
+
+    def frameDone(self, endTime):
+        """Call this after drawing each frame."""
+        self.timeOfNextFrame = self._nextOnGrid(self.timeOfNextFrame, self.frameLength, endTime)
+
+    def timeToWake(self, timeOfNextAction):
+        """Returns the time at which the loop should next wake up (unless a packet
+        arrives first). timeOfNextAction is as for isTickDue()."""
+        wakeTimes = []
+        if timeOfNextAction is not None:
+            wakeTimes.append(max(timeOfNextAction, self.timeOfNextTick))
+        if self.frameLength is not None:
+            wakeTimes.append(self.timeOfNextFrame)
+        if not wakeTimes:
+            # Nothing at all is scheduled, so only a packet can give us something to do. We still
+            # wake now and then, which costs almost nothing.
+            return self.clock() + 1.0
+        return min(wakeTimes)
+
+    def summary(self):
+        return (f"{self.numTicks} ticks, {self.numOverruns} overran, "
+                f"longest took {self.worstTickTime * 1000:.1f} ms.")
+
+    @staticmethod
+    def _nextOnGrid(previous, length, currentTime):
+        """Returns the first time after currentTime that is a whole number of lengths
+        after previous. Any that were missed are skipped rather than run late."""
+        if currentTime < previous + length:
+            return previous + length
+        return previous + length * (int((currentTime - previous) / length) + 1)
@@ -0,0 +1,54 @@
+#
+# Unit tests for scheduler using the pytest library
+#
+
+from scheduler import TickScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+    def __call__(self):
+        return self.now
+
+
+def test_tickOnlyWhenSomethingIsDue():
+    scheduler = TickScheduler(50, clock=FakeClock())
+    assert not scheduler.isTickDue(100.0, None)
+    assert not scheduler.isTickDue(100.0, 105.0)
+    assert scheduler.isTickDue(100.0, 99.0)
+
+
+def test_ticksStayOnTheGrid():
+    scheduler = TickScheduler(10, clock=FakeClock())
+    scheduler.tickDone(100.0, 100.01)
+    assert scheduler.timeOfNextTick == 100.1
+    assert not scheduler.isTickDue(100.05, 0)
+    assert scheduler.timeToWake(100.0) == 100.1
+    assert scheduler.timeToWake(102.03) == 102.03
+
+
+def test_overrunsSkipMissedTicks():
+    scheduler = TickScheduler(10, clock=FakeClock())
+    scheduler.tickDone(100.0, 100.35)
+    assert scheduler.numOverruns == 1
+    assert abs(scheduler.timeOfNextTick - 100.4) < 1e-9
+    scheduler.tickDone(100.4, 100.42)
+    assert (scheduler.numTicks, scheduler.numOverruns) == (2, 1)
+
+
+def test_frames():
+    clock = FakeClock()
+    scheduler = TickScheduler(50, 20, clock=clock)
+    assert scheduler.isFrameDue(100.0)
+    scheduler.frameDone(100.01)
+    assert not scheduler.isFrameDue(100.04)
+    assert scheduler.timeToWake(None) == 100.05
+    assert scheduler.isFrameDue(100.05)
+
+
+def test_noFramesWhenHeadless():
+    clock = FakeClock()
+    scheduler = TickScheduler(50, clock=clock)
+    assert not scheduler.isFrameDue(1000.0)
+    assert scheduler.timeToWake(None) > clock.now
@@ -22,6 +22,7 @@ class ScreenChanges:
         self.newInfoTexts = defaultdict(list) # map of player -> list of InfoTexts
         self.consoleTextsForAll = list()  # list of messages for any player not a key in playerConsoleTexts
         self.playerConsoleTexts = defaultdict(self.consoleTextsForAll.copy) # map of player -> list of strings
+        self.deadMobiles = {} # the mobiles that died, in order (the values are all None)
     def clear(self):
         """Calling this clears out the full list of changes."""
         self.changesByRoom.clear()
@@ -30,17 +31,22 @@ class ScreenChanges:
         self.newInfoTexts.clear()
         self.consoleTextsForAll.clear()
         self.playerConsoleTexts.clear()
+        self.deadMobiles.clear()
     def changeCell(self, room, x, y):
         """Calling this adds a change to one cell of one room."""
         self.changesByRoom[room].add((x,y))
+        room.cellChanged(x, y)
     def changeTwoCells(self, room, x1, y1, x2, y2):
         """Convenience method to change TWO cells in a room at once."""
         roomChangeSet = self.changesByRoom[room]
         roomChangeSet.add( (x1,y1) )
         roomChangeSet.add( (x2,y2) )
+        room.cellChanged(x1, y1)
+        room.cellChanged(x2, y2)
     def generalRoomChanges(self, room):
         """Call this when various changes may have been made in a room."""
         self.changesByRoom[room] = SetOfEverything()
+        room.allCellsChanged()
     def roomPlaySound(self, room, soundId):
         """Call this when a sound should be played."""
         self.soundsToPlayByRoom[room].append(soundId)
@@ -88,6 +94,12 @@ class ScreenChanges:
     def getConsoleTextsForPlayer(self, player):
         """Returns a list of new console text strings (in order) for the given player."""
         return self.playerConsoleTexts[player]
+    def mobileDied(self, mobile):
+        """Call this when a mobile (or player) dies, so it can be removed from the world."""
+        self.deadMobiles[mobile] = None
+    def getDeadMobiles(self):
+        """Returns a list of the mobiles that have died since clear() was called."""
+        return list(self.deadMobiles)
     def printThemOut(self):
         """Used only for debugging, this dumps to the screen the whole
         list of changes."""
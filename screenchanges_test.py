@@ -17,9 +17,7 @@ def makeRoom(players=None):
         ]
     )
     for player in players:
-        coordinates = (0, 1)
-        player.setLocation(room, coordinates)
-        room.cellAt(*coordinates).addThing(player)
+        room.placeMobile(player, (0, 1))
     return room
 
 
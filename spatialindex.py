@@ -0,0 +1,80 @@
+#
+# An index of where things are in a room, for finding the ones near a spot without
+# looking at every cell.
+#
+
+
+class SpatialHash:
+    """Keeps track of the (x,y) position of some objects (in practice, the mobiles in
+    a room) by putting them into square buckets of bucketSize cells on a side. A query
+    only has to look at the buckets that overlap the area asked about.
+
+    The caller must tell it whenever one of the objects moves."""
+
+    def __init__(self, bucketSize=4):
+        self.bucketSize = bucketSize
+        self.buckets = {} # map of (bucketX, bucketY) -> map of object -> (x,y)
+        self.numObjects = 0
+
+    def __len__(self):
+        return self.numObjects
+
+    def _bucketFor(self, position):
+        return position[0] // self.bucketSize, position[1] // self.bucketSize
+
+    def add(self, thing, position):
+        """Adds thing to the index at position."""
+        bucket = self.buckets.setdefault(self._bucketFor(position), {})
+        assert thing not in bucket
+        bucket[thing] = position
+        self.numObjects += 1
+
+    def remove(self, thing, position):
+        """Removes thing, which must be in the index at position."""
+        bucketKey = self._bucketFor(position)
+        bucket = self.buckets[bucketKey]
+        del bucket[thing]
+        if not bucket:
+            del self.buckets[bucketKey]
+        self.numObjects -= 1
+
+    def move(self, thing, oldPosition, newPosition):
+        """Call this when thing moves from oldPosition to newPosition."""
+        oldBucketKey = self._bucketFor(oldPosition)
+        newBucketKey = self._bucketFor(newPosition)
+        if oldBucketKey == newBucketKey:
+            self.buckets[oldBucketKey][thing] = newPosition
+        else:
+            self.remove(thing, oldPosition)
+            self.add(thing, newPosition)
+
+    def positions(self):
+        """Returns a map of every object in the index -> its (x,y)."""
+        result = {}
+        for bucket in self.buckets.values():
+            result.update(bucket)
+        return result
+
+    def _entriesInRect(self, x0, y0, x1, y1):
+        """Yields (object, (x,y)) for the objects with x0 <= x <= x1 and y0 <= y <= y1."""
+        bucketSize = self.bucketSize
+        for bucketY in range(y0 // bucketSize, y1 // bucketSize + 1):
+            for bucketX in range(x0 // bucketSize, x1 // bucketSize + 1):
+                bucket = self.buckets.get((bucketX, bucketY))
+                if bucket:
+                    for thing, position in bucket.items():
+                        x, y = position
+                        if x0 <= x <= x1 and y0 <= y <= y1:
+                            yield thing, position
+
+    def inRect(self, x0, y0, x1, y1):
+        """Returns a list of the objects with x0 <= x <= x1 and y0 <= y <= y1."""
+        return [thing for thing, position in self._entriesInRect(x0, y0, x1, y1)]
+
+    def withinRadius(self, centerX, centerY, radius):
+        """Returns a list of the objects whose straight-line distance from
+        (centerX, centerY) is no more than radius (which should be an int)."""
+        radiusSquared = radius * radius
+        return [thing for thing, (x, y) in
+                self._entriesInRect(centerX - radius, centerY - radius, centerX + radius, centerY + radius)
+                if (x - centerX) ** 2 + (y - centerY) ** 2 <= radiusSquared]
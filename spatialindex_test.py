@@ -0,0 +1,38 @@
+#
+# Unit tests for spatialindex using the pytest library
+#
+
+import random
+from spatialindex import SpatialHash
+
+
+def test_queriesMatchBruteForce():
+    rng = random.Random(0)
+    index = SpatialHash(bucketSize=3)
+    positions = {}
+    for thing in range(60):
+        positions[thing] = (rng.randrange(20), rng.randrange(20))
+        index.add(thing, positions[thing])
+    for step in range(300):
+        thing = rng.randrange(60)
+        x, y = positions[thing]
+        newPosition = (max(0, min(19, x + rng.choice([-1, 0, 1]))), max(0, min(19, y + rng.choice([-1, 0, 1]))))
+        index.move(thing, positions[thing], newPosition)
+        positions[thing] = newPosition
+        x0, y0 = rng.randrange(20), rng.randrange(20)
+        x1, y1 = x0 + rng.randrange(8), y0 + rng.randrange(8)
+        assert sorted(index.inRect(x0, y0, x1, y1)) == sorted(
+            t for t, (x, y) in positions.items() if x0 <= x <= x1 and y0 <= y <= y1)
+        radius = rng.randrange(6)
+        assert sorted(index.withinRadius(x0, y0, radius)) == sorted(
+            t for t, (x, y) in positions.items() if (x - x0) ** 2 + (y - y0) ** 2 <= radius ** 2)
+    assert index.positions() == positions
+
+
+def test_removeEmptiesBuckets():
+    index = SpatialHash()
+    index.add("a", (5, 5))
+    index.move("a", (5, 5), (9, 9))
+    assert len(index) == 1
+    index.remove("a", (9, 9))
+    assert (len(index), index.buckets) == (0, {})
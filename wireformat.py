@@ -0,0 +1,87 @@
+#
+# Low-level helpers for the compact binary wire format used by exploranetworking.
+# Values are appended to a bytearray when encoding and read back out with a
+# ByteReader when decoding.
+#
+
+import struct
+
+
+_UINT16 = struct.Struct('<H')
+
+
+def writeVarint(buffer, value):
+    """Appends a non-negative integer to the bytearray buffer, 7 bits per byte with
+    the low-order bits first. Every byte except the last has its high bit set, so
+    small numbers (like most tileIds) take a single byte."""
+    assert isinstance(value, int) and value >= 0
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def writeUInt16(buffer, value):
+    """Appends an unsigned 16-bit integer to the bytearray buffer."""
+    buffer.extend(_UINT16.pack(value))
+
+
+def writeString(buffer, text):
+    """Appends a string to the bytearray buffer as a varint length followed by the
+    UTF-8 bytes."""
+    encoded = text.encode('utf-8')
+    writeVarint(buffer, len(encoded))
+    buffer.extend(encoded)
+
+
+class ByteReader:
+    """Reads values written by the write...() functions back out of a bytes object,
+    keeping track of the current position."""
+    def __init__(self, byteStr, position=0):
+        self.byteStr = byteStr
+        self.position = position
+
+    def isAtEnd(self):
+        return self.position >= len(self.byteStr)
+
+    def readByte(self):
+        value = self.byteStr[self.position]
+        self.position += 1
+        return value
+
+    def readVarint(self):
+        result = 0
+        shift = 0
+        while True:
+            byte = self.byteStr[self.position]
+            self.position += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def readUInt16(self):
+        return self.readStruct(_UINT16)[0]
+
+    def readStruct(self, structFormat):
+        """Passed a struct.Struct, this unpacks it at the current position and returns
+        the resulting tuple."""
+        values = structFormat.unpack_from(self.byteStr, self.position)
+        self.position += structFormat.size
+        return values
+
+    def readBytes(self, length):
+        result = self.byteStr[self.position:self.position + length]
+        if len(result) != length:
+            raise ValueError("Ran off the end of the data while reading bytes.")
+        self.position += length
+        return result
+
+    def readString(self):
+        return self.readBytes(self.readVarint()).decode('utf-8')
+
+    def readRest(self):
+        """Returns all the remaining bytes."""
+        result = self.byteStr[self.position:]
+        self.position = len(self.byteStr)
+        return result